@@ -0,0 +1,38 @@
+import os
+import sys
+import importlib.util
+import importlib.machinery
+
+"""
+Jinpeng Zhai
+Put first on the PYTHONPATH of the children of a run by monitor.py
+--children, so that a fresh interpreter starts counting before it runs
+anything, see childtrace.py. The sitecustomize that this one hides, if any,
+is run after it.
+"""
+
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+bootstrap = os.path.dirname(os.path.abspath(__file__))
+
+# the tool's modules are loaded from its own directory, and then taken out of
+# sys.modules, so as not to stand in for any of the target's.
+loaded = set(sys.modules)
+sys.path.insert(0, here)
+try:
+    import childtrace
+
+    childtrace.bootstrap()
+finally:
+    sys.path.remove(here)
+    for name in set(sys.modules) - loaded:
+        filename = getattr(sys.modules[name], "__file__", None) or ""
+        if os.path.dirname(filename) == here:
+            del sys.modules[name]
+
+# this module is still being imported as sitecustomize, so the other one is
+# run without being put in sys.modules.
+if bootstrap in sys.path:
+    sys.path.remove(bootstrap)
+spec = importlib.machinery.PathFinder.find_spec("sitecustomize", sys.path)
+if spec is not None:
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
@@ -0,0 +1,153 @@
+import os
+import json
+import shutil
+import hashlib
+from time import time
+
+"""
+Jinpeng Zhai
+Content addressed cache for the artifacts of the profiling pipelines.
+
+Each stage of a pipeline is keyed by a digest over its arguments (with its
+own output paths masked out), the keys of the stages it depends on, and for
+the first stage a digest of the target's source tree. A stage whose key is in
+the cache is not run; its outputs are copied back from the cache instead.
+
+Every artifact directory (*_profile, *_call, *_viz, *_uml) keeps its own
+cache in a CACHE_DIR subdirectory, bounded in size by evicting the least
+recently used entries.
+"""
+
+CACHE_DIR = ".cache"
+INDEX = "index.json"
+MAX_BYTES = 512 * 1024**2
+
+SOURCE_EXTENSIONS = (".py",)
+# directories never considered part of a source tree, including the ones
+# the GUIs put their artifacts in.
+SKIPPED_DIRS = ("__pycache__", CACHE_DIR)
+ARTIFACT_SUFFIXES = ("_profile", "_call", "_viz", "_uml", "_coverage")
+
+# (path, size, mtime) -> digest of that file, so unchanged files are only
+# read once per session.
+_fileDigests = {}
+
+
+def fileDigest(path):
+    stat = os.stat(path)
+    signature = (path, stat.st_size, stat.st_mtime_ns)
+    if signature not in _fileDigests:
+        h = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1024**2), b""):
+                h.update(block)
+        _fileDigests[signature] = h.hexdigest()
+    return _fileDigests[signature]
+
+
+def treeDigest(root, extensions=SOURCE_EXTENSIONS):
+    """digest over the relative paths and contents of the source files under
+    root. root may also be a single file, in which case its directory is
+    used."""
+    if os.path.isfile(root):
+        root = os.path.dirname(os.path.abspath(root))
+
+    h = hashlib.sha256()
+    for dirPath, dirNames, fileNames in os.walk(root):
+        dirNames[:] = sorted(
+            d
+            for d in dirNames
+            if d not in SKIPPED_DIRS
+            and not d.startswith(".")
+            and not d.endswith(ARTIFACT_SUFFIXES)
+        )
+        for fileName in sorted(fileNames):
+            if not fileName.endswith(extensions):
+                continue
+            path = os.path.join(dirPath, fileName)
+            h.update(os.path.relpath(path, root).encode())
+            h.update(fileDigest(path).encode())
+
+    return h.hexdigest()
+
+
+def stageKey(args, outputs=(), inputs=()):
+    """digest identifying a stage by what it is run with. Output paths are
+    masked, so that the same stage writing elsewhere is still a hit."""
+    h = hashlib.sha256()
+    for arg in args:
+        for i, output in enumerate(outputs):
+            arg = arg.replace(output, "<output {:d}>".format(i))
+        h.update(arg.encode() + b"\0")
+    for digest in inputs:
+        h.update(digest.encode() + b"\0")
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, artifactDir, maxBytes=MAX_BYTES):
+        self.root = os.path.join(artifactDir, CACHE_DIR)
+        self.maxBytes = maxBytes
+
+        try:
+            with open(os.path.join(self.root, INDEX), "rt") as file:
+                self.index = json.load(file)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def saveIndex(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, INDEX), "wt") as file:
+            json.dump(self.index, file)
+
+    def entryPaths(self, key, count):
+        return [
+            os.path.join(self.root, key, "{:d}".format(i)) for i in range(count)
+        ]
+
+    def restore(self, key, outputs):
+        """copy the cached outputs of key to outputs. Returns whether the key
+        was found."""
+        entry = self.index.get(key)
+        if entry is None or entry["count"] != len(outputs):
+            return False
+
+        cached = self.entryPaths(key, len(outputs))
+        if not all(os.path.exists(path) for path in cached):
+            del self.index[key]
+            self.saveIndex()
+            return False
+
+        for source, output in zip(cached, outputs):
+            if os.path.dirname(output):
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+            shutil.copyfile(source, output)
+
+        entry["used"] = time()
+        self.saveIndex()
+        return True
+
+    def store(self, key, outputs):
+        if not all(os.path.exists(output) for output in outputs):
+            return
+
+        os.makedirs(os.path.join(self.root, key), exist_ok=True)
+        for output, target in zip(outputs, self.entryPaths(key, len(outputs))):
+            shutil.copyfile(output, target)
+
+        self.index[key] = {
+            "count": len(outputs),
+            "size": sum(os.path.getsize(output) for output in outputs),
+            "used": time(),
+        }
+        self.evict()
+        self.saveIndex()
+
+    def evict(self):
+        """remove least recently used entries until under maxBytes"""
+        total = sum(entry["size"] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda key: self.index[key]["used"]):
+            if total <= self.maxBytes:
+                break
+            total -= self.index.pop(key)["size"]
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
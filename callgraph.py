@@ -0,0 +1,341 @@
+import os
+import pstats
+import colorsys
+from bisect import bisect_right
+
+"""
+Jinpeng Zhai
+Call graph of a .pstats file, held in memory so that it can be pruned,
+coloured and laid out again as the thresholds change, without running
+gprof2dot and dot for every change. See explorer.py for the window that
+shows it.
+
+Pruning follows gprof2dot: a function is kept when its total time is at
+least the node threshold, in percent of the time of the whole run, and a
+call when its own total time is at least the edge threshold and both of its
+ends are kept. With paths given, functions in files outside all of them are
+dropped, except built-ins, which have no file. The colour maps are those of
+gprof2dot's themes, so that the graph looks like the one it would render.
+
+The functions are sorted by total time once, so a node threshold is a
+bisection. Each pruned graph is laid out in layers, callers above callees,
+and kept with its layout under its thresholds and paths, so going back to
+an earlier setting costs nothing.
+"""
+
+VIEWS = 64  # pruned and laid out graphs kept
+SWEEPS = 4  # passes over the layers to reduce crossings
+NODE_HEIGHT = 40
+LAYER_GAP = 60
+NODE_GAP = 20
+CHAR_WIDTH = 7  # pixels per character of a label, to size the nodes
+
+
+class Theme:
+    """colours from weights in [0, 1], as gprof2dot.Theme computes them"""
+
+    def __init__(
+        self,
+        mincolor,
+        maxcolor,
+        gamma=2.2,
+        minPenWidth=0.5,
+        maxPenWidth=4.0,
+        filled=True,
+    ):
+        self.mincolor = mincolor  # hue, saturation, lightness
+        self.maxcolor = maxcolor
+        self.gamma = gamma
+        self.minPenWidth = minPenWidth
+        self.maxPenWidth = maxPenWidth
+        self.filled = filled  # or only outlined in the colour
+
+    def color(self, weight, skew=1.0):
+        """ "#rrggbb" for weight, with skew > 1 spreading out the low end"""
+        weight = min(max(weight, 0.0), 1.0)
+        if skew != 1.0:
+            weight = (skew**weight - 1.0) / (skew - 1.0)
+        h, s, l = (
+            lo + weight * (hi - lo)
+            for lo, hi in zip(self.mincolor, self.maxcolor)
+        )
+        # colorsys takes hue, lightness, saturation
+        rgb = colorsys.hls_to_rgb(h % 1.0, l, s)
+        return "#" + "".join(
+            "{:02x}".format(int(255 * c**self.gamma + 0.5)) for c in rgb
+        )
+
+    def penWidth(self, weight):
+        return self.minPenWidth + weight * (self.maxPenWidth - self.minPenWidth)
+
+    def textColor(self, weight, skew=1.0):
+        """black or white, whichever reads on the colour of weight"""
+        if not self.filled:
+            return "black"
+        r, g, b = (
+            int(self.color(weight, skew)[i : i + 2], 16) for i in (1, 3, 5)
+        )
+        return "black" if 0.299 * r + 0.587 * g + 0.114 * b > 128 else "white"
+
+
+THEMES = {
+    "color": Theme((2.0 / 3.0, 0.80, 0.25), (0.0, 1.0, 0.5), gamma=1.0),
+    "pink": Theme((0.0, 1.0, 0.90), (0.0, 1.0, 0.5)),
+    "gray": Theme((0.0, 0.0, 0.85), (0.0, 0.0, 0.0)),
+    # these two differ in their fonts, which are not drawn here
+    "bw": Theme(
+        (0.0, 0.0, 0.0),
+        (0.0, 0.0, 0.0),
+        minPenWidth=0.1,
+        maxPenWidth=8.0,
+        filled=False,
+    ),
+    "print": Theme(
+        (0.0, 0.0, 0.0),
+        (0.0, 0.0, 0.0),
+        minPenWidth=0.1,
+        maxPenWidth=8.0,
+        filled=False,
+    ),
+}
+
+
+def functionLabel(func):
+    """module:line:name, as gprof2dot names the functions of a pstats"""
+    filename, lineno, name = func
+    if filename == "~":  # built-in
+        return name
+    module = os.path.splitext(os.path.basename(filename))[0]
+    return "{:}:{:d}:{:}".format(module, lineno, name)
+
+
+class View:
+    """a pruned call graph with its layout"""
+
+    def __init__(self, nodes, edges, positions, widths, size):
+        self.nodes = nodes  # function ids
+        self.edges = edges  # (caller id, callee id, edge id)
+        self.positions = positions  # function id -> (x, y) of its centre
+        self.widths = widths  # function id -> width of its box
+        self.size = size  # (width, height) of the whole layout
+
+
+class CallGraph:
+    def __init__(self, path):
+        stats = pstats.Stats(path).stats
+        self.path = path
+        self.funcs = list(stats)
+        ids = {func: i for i, func in enumerate(self.funcs)}
+
+        self.labels = [functionLabel(func) for func in self.funcs]
+        self.calls = []
+        self.selfTime = []
+        self.totalTime = []
+        self.edgeCalls = []
+        self.edgeTime = []
+        self.edgeEnds = []  # (caller id, callee id)
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            self.calls.append(nc)
+            self.selfTime.append(tt)
+            self.totalTime.append(ct)
+            for caller, edge in callers.items():
+                self.edgeEnds.append((ids[caller], ids[func]))
+                if isinstance(edge, tuple):  # calls, primitive calls, times
+                    calls, time = edge[0], edge[3]
+                else:  # only a call count, from the profile module
+                    calls, time = edge, ct * edge / nc if nc else 0.0
+                self.edgeCalls.append(calls)
+                self.edgeTime.append(time)
+        self.total = sum(self.selfTime) or 1.0
+
+        # function ids by total time, longest first, for bisection
+        self.byTime = sorted(
+            range(len(self.funcs)), key=lambda i: -self.totalTime[i]
+        )
+        self.byTimeKeys = [-self.totalTime[i] for i in self.byTime]
+        self.outEdges = [[] for _ in self.funcs]
+        for edgeId, (caller, callee) in enumerate(self.edgeEnds):
+            self.outEdges[caller].append(edgeId)
+
+        self.views = {}  # (node thres, edge thres, paths) -> View
+        self.pathMasks = {}  # paths -> [function kept]
+
+    def __len__(self):
+        return len(self.funcs)
+
+    def nodeRatio(self, i, selfTime=False):
+        return (self.selfTime if selfTime else self.totalTime)[i] / self.total
+
+    def edgeRatio(self, edgeId):
+        return self.edgeTime[edgeId] / self.total
+
+    def pathMask(self, paths):
+        mask = self.pathMasks.get(paths)
+        if mask is None:
+            # a path keeps the files under it, not those it is a prefix of
+            dirs = tuple(path.rstrip(os.sep) + os.sep for path in paths)
+            mask = self.pathMasks[paths] = [
+                filename == "~"
+                or filename in paths
+                or filename.startswith(dirs)
+                for filename, _, _ in self.funcs
+            ]
+        return mask
+
+    def view(self, nodeThres, edgeThres, paths=()):
+        """the graph pruned at the thresholds, in percent, and paths"""
+        paths = tuple(sorted(os.path.normpath(p) for p in paths if p))
+        key = (nodeThres, edgeThres, paths)
+        view = self.views.get(key)
+        if view is None:
+            if len(self.views) == VIEWS:
+                del self.views[next(iter(self.views))]
+            view = self.views[key] = self.prune(nodeThres, edgeThres, paths)
+        return view
+
+    def prune(self, nodeThres, edgeThres, paths):
+        cut = bisect_right(self.byTimeKeys, -nodeThres / 100 * self.total)
+        nodes = self.byTime[:cut]
+        if paths:
+            mask = self.pathMask(paths)
+            nodes = [i for i in nodes if mask[i]]
+        kept = set(nodes)
+        minTime = edgeThres / 100 * self.total
+        edges = [
+            (caller, callee, edgeId)
+            for caller in nodes
+            for edgeId in self.outEdges[caller]
+            for callee in (self.edgeEnds[edgeId][1],)
+            if callee in kept and self.edgeTime[edgeId] >= minTime
+        ]
+        return self.layout(nodes, edges)
+
+    def layout(self, nodes, edges):
+        """place nodes in layers, callers above callees, ordered within each
+        layer by the mean position of their neighbours"""
+        children = {i: [] for i in nodes}
+        parents = {i: [] for i in nodes}
+        for caller, callee, _ in edges:
+            if caller != callee:
+                children[caller].append(callee)
+
+        # drop the calls that close a cycle, found by a depth first search
+        # from the most expensive functions down
+        state = {}  # function id -> 1 while on the stack, 2 when done
+        for root in nodes:
+            if root in state:
+                continue
+            state[root] = 1
+            stack = [(root, iter(children[root]))]
+            while stack:
+                node, rest = stack[-1]
+                child = next(rest, None)
+                if child is None:
+                    state[node] = 2
+                    stack.pop()
+                elif child not in state:
+                    parents[child].append(node)
+                    state[child] = 1
+                    stack.append((child, iter(children[child])))
+                elif state[child] == 2:
+                    parents[child].append(node)
+                # otherwise child is on the stack, and the call goes back up
+
+        # longest path from a root, in topological order
+        layer = {}
+        pending = {i: len(parents[i]) for i in nodes}
+        ready = [i for i in nodes if not pending[i]]
+        forward = {i: [] for i in nodes}
+        for child, ps in parents.items():
+            for parent in ps:
+                forward[parent].append(child)
+        while ready:
+            node = ready.pop()
+            layer[node] = max((layer[p] + 1 for p in parents[node]), default=0)
+            for child in forward[node]:
+                pending[child] -= 1
+                if not pending[child]:
+                    ready.append(child)
+
+        layers = []
+        for node in nodes:  # most expensive first within each layer
+            depth = layer[node]
+            while len(layers) <= depth:
+                layers.append([])
+            layers[depth].append(node)
+
+        order = {}
+        for row in layers:
+            order.update((node, i) for i, node in enumerate(row))
+        for sweep in range(SWEEPS):
+            down = sweep % 2 == 0
+            for row in layers[1:] if down else reversed(layers[:-1]):
+                neighbours = parents if down else forward
+                row.sort(
+                    key=lambda node: (
+                        sum(order[n] for n in neighbours[node])
+                        / len(neighbours[node])
+                        if neighbours[node]
+                        else order[node]
+                    )
+                )
+                order.update((node, i) for i, node in enumerate(row))
+
+        widths = {
+            node: CHAR_WIDTH * len(self.labels[node]) + NODE_GAP
+            for node in nodes
+        }
+        rowWidths = [
+            sum(widths[node] for node in row) + NODE_GAP * (len(row) - 1)
+            for row in layers
+        ]
+        width = max(rowWidths, default=0)
+        positions = {}
+        for depth, (row, rowWidth) in enumerate(zip(layers, rowWidths)):
+            x = (width - rowWidth) / 2
+            y = NODE_HEIGHT / 2 + depth * (NODE_HEIGHT + LAYER_GAP)
+            for node in row:
+                positions[node] = (x + widths[node] / 2, y)
+                x += widths[node] + NODE_GAP
+        height = len(layers) * (NODE_HEIGHT + LAYER_GAP) - LAYER_GAP
+        return View(nodes, edges, positions, widths, (width, max(height, 0)))
+
+    def toDot(self, view, colormap="color", skew=1.0, selfTime=False):
+        """the view as a dot graph, for rendering with graphviz"""
+        theme = THEMES[colormap]
+        lines = [
+            "digraph {",
+            "  node [fontname=Arial, shape=box{:}];".format(
+                ", style=filled" if theme.filled else ""
+            ),
+            "  edge [fontname=Arial];",
+        ]
+        for node in view.nodes:
+            weight = self.nodeRatio(node, selfTime)
+            lines.append(
+                '  {:d} [label="{:}\\n{:.2%}\\n({:.2%})\\n{:d}\u00d7", '
+                'color="{:}", fontcolor="{:}"];'.format(
+                    node,
+                    self.labels[node].replace('"', '\\"'),
+                    self.nodeRatio(node),
+                    self.nodeRatio(node, True),
+                    self.calls[node],
+                    theme.color(weight, skew),
+                    theme.textColor(weight, skew),
+                )
+            )
+        for caller, callee, edgeId in view.edges:
+            weight = self.edgeRatio(edgeId)
+            lines.append(
+                '  {:d} -> {:d} [label="{:.2%}\\n{:d}\u00d7", '
+                'color="{:}", penwidth="{:.2f}"];'.format(
+                    caller,
+                    callee,
+                    weight,
+                    self.edgeCalls[edgeId],
+                    theme.color(weight, skew),
+                    theme.penWidth(weight),
+                )
+            )
+        lines.append("}")
+        return "\n".join(lines) + "\n"
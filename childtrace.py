@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import atexit
+import pickle
+import signal
+import shutil
+import tempfile
+import time
+
+from countstore import loadCounts
+
+"""
+Jinpeng Zhai
+Counting in the child processes of a run, e.g. the workers of a
+multiprocessing or concurrent.futures pool, for monitor.py --children.
+
+A forked child carries on with the parent's counter, so it only needs to
+start over from no counts. A child that starts a fresh interpreter, as the
+spawn and forkserver start methods do, finds the bootstrap directory first
+on its PYTHONPATH: the sitecustomize there starts a counter as configured by
+the parent through the CONFIG environment variable.
+
+Either way, the child writes its counts as a shard, a count file of trace's
+pickle format, into a directory the parent made for the run, and the parent
+adds up the shards when the target is done. A child's shard is written when
+it exits, including when a multiprocessing pool is terminated; a child that
+is killed outright, or exits through os._exit() outside of multiprocessing,
+leaves no shard.
+
+Each child puts down a PENDING marker named after its pid when it starts,
+and takes it away once its shard is written. Before adding up, the parent
+ends the multiprocessing children still running, as it would on exit, and
+waits up to WAIT seconds for the markers to go. Children that are gone
+without a shard, or still running past that, are reported as missing. The
+helper processes of multiprocessing, its resource tracker and fork server,
+run none of the target and keep no shard.
+"""
+
+CONFIG = "PYHEATTRACE_CHILDREN"  # environment variable, JSON
+BOOTSTRAP = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bootstrap"
+)
+SHARD_EXTENSION = ".shard"
+PENDING = ".pending"
+WAIT = 5.0  # seconds the parent waits for the shards of exiting children
+POLL = 0.02
+HELPERS = ("multiprocessing.resource_tracker", "multiprocessing.forkserver")
+
+
+def warn(message):
+    print("childtrace: " + message, file=sys.stderr)
+
+
+class Shard:
+    """writes the counts of counter to shardDir once this process exits"""
+
+    def __init__(self, counter, shardDir):
+        self.counter = counter
+        self.shardDir = shardDir
+        self.pid = os.getpid()
+        self.written = False
+        self.writing = False
+        self.terminated = None  # the signal that came in while writing
+        atexit.register(self.write)
+        # multiprocessing children leave through os._exit(), after their
+        # finalizers. They drop those they were forked with, then run the
+        # after fork hooks.
+        mpUtil = sys.modules.get("multiprocessing.util")
+        if mpUtil is not None:
+            self.finalize()
+            mpUtil.register_after_fork(self, Shard.finalize)
+        # and Pool.terminate() ends them with SIGTERM. A forked child may
+        # have the handler of its parent's shard.
+        handler = signal.getsignal(signal.SIGTERM)
+        if handler is signal.SIG_DFL or isinstance(
+            getattr(handler, "__self__", None), Shard
+        ):
+            signal.signal(signal.SIGTERM, self.onTerminate)
+        # last, so that a marker always has a shard coming
+        self.marker = os.path.join(
+            shardDir, "{:d}{:}".format(self.pid, PENDING)
+        )
+        try:
+            open(self.marker, "w").close()
+        except OSError:
+            warn(
+                "process {:d} started after the run was over, its counts are"
+                " left out".format(self.pid)
+            )
+
+    def finalize(self):
+        sys.modules["multiprocessing.util"].Finalize(
+            None, self.write, exitpriority=-100
+        )
+
+    def write(self):
+        # a handler inherited through a fork is not this process's to run
+        if self.written or os.getpid() != self.pid:
+            return
+        self.written = self.writing = True
+        try:
+            self.writeShard()
+        finally:
+            self.writing = False
+        if self.terminated is not None:
+            self.onTerminate(self.terminated, None)
+
+    def writeShard(self):
+        counts = dict(self.counter.counts)
+        try:
+            fd, path = tempfile.mkstemp(
+                suffix=SHARD_EXTENSION + ".tmp", dir=self.shardDir
+            )
+        except OSError:
+            warn(
+                "process {:d} outlived the run, its counts are left out".format(
+                    self.pid
+                )
+            )
+            return
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump((counts, {}, {}), file, 1)  # as trace does
+        # only whole shards carry the extension the parent looks for
+        os.replace(path, path[: -len(".tmp")])
+        try:
+            os.remove(self.marker)
+        except OSError:
+            pass
+
+    def onTerminate(self, signum, frame):
+        if self.writing:
+            # interrupting the write; it ends the process once it is done
+            self.terminated = signum
+            return
+        self.write()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+def inherit(counter, ignoreModules, ignoreDirs, coverageOnly):
+    """have the children of this process count as counter does. Returns
+    the directory their shards go to."""
+    shardDir = tempfile.mkdtemp(prefix="shards_")
+    counter.ignore.files[__file__] = True  # the shard is not part of the run
+    os.environ[CONFIG] = json.dumps(
+        {
+            "shards": shardDir,
+            "modules": list(ignoreModules),
+            "dirs": list(ignoreDirs),
+            "coverageOnly": coverageOnly,
+        }
+    )
+    path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = (
+        BOOTSTRAP + os.pathsep + path if path else BOOTSTRAP
+    )
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(
+            after_in_child=lambda: forked(counter, shardDir, coverageOnly)
+        )
+    return shardDir
+
+
+def forked(counter, shardDir, coverageOnly):
+    counter.counts.clear()
+    if coverageOnly and hasattr(sys, "monitoring"):
+        # lines the parent had covered are switched off for the child too
+        sys.monitoring.restart_events()
+    Shard(counter, shardDir)
+
+
+def bootstrap():
+    """start counting in a fresh interpreter, if the parent asked for it"""
+    config = os.environ.get(CONFIG)
+    if config is None:
+        return
+    config = json.loads(config)
+    # e.g. -c "from multiprocessing.resource_tracker import main; main(5)"
+    command = getattr(sys, "orig_argv", sys.argv)
+    helper = any(name in arg for arg in command for name in HELPERS)
+    # imported now, so that the shard is written by multiprocessing's
+    # finalizers in a worker of a spawn pool, which leaves by os._exit()
+    import multiprocessing.util
+    from monitor import LineCounter, TraceCounter
+
+    counter = (LineCounter if hasattr(sys, "monitoring") else TraceCounter)(
+        config["modules"], config["dirs"], config["coverageOnly"]
+    )
+    counter.ignore.files[__file__] = True  # the shard is not part of the run
+    shardDir = config["shards"]
+    if not helper:  # the fork server's children still count, see forked()
+        Shard(counter, shardDir)
+    os.register_at_fork(
+        after_in_child=lambda: forked(counter, shardDir, config["coverageOnly"])
+    )
+    counter.start()
+
+
+def settle(shardDir, wait=WAIT):
+    """end the children multiprocessing still runs, and wait for the shards
+    of exiting children. Returns the pids of those that left none."""
+    mp = sys.modules.get("multiprocessing")
+    if mp is not None:
+        # as multiprocessing does on exit, daemons are terminated and the
+        # others joined
+        children = mp.active_children()
+        for child in children:
+            if child.daemon:
+                child.terminate()
+        for child in children:
+            child.join(wait)
+
+    deadline = time.monotonic() + wait
+    while True:
+        waiting = [
+            int(name[: -len(PENDING)])
+            for name in os.listdir(shardDir)
+            if name.endswith(PENDING)
+        ]
+        running = [pid for pid in waiting if isRunning(pid)]
+        if not running or time.monotonic() > deadline:
+            return waiting
+        time.sleep(POLL)
+
+
+def isRunning(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # e.g. not ours to signal, but there
+        return True
+    return True
+
+
+def collect(shardDir, wait=WAIT):
+    """{(filename, lineno): count} summed over the shards in shardDir, the
+    number of shards and the pids of the children that left none. The
+    directory is removed."""
+    counts = {}
+    shards = 0
+    try:
+        missing = settle(shardDir, wait)
+        for name in os.listdir(shardDir):
+            if not name.endswith(SHARD_EXTENSION):
+                continue
+            shards += 1
+            for key, count in loadCounts(os.path.join(shardDir, name)).items():
+                counts[key] = counts.get(key, 0) + count
+    finally:
+        shutil.rmtree(shardDir, ignore_errors=True)
+    return counts, shards, missing
@@ -0,0 +1,267 @@
+import os
+import queue
+import tempfile
+import tkinter as tk
+from time import perf_counter
+
+"""
+Jinpeng Zhai
+Console behaviour shared by the GUIs. The GUI frames inherit from Console
+alongside tk.Frame, and are expected to provide self.ttyText and a
+Supervisor as self.supervisor.
+
+Where Tk supports file handlers the write loop only runs while output is
+arriving; otherwise it polls the queues fed by the reader threads.
+
+Everything before the "protect" mark in ttyText is read-only output; what
+follows it is the line the user is typing. Edits are validated against the
+mark by a proxy over the widget's Tcl command, so neither writing nor typing
+ever needs to look at the rest of the buffer.
+
+Only the most recent output is kept in the widget. Older lines are evicted
+in bulk to a per-session spill file, from which loadOlder() pages them back.
+"""
+
+PROTECT = "protect"
+
+# upper bounds on the work done per tick of the write loop, so that a very
+# chatty subprocess cannot starve the Tk event loop.
+TICK_BYTES = 1024 * 1024  # characters moved from the queues per tick
+TICK_SECONDS = 0.025  # time spent draining and inserting per tick
+
+# the write loop reschedules itself between these intervals (in ms), going
+# fast when a backlog remains and backing off when the console is idle.
+TICK_MIN = 1
+TICK_DEFAULT = 10
+TICK_MAX = 100
+
+# number of lines of output ttyText holds before older ones are spilled to
+# disk. Eviction waits until SPILL_LINES lines in excess have accumulated.
+SCROLLBACK_LINES = 10000
+SPILL_LINES = 1000
+# lines paged back in by loadOlder() that the limit makes room for on top.
+LOADED_LINES = SCROLLBACK_LINES
+
+
+class Console:
+    tickBytes = TICK_BYTES
+    tickSeconds = TICK_SECONDS
+
+    tickInterval = TICK_DEFAULT
+
+    scrollbackLines = SCROLLBACK_LINES
+
+    writeJob = None  # pending after() call of writeLoop
+
+    def startSubprocess(self):
+        self.alive = True
+        self.supervisor.start()
+        self.wakeWriteLoop()
+
+        stats = self.supervisor.stats()
+        self.writeInfo(
+            "shell {:d} started, {:d} threads, {:d} open files".format(
+                self.supervisor.p.pid, stats["threads"], stats["fds"]
+            )
+        )
+
+    def endSubprocess(self):
+        self.alive = False
+        self.supervisor.stop()
+
+    def wakeWriteLoop(self):
+        if self.writeJob is None:
+            self.writeJob = self.after_idle(self.writeLoop)
+
+    def drainQueue(self, q, budget, deadline):
+        """pop chunks from q until it is empty, or either the character budget
+        or the deadline has been used up. Returns the joined string."""
+        chunks = []
+        while budget > 0 and perf_counter() < deadline:
+            try:
+                chunk = q.get_nowait()
+            except queue.Empty:
+                break
+            chunks.append(chunk)
+            budget -= len(chunk)
+
+        return "".join(chunks)
+
+    def writeInfo(self, string):
+        """write a line of notes from the GUI itself, after any output that is
+        still waiting in the queues."""
+        for q, tag in (
+            (self.supervisor.errQueue, "stderr"),
+            (self.supervisor.outQueue, "stdout"),
+        ):
+            pending = self.drainQueue(q, float("inf"), float("inf"))
+            if pending:
+                self.write(pending, tag=tag)
+        self.write(string + "\n", tag="info")
+
+    def writeLoop(self):
+        """Used to write data from stdout and stderr to the Text widget"""
+        self.writeJob = None
+
+        deadline = perf_counter() + self.tickSeconds
+        budget = self.tickBytes
+
+        written = False
+        # stderr goes first, so that errors are not held up by a flood on stdout
+        outQueue, errQueue = self.supervisor.outQueue, self.supervisor.errQueue
+        for q, tag in ((errQueue, "stderr"), (outQueue, "stdout")):
+            string = self.drainQueue(q, budget, deadline)
+            if string:
+                # one insert per tag per tick.
+                self.write(string, tag=tag)
+                budget -= len(string)
+                written = True
+
+        backlog = errQueue.qsize() + outQueue.qsize()
+
+        if backlog:
+            # more is waiting, come back as soon as Tk has had a breather
+            self.tickInterval = TICK_MIN
+        elif written:
+            self.tickInterval = TICK_DEFAULT
+        else:
+            # nothing happened this tick, poll less often.
+            self.tickInterval = min(self.tickInterval * 2, TICK_MAX)
+
+        if self.alive and (backlog or self.supervisor.polling):
+            self.writeJob = self.after(self.tickInterval, self.writeLoop)
+
+    def protectConsole(self):
+        """route the Tcl command of ttyText through ttyProxy, so that every
+        insert and delete, whether typed, pasted or dropped, is checked
+        against the protect mark."""
+        widget = str(self.ttyText)
+        self.ttyOrig = widget + "_orig"
+        self.tk.call("rename", widget, self.ttyOrig)
+        self.tk.createcommand(widget, self.ttyProxy)
+
+        self.ttyText.mark_set(PROTECT, "1.0")
+        # typing at the mark must not drag it along.
+        self.ttyText.mark_gravity(PROTECT, tk.LEFT)
+
+        # output paged back in from the spill file, and notes from the GUI.
+        for tag in ("spill", "info"):
+            self.ttyText.tag_config(
+                tag,
+                background="black",
+                foreground="grey",
+                selectbackground="grey",
+                selectforeground="black",
+            )
+        self.resetSpill()
+
+    def releaseConsole(self):
+        """undo protectConsole(), to be called before ttyText is destroyed"""
+        widget = str(self.ttyText)
+        self.tk.deletecommand(widget)
+        self.tk.call("rename", self.ttyOrig, widget)
+
+        self.resetSpill()
+
+    def resetSpill(self):
+        if getattr(self, "spillFile", None) is not None:
+            self.spillFile.close()  # a TemporaryFile is deleted on close
+        self.spillFile = None
+        # (offset, size) of each evicted block in the spill file, oldest first.
+        self.spillBlocks = []
+        # lines loaded back and still at the top of ttyText. They raise the
+        # limit, up to LOADED_LINES, so that loading does not spill them
+        # again at once; being the oldest, they are the first to go once new
+        # output does.
+        self.spillLoaded = 0
+
+    def spill(self):
+        """evict the oldest lines from ttyText to the spill file once there
+        are SPILL_LINES more of them than the scrollback limit allows"""
+        lines = int(self.ttyText.index("end-1c").split(".")[0])
+        limit = self.scrollbackLines + min(self.spillLoaded, LOADED_LINES)
+        if lines <= limit + SPILL_LINES:
+            return
+
+        cut = "{:d}.0".format(lines - limit)
+        if self.ttyText.compare(cut, ">", PROTECT):
+            cut = PROTECT
+
+        data = self.ttyText.get("1.0", cut).encode()
+
+        if self.spillFile is None:
+            self.spillFile = tempfile.TemporaryFile(prefix="console_")
+        self.spillFile.seek(0, os.SEEK_END)
+        self.spillBlocks.append((self.spillFile.tell(), len(data)))
+        self.spillFile.write(data)
+
+        # bypass the proxy, this is all read-only text.
+        self.tk.call(self.ttyOrig, "delete", "1.0", cut)
+        self.spillLoaded = max(self.spillLoaded - data.count(b"\n"), 0)
+
+    def loadOlder(self):
+        """page the most recently evicted block back in above the oldest
+        line still in ttyText"""
+        if not self.spillBlocks:
+            return
+
+        # blocks are popped in the reverse order they were written in, so the
+        # file can be truncated to the remaining blocks straight away.
+        offset, size = self.spillBlocks.pop()
+        self.spillFile.flush()
+        self.spillFile.seek(offset)
+        string = self.spillFile.read(size).decode()
+        self.spillFile.truncate(offset)
+
+        # right gravity keeps an empty prompt at 1.0 after the inserted text.
+        self.ttyText.mark_gravity(PROTECT, tk.RIGHT)
+        self.tk.call(self.ttyOrig, "insert", "1.0", string, "spill")
+        self.ttyText.mark_gravity(PROTECT, tk.LEFT)
+
+        self.spillLoaded += string.count("\n")
+        self.ttyText.see("1.0")
+
+    def ttyProxy(self, cmd, *args):
+        if cmd in ("insert", "delete", "replace") and self.tk.getboolean(
+            self.tk.call(self.ttyOrig, "compare", args[0], "<", PROTECT)
+        ):
+            if cmd != "insert":
+                return ""
+            # typing into the read-only part appends to the input line instead
+            args = (tk.END,) + args[1:]
+            self.tk.call(self.ttyOrig, "mark", "set", tk.INSERT, tk.END)
+
+        return self.tk.call(self.ttyOrig, cmd, *args)
+
+    def enter(self, e):
+        """The <Return> key press handler"""
+        string = self.ttyText.get(PROTECT, "end-1c") + "\n"
+
+        self.ttyText.insert(tk.END, "\n")
+        self.ttyText.mark_set(PROTECT, "end-1c")
+        self.ttyText.mark_set(tk.INSERT, tk.END)
+        self.ttyText.edit_reset()
+
+        self.supervisor.write(string)
+
+        return "break"  # the newline has been inserted already
+
+    def clear(self):
+        self.ttyText.mark_set(PROTECT, "1.0")
+        self.ttyText.delete(1.0, tk.END)
+        self.resetSpill()
+
+    def write(self, string, tag=None):
+        """insert output at the protect mark, i.e. in front of any half typed
+        input, and extend the read-only part over it."""
+        self.ttyText.mark_gravity(PROTECT, tk.RIGHT)
+        self.ttyText.insert(PROTECT, string, tag)
+        self.ttyText.mark_gravity(PROTECT, tk.LEFT)
+
+        self.spill()
+
+        self.ttyText.see(tk.END)
+        self.ttyText.mark_set(tk.INSERT, tk.END)
+
+        # user edits preceding this output may no longer be undone.
+        self.ttyText.edit_reset()
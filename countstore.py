@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import mmap
+import pickle
+import shutil
+import struct
+import tempfile
+from array import array
+
+"""
+Jinpeng Zhai
+Count file that is updated in place, instead of being unpickled, merged and
+pickled again by every run as trace does with --file.
+
+Layout, all integers in native byte order:
+
+    header      magic, version, offset and size of the file table
+    sections    one array of unsigned 64 bit counts per traced file, indexed
+                by line number
+    file table  JSON list of [filename, offset, length] for every section,
+                the position in the list being the file's id
+
+A run adds its counts straight into the memory mapped sections. Only a file
+that is new, or has grown past its section, gets a new, larger section
+appended after the file table, followed by the new file table. What that
+leaves behind, the old sections and table, is reclaimed by rewriting the
+store once it is more than DEAD of the file.
+
+Files with the STORE_EXTENSION are count stores; anything else passed as a
+count file is taken to be trace's pickle. exportPickle() and importPickle()
+convert between the two, e.g. for `trace --report`.
+"""
+
+MAGIC = b"PHTC"
+VERSION = 1
+HEADER = struct.Struct("=4sIQQ")
+ALIGN = 64  # lines a section is rounded up to
+SLACK = 1.25  # room left in a new section for the file to grow into
+DEAD = 0.5  # share of the file left unused by grow() that prompts compact()
+
+STORE_EXTENSION = ".counts"
+
+
+def isStore(path):
+    return path.endswith(STORE_EXTENSION)
+
+
+class CountStore:
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as file:
+                table = b"[]"
+                file.write(HEADER.pack(MAGIC, VERSION, HEADER.size, len(table)))
+                file.write(table)
+
+        self.file = open(path, "r+b")
+        self.map = None
+        self.load()
+
+    def load(self):
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, version, tableOffset, tableSize = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{:} is not a count store".format(self.path))
+
+        self.dataEnd = tableOffset + tableSize
+        self.table = json.loads(
+            self.map[tableOffset : tableOffset + tableSize].decode()
+        )
+        self.ids = {entry[0]: i for i, entry in enumerate(self.table)}
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def section(self, filename):
+        """copy of the counts of filename, indexed by line number"""
+        if filename not in self.ids:
+            return array("Q")
+        _, offset, length = self.table[self.ids[filename]]
+        counts = array("Q")
+        counts.frombytes(self.map[offset : offset + length * counts.itemsize])
+        return counts
+
+    def add(self, counts):
+        """add {(filename, lineno): count} to the store"""
+        byFile = {}
+        for (filename, lineno), count in counts.items():
+            byFile.setdefault(filename, {})[lineno] = count
+
+        grown = {}
+        with memoryview(self.map) as buffer:
+            for filename, lineCounts in byFile.items():
+                i = self.ids.get(filename)
+                if i is None or max(lineCounts) >= self.table[i][2]:
+                    grown[filename] = lineCounts
+                    continue
+
+                _, offset, length = self.table[i]
+                with buffer[offset : offset + 8 * length].cast("Q") as view:
+                    for lineno, count in lineCounts.items():
+                        view[lineno] += count
+
+        if grown:
+            self.grow(grown)
+        else:
+            self.map.flush()
+
+    def grow(self, byFile):
+        """give the files in byFile new sections, with their old counts plus
+        the new ones, at the end of the data"""
+        # the old table is left in place until the header no longer points
+        # to it, so an interrupted update leaves the store as it was.
+        offset = -(-self.dataEnd // 8) * 8
+        sections = []
+        for filename, lineCounts in byFile.items():
+            counts = self.section(filename)
+            length = -(-int(max(lineCounts) * SLACK + 1) // ALIGN) * ALIGN
+            counts.extend([0] * (length - len(counts)))
+            for lineno, count in lineCounts.items():
+                counts[lineno] += count
+
+            entry = [filename, offset, length]
+            if filename in self.ids:
+                self.table[self.ids[filename]] = entry
+            else:
+                self.ids[filename] = len(self.table)
+                self.table.append(entry)
+
+            sections.append((offset, counts))
+            offset += length * counts.itemsize
+
+        table = json.dumps(self.table).encode()
+
+        # the map cannot be resized everywhere, so write through the file and
+        # map it again.
+        self.map.close()
+        self.map = None
+        for sectionOffset, counts in sections:
+            self.file.seek(sectionOffset)
+            counts.tofile(self.file)
+        self.file.seek(offset)
+        self.file.write(table)
+        self.file.truncate()
+        self.file.flush()
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, offset, len(table)))
+        self.file.flush()
+
+        self.load()
+        live = HEADER.size + len(table) + sum(8 * n for _, _, n in self.table)
+        if live < (1 - DEAD) * len(self.map):
+            self.compact()
+
+    def compact(self):
+        """rewrite the store with only the current sections and table"""
+        sections = [(entry[0], self.section(entry[0])) for entry in self.table]
+        self.map.close()
+        self.map = None
+        self.file.close()
+
+        # written next to the store and moved over it, so an interrupted
+        # compaction leaves the store as it was.
+        fd, path = tempfile.mkstemp(
+            suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path))
+        )
+        try:
+            with os.fdopen(fd, "wb") as file:
+                offset = HEADER.size
+                file.seek(offset)
+                table = []
+                for filename, counts in sections:
+                    table.append([filename, offset, len(counts)])
+                    counts.tofile(file)
+                    offset += len(counts) * counts.itemsize
+                data = json.dumps(table).encode()
+                file.write(data)
+                file.seek(0)
+                file.write(HEADER.pack(MAGIC, VERSION, offset, len(data)))
+            shutil.copymode(self.path, path)
+            os.replace(path, self.path)
+        except BaseException:
+            os.remove(path)
+            raise
+        finally:
+            self.file = open(self.path, "r+b")
+            self.load()
+
+    def filenames(self):
+        return list(self.ids)
+
+    def items(self, filenames=None):
+        """yield ((filename, lineno), count) for every line that ran, in the
+        given files or all of them"""
+        for filename in self.filenames() if filenames is None else filenames:
+            for lineno, count in enumerate(self.section(filename)):
+                if count:
+                    yield (filename, lineno), count
+
+    def toDict(self, filenames=None):
+        return dict(self.items(filenames))
+
+
+def loadCounts(path):
+    """{(filename, lineno): count} from a count store or a trace pickle"""
+    if isStore(path):
+        with CountStore(path) as store:
+            return store.toDict()
+    with open(path, "rb") as file:
+        return pickle.load(file)[0]  # (counts, calledfuncs, callers)
+
+
+def exportPickle(storePath, picklePath):
+    """write the counts in a store as trace would have pickled them"""
+    counts = loadCounts(storePath) if os.path.exists(storePath) else {}
+    with open(picklePath, "wb") as file:
+        pickle.dump((counts, {}, {}), file, 1)
+
+
+def importPickle(picklePath, storePath):
+    """replace the counts in a store with those pickled by trace"""
+    counts = loadCounts(picklePath)
+    if os.path.exists(storePath):
+        os.remove(storePath)
+    with CountStore(storePath) as store:
+        store.add(counts)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    commands = {"export": exportPickle, "import": importPickle}
+    if len(argv) != 3 or argv[0] not in commands:
+        sys.exit(
+            "usage: countstore.py export STORE PICKLE\n"
+            "       countstore.py import PICKLE STORE"
+        )
+    commands[argv[0]](*argv[1:])
+
+
+if __name__ == "__main__":
+    main()
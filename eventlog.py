@@ -0,0 +1,333 @@
+import sys
+import json
+import mmap
+import trace
+import struct
+import argparse
+import linecache
+import threading
+from array import array
+from bisect import bisect_left
+from time import perf_counter_ns, time_ns, strftime, localtime
+
+"""
+Jinpeng Zhai
+Binary log of line events, written by `monitor.py --trace` in place of the
+text that `trace --trace` prints, and a viewer that pages through it.
+
+Layout, all integers in native byte order:
+
+    header      magic, version, number of records, offset and size of the
+                string table, wall clock time and perf_counter_ns at the
+                start
+    records     one pair of unsigned 64 bit integers per line event: the
+                perf_counter_ns, and the thread id, file id and line number
+                packed as 16, 24 and 24 bits
+    table       JSON object with the interned file names and thread names,
+                which the ids index, and for each block of BLOCK records
+                the ids of the files that appear in it
+
+An event costs two stores into an array of one block of records, under a
+lock that the threads of the target share, so that they keep the records in
+time order. Each full block is copied into a memory map of the file, which
+is grown a CHUNK at a time. The records being in time order, the viewer
+finds a time by bisection, and finds the events of a file by skipping the
+blocks that do not have it. Neither reads more of the log than it shows,
+however long it is.
+"""
+
+MAGIC = b"PHTE"
+VERSION = 1
+HEADER = struct.Struct("=4sIQQQQQ")
+RECORD = struct.Struct("=QQ")  # time, thread id << 48 | file id << 24 | line
+FILE_SHIFT = 24
+THREAD_SHIFT = 48
+MASK = (1 << 24) - 1
+DATA = 64  # offset of the first record
+BLOCK = 4096  # records per block of the file index, and per write
+CHUNK = RECORD.size * BLOCK * 1024  # bytes the log is grown by
+PAGE = 40  # events shown at a time
+
+EVENT_EXTENSION = ".events"
+
+
+class EventWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w+b")
+        self.file.truncate(DATA + CHUNK)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.pos = DATA
+        self.end = DATA + CHUNK
+
+        self.filenames = []
+        self.fileIds = {}  # filename -> file id
+        self.threads = []
+        self.blocks = []  # file ids in each block
+        self.buffer = array("Q", bytes(RECORD.size * BLOCK))
+        self.used = 0  # items in buffer, two per record
+        self.lock = threading.Lock()  # over buffer and used, and the map
+        self.count = 0
+        self.wall = time_ns()
+        self.start = perf_counter_ns()
+
+    def intern(self, filename):
+        """file id of filename, shifted into place for write()"""
+        fileId = self.fileIds.get(filename)
+        if fileId is None:
+            fileId = self.fileIds[filename] = len(self.filenames)
+            self.filenames.append(filename)
+        return fileId << FILE_SHIFT
+
+    def thread(self, name):
+        """id of a new thread, shifted into place for write()"""
+        self.threads.append(name)
+        return (len(self.threads) - 1) << THREAD_SHIFT
+
+    def rename(self, threadId, name):
+        if name is not None:
+            self.threads[threadId >> THREAD_SHIFT] = name
+
+    def write(self, key):
+        """record an event of key, a thread | file | line number"""
+        with self.lock:
+            i = self.used
+            buffer = self.buffer
+            buffer[i] = perf_counter_ns()
+            buffer[i + 1] = key
+            i += 2
+            self.used = i
+            if i >= 2 * BLOCK:
+                self.flush()
+
+    def flush(self):
+        # with the lock held
+        if not self.used:
+            return
+        data = self.buffer[: self.used]
+        if self.pos + len(data) * data.itemsize > self.end:
+            self.map.close()
+            self.end += CHUNK
+            self.file.truncate(self.end)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        self.map[self.pos : self.pos + len(data) * data.itemsize] = data
+        self.pos += len(data) * data.itemsize
+        self.count += len(data) // 2
+        self.blocks.append(
+            sorted({key >> FILE_SHIFT & MASK for key in data[1::2]})
+        )
+        self.used = 0
+
+    def close(self):
+        if self.map is None:
+            return
+        with self.lock:
+            self.flush()
+        self.map.flush()
+        self.map.close()
+        self.map = None
+
+        table = json.dumps(
+            {
+                "files": self.filenames,
+                "threads": self.threads,
+                "blocks": self.blocks,
+            }
+        ).encode()
+        self.file.seek(self.pos)
+        self.file.write(table)
+        self.file.truncate()
+        self.file.seek(0)
+        self.file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                self.count,
+                self.pos,
+                len(table),
+                self.wall,
+                self.start,
+            )
+        )
+        self.file.close()
+
+
+class EventLog:
+    """read side of an event log, which is mapped rather than loaded"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            self.count,
+            tableOffset,
+            tableSize,
+            self.wall,
+            self.start,
+        ) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or tableSize == 0:
+            self.close()
+            raise ValueError(
+                "{:} is not a complete event log".format(self.path)
+            )
+        table = json.loads(
+            self.map[tableOffset : tableOffset + tableSize].decode()
+        )
+        self.filenames = table["files"]
+        self.threads = table["threads"]
+
+        self.fileBlocks = {}  # file id -> blocks it appears in
+        for block, fileIds in enumerate(table["blocks"]):
+            for fileId in fileIds:
+                self.fileBlocks.setdefault(fileId, []).append(block)
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        """(ns since the start, file id, line, thread id) of event i"""
+        ns, key = RECORD.unpack_from(self.map, DATA + i * RECORD.size)
+        return (
+            ns - self.start,
+            key >> FILE_SHIFT & MASK,
+            key & MASK,
+            key >> THREAD_SHIFT,
+        )
+
+    def duration(self):
+        return self.record(self.count - 1)[0] if self.count else 0
+
+    def seekTime(self, ns):
+        """index of the first event at or after ns since the start"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.record(mid)[0] < ns:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def fileIds(self, pattern):
+        """ids of the files whose name contains pattern"""
+        return {
+            fileId
+            for fileId, filename in enumerate(self.filenames)
+            if pattern in filename
+        }
+
+    def events(self, start=0, fileIds=None, threadId=None):
+        """yield (index, record) from start on, of the given files and
+        thread only if any"""
+        i = start
+        while i < self.count:
+            if fileIds is not None:
+                # go to the next block that has any of the files
+                block = self.nextBlock(i // BLOCK, fileIds)
+                if block is None:
+                    return
+                i = max(i, block * BLOCK)
+            stop = min(self.count, (i // BLOCK + 1) * BLOCK)
+            for j in range(i, stop):
+                record = self.record(j)
+                if (fileIds is None or record[1] in fileIds) and (
+                    threadId is None or record[3] == threadId
+                ):
+                    yield j, record
+            i = stop
+
+    def nextBlock(self, block, fileIds):
+        found = None
+        for fileId in fileIds:
+            blocks = self.fileBlocks.get(fileId, ())
+            k = bisect_left(blocks, block)
+            if k < len(blocks) and (found is None or blocks[k] < found):
+                found = blocks[k]
+        return found
+
+    def format(self, i, record):
+        ns, fileId, lineno, threadId = record
+        filename = self.filenames[fileId]
+        return "{:>12d} {:>14.6f} [{:}] {:}({:d}): {:}".format(
+            i,
+            ns / 1e9,
+            self.threads[threadId],
+            trace._modname(filename),
+            lineno,
+            linecache.getline(filename, lineno).rstrip(),
+        )
+
+
+def view(path, at=None, seconds=None, pattern=None, thread=None, n=PAGE):
+    """print a page of n events, from index at or from the time given in
+    seconds, of files whose name contains pattern and the thread given by
+    name, if any"""
+    with EventLog(path) as log:
+        print(
+            "{:d} events over {:.6f} s from {:}, {:d} files, {:d} threads".format(
+                len(log),
+                log.duration() / 1e9,
+                strftime("%Y-%m-%d %H:%M:%S", localtime(log.wall / 1e9)),
+                len(log.filenames),
+                len(log.threads),
+            )
+        )
+        if seconds is not None:
+            start = log.seekTime(int(seconds * 1e9))
+        else:
+            start = at or 0
+        fileIds = log.fileIds(pattern) if pattern else None
+        threadId = None
+        if thread is not None:
+            if thread not in log.threads:
+                sys.exit("no thread named {!r} in the log".format(thread))
+            threadId = log.threads.index(thread)
+
+        shown = 0
+        for i, record in log.events(start, fileIds, threadId):
+            if shown == n:
+                print("-- more: --at {:d}".format(i))
+                break
+            print(log.format(i, record))
+            shown += 1
+        else:
+            print("-- end of log")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="page through an event log written by monitor.py --trace"
+    )
+    parser.add_argument("log")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--at", type=int, help="index of the first event")
+    where.add_argument(
+        "--time", type=float, help="seconds since the start of the run"
+    )
+    parser.add_argument(
+        "--file", help="only events in files whose path contains this"
+    )
+    parser.add_argument("--thread", help="only events of this thread")
+    parser.add_argument("-n", type=int, default=PAGE, help="events per page")
+    opts = parser.parse_args(argv)
+
+    try:
+        view(opts.log, opts.at, opts.time, opts.file, opts.thread, opts.n)
+    except (OSError, ValueError) as err:
+        sys.exit("Cannot read event log {!r}: {:}".format(opts.log, err))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import pickle
+import tempfile
+import subprocess as sp
+import multiprocessing as mp
+
+from pool import ITERATIONS, LOOPS
+
+"""
+Jinpeng Zhai
+Regression check of monitor.py --children: runs pool.py under it with every
+start method there is, with the pool terminated, closed or left running,
+REPEATS times each, and checks that the loop line was counted exactly as
+often as it ran. Exits with 1 if any run came up short, or long.
+
+    python check.py [repeats]
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MONITOR = os.path.join(os.path.dirname(os.path.dirname(HERE)), "monitor.py")
+TARGET = os.path.join(HERE, "pool.py")
+REPEATS = 5
+EXPECTED = LOOPS * ITERATIONS
+
+
+def loopLine():
+    with open(TARGET, "rt") as file:
+        for lineno, line in enumerate(file, 1):
+            if line.rstrip().endswith("# counted"):
+                return lineno
+
+
+def countOnce(method, ending):
+    with tempfile.TemporaryDirectory() as scratch:
+        countFile = os.path.join(scratch, "counts.pickle")
+        result = sp.run(
+            [
+                sys.executable,
+                MONITOR,
+                "--count",
+                "--children",
+                *("--ignore-dir", os.path.dirname(os.__file__)),
+                *("-C", scratch),
+                *("-f", countFile),
+                TARGET,
+                method,
+                ending,
+            ],
+            stdout=sp.PIPE,
+            stderr=sp.STDOUT,
+            text=True,
+        )
+        if result.returncode != 0:
+            return None, result.stdout
+        with open(countFile, "rb") as file:
+            counts = pickle.load(file)[0]
+    return counts.get((TARGET, loopLine()), 0), result.stdout
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else REPEATS
+    failed = 0
+    for method in mp.get_all_start_methods():
+        for ending in ("terminate", "close", "leave"):
+            for run in range(repeats):
+                count, output = countOnce(method, ending)
+                ok = count == EXPECTED
+                failed += not ok
+                print(
+                    "{:<10} {:<10} run {:d}: {:} of {:d} {:}".format(
+                        method, ending, run, count, EXPECTED, "" if ok else "!"
+                    )
+                )
+                if not ok:
+                    sys.stdout.write(output)
+    print("{:d} runs came out wrong".format(failed) if failed else "all good")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import sys
+import multiprocessing as mp
+
+"""
+Jinpeng Zhai
+Target for check.py: LOOPS tasks of ITERATIONS iterations each, done by a
+pool of WORKERS, so that the line in the loop runs LOOPS * ITERATIONS times
+in the children. The start method is the first argument; a second
+argument of "close" has the pool closed and joined, and "leave" leaves it
+running, instead of terminating it.
+"""
+
+WORKERS = 3
+LOOPS = 12
+ITERATIONS = 1000
+
+
+def task(n):
+    total = 0
+    for i in range(n):
+        total += i  # counted
+    return total
+
+
+def main():
+    ctx = mp.get_context(sys.argv[1])
+    ending = sys.argv[2] if len(sys.argv) > 2 else "terminate"
+    if ending in ("close", "leave"):
+        pool = ctx.Pool(WORKERS)
+        pool.map(task, [ITERATIONS] * LOOPS)
+        if ending == "close":
+            pool.close()
+            pool.join()
+    else:
+        with ctx.Pool(WORKERS) as pool:  # terminated on leaving
+            pool.map(task, [ITERATIONS] * LOOPS)
+
+
+if __name__ == "__main__":
+    main()
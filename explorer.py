@@ -0,0 +1,339 @@
+import os
+import tkinter as tk
+import tkinter.ttk as ttk
+import tkinter.filedialog as tkfiledialog
+import tkinter.messagebox as tkmessagebox
+from time import perf_counter
+
+from callgraph import CallGraph, NODE_HEIGHT, THEMES
+
+"""
+Jinpeng Zhai
+Window onto the call graph of a .pstats file, see callgraph.py, for tuning
+the options of gprof2dot by eye. The profile is loaded once; moving a slider
+only prunes and lays out the graph again, or takes that from the cache for
+thresholds seen before, and changing the colours only recolours what is
+drawn.
+
+The settings are written back to the tk variables of gprof2dotGUI that it
+was opened with, so that the next run renders the graph as tuned here.
+"""
+
+DELAY = 30  # ms without changes before the graph is drawn again
+DRAW_LIMIT = 3000  # functions beyond which the graph is not drawn
+MARGIN = 20
+
+
+def parseFloat(value, default):
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+class CallGraphExplorer(tk.Toplevel):
+    def __init__(self, parent, path, settings):
+        """settings maps node, edge, skew, colormap, paths and selfTime to
+        the tk variables of the same gprof2dot options"""
+        tk.Toplevel.__init__(self, parent)
+        self.title("Call graph of " + os.path.basename(path))
+        self.settings = settings
+        start = perf_counter()
+        self.graph = CallGraph(path)
+        loaded = perf_counter() - start
+
+        self.nodeThres = tk.DoubleVar(
+            value=parseFloat(settings["node"].get(), 0.5)
+        )
+        self.edgeThres = tk.DoubleVar(
+            value=parseFloat(settings["edge"].get(), 0.1)
+        )
+        self.skew = tk.DoubleVar(value=parseFloat(settings["skew"].get(), 1.0))
+        self.colormap = tk.StringVar(
+            value=settings["colormap"].get() or "color"
+        )
+        self.paths = tk.StringVar(value=settings["paths"].get())
+        self.selfTime = tk.IntVar(value=settings["selfTime"].get())
+        self.status = tk.StringVar(
+            value="{:d} functions loaded in {:.2f} s".format(
+                len(self.graph), loaded
+            )
+        )
+
+        self.addControlWidgets()
+        self.addCanvasWidgets()
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.view = None  # the one drawn
+        self.items = {}  # function id or edge id -> canvas items
+        self.pending = {}  # action -> after id
+
+        for var in (self.nodeThres, self.edgeThres, self.paths):
+            var.trace_add("write", lambda *args: self.schedule(self.draw))
+        for var in (self.skew, self.colormap, self.selfTime):
+            var.trace_add("write", lambda *args: self.schedule(self.recolor))
+        self.draw()
+
+    def addControlWidgets(self):
+        controlFrame = ttk.Frame(self)
+        controlFrame.grid(row=0, column=0, sticky="nsew", padx=10, pady=5)
+        controlFrame.columnconfigure(1, weight=1)
+        controlFrame.columnconfigure(3, weight=1)
+
+        for row, (text, var, to, resolution) in enumerate(
+            (
+                ("-n, --node-thres= (%)", self.nodeThres, 10, 0.05),
+                ("-e, --edge-thres= (%)", self.edgeThres, 5, 0.01),
+                ("--skew=", self.skew, 10, 0.1),
+            )
+        ):
+            ttk.Label(controlFrame, text=text).grid(
+                row=row, column=0, sticky="nsew", padx=2, pady=2
+            )
+            tk.Scale(
+                controlFrame,
+                variable=var,
+                from_=resolution if var is self.skew else 0,
+                to=to,
+                resolution=resolution,
+                orient="horizontal",
+            ).grid(row=row, column=1, sticky="nsew", padx=2, pady=2)
+
+        ttk.Label(controlFrame, text="-c, --colormap=").grid(
+            row=0, column=2, sticky="nsew", padx=2, pady=2
+        )
+        ttk.Combobox(
+            controlFrame,
+            textvariable=self.colormap,
+            values=list(THEMES),
+            state="readonly",
+        ).grid(row=0, column=3, sticky="nsew", padx=2, pady=2)
+
+        ttk.Checkbutton(
+            controlFrame,
+            text="--color-nodes-by-selftime",
+            variable=self.selfTime,
+        ).grid(row=1, column=2, columnspan=2, sticky="nsew", padx=2, pady=2)
+
+        ttk.Label(controlFrame, text="-p, --path=").grid(
+            row=2, column=2, sticky="nsew", padx=2, pady=2
+        )
+        ttk.Entry(controlFrame, textvariable=self.paths).grid(
+            row=2, column=3, sticky="nsew", padx=2, pady=2
+        )
+
+        ttk.Label(controlFrame, textvariable=self.status).grid(
+            row=3, column=0, columnspan=3, sticky="nsew", padx=2, pady=2
+        )
+        ttk.Button(controlFrame, text="Save .dot", command=self.saveDot).grid(
+            row=3, column=3, sticky="nsew", padx=2, pady=2
+        )
+
+    def addCanvasWidgets(self):
+        canvasFrame = ttk.Frame(self)
+        canvasFrame.grid(row=1, column=0, sticky="nsew", padx=10, pady=5)
+        canvasFrame.columnconfigure(0, weight=1)
+        canvasFrame.rowconfigure(0, weight=1)
+
+        self.canvas = tk.Canvas(
+            canvasFrame, background="white", width=1000, height=700
+        )
+        xScroll = ttk.Scrollbar(
+            canvasFrame, orient="horizontal", command=self.canvas.xview
+        )
+        yScroll = ttk.Scrollbar(
+            canvasFrame, orient="vertical", command=self.canvas.yview
+        )
+        self.canvas.config(
+            xscrollcommand=xScroll.set, yscrollcommand=yScroll.set
+        )
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        xScroll.grid(row=1, column=0, sticky="nsew")
+        yScroll.grid(row=0, column=1, sticky="nsew")
+
+        self.canvas.bind(
+            "<MouseWheel>",
+            lambda event: self.canvas.yview_scroll(
+                -1 if event.delta > 0 else 1, "units"
+            ),
+        )
+        self.canvas.bind(
+            "<Button-4>", lambda event: self.canvas.yview_scroll(-1, "units")
+        )
+        self.canvas.bind(
+            "<Button-5>", lambda event: self.canvas.yview_scroll(1, "units")
+        )
+        self.canvas.tag_bind("node", "<Button-1>", self.onClick)
+
+    def schedule(self, action):
+        # a slider being dragged fires on every step, only the last counts
+        if action in self.pending:
+            self.after_cancel(self.pending[action])
+        self.pending[action] = self.after(DELAY, action)
+
+    def currentPaths(self):
+        # "." is gprof2dotGUI's placeholder for paths it fills in itself
+        return tuple(
+            p for p in self.paths.get().split(os.pathsep) if p not in ("", ".")
+        )
+
+    def writeBack(self):
+        settings = self.settings
+        settings["node"].set("{:g}".format(self.nodeThres.get()))
+        settings["edge"].set("{:g}".format(self.edgeThres.get()))
+        settings["skew"].set("{:g}".format(self.skew.get()))
+        settings["colormap"].set(self.colormap.get())
+        settings["paths"].set(self.paths.get())
+        settings["selfTime"].set(self.selfTime.get())
+
+    def draw(self):
+        self.pending.pop(self.draw, None)
+        start = perf_counter()
+        # rounded, so that a threshold reached twice is the same key
+        view = self.graph.view(
+            round(self.nodeThres.get(), 3),
+            round(self.edgeThres.get(), 3),
+            self.currentPaths(),
+        )
+        pruned = perf_counter() - start
+        self.writeBack()
+        if view is self.view:
+            return
+        self.view = view
+        self.canvas.delete("all")
+        self.items = {}
+        if len(view.nodes) > DRAW_LIMIT:
+            self.status.set(
+                "{:d} functions, raise the thresholds to draw them".format(
+                    len(view.nodes)
+                )
+            )
+            return
+
+        graph = self.graph
+        for caller, callee, edgeId in view.edges:
+            (x0, y0), (x1, y1) = view.positions[caller], view.positions[callee]
+            if caller == callee:
+                continue
+            self.items[("edge", edgeId)] = self.canvas.create_line(
+                x0 + MARGIN,
+                y0 + NODE_HEIGHT / 2 + MARGIN,
+                x1 + MARGIN,
+                y1 - NODE_HEIGHT / 2 + MARGIN,
+                arrow="last",
+            )
+        for node in view.nodes:
+            x, y = view.positions[node]
+            half = view.widths[node] / 2
+            box = self.canvas.create_rectangle(
+                x - half + MARGIN,
+                y - NODE_HEIGHT / 2 + MARGIN,
+                x + half + MARGIN,
+                y + NODE_HEIGHT / 2 + MARGIN,
+                tags=("node", "n{:d}".format(node)),
+            )
+            text = self.canvas.create_text(
+                x + MARGIN,
+                y + MARGIN,
+                text="{:}\n{:.2%} ({:.2%})".format(
+                    graph.labels[node],
+                    graph.nodeRatio(node),
+                    graph.nodeRatio(node, True),
+                ),
+                justify="center",
+                tags=("node", "n{:d}".format(node)),
+            )
+            self.items[("node", node)] = (box, text)
+
+        width, height = view.size
+        self.canvas.config(
+            scrollregion=(0, 0, width + 2 * MARGIN, height + 2 * MARGIN)
+        )
+        self.recolor()
+        self.status.set(
+            "{:d} of {:d} functions, {:d} calls, pruned and laid out in "
+            "{:.0f} ms, drawn in {:.0f} ms".format(
+                len(view.nodes),
+                len(graph),
+                len(view.edges),
+                1000 * pruned,
+                1000 * (perf_counter() - start - pruned),
+            )
+        )
+
+    def recolor(self):
+        self.pending.pop(self.recolor, None)
+        self.writeBack()
+        if self.view is None:
+            return
+        graph = self.graph
+        theme = THEMES.get(self.colormap.get(), THEMES["color"])
+        skew = max(self.skew.get(), 0.01)
+        selfTime = bool(self.selfTime.get())
+        itemconfig = self.canvas.itemconfig
+        for (kind, key), items in self.items.items():
+            if kind == "node":
+                box, text = items
+                weight = graph.nodeRatio(key, selfTime)
+                color = theme.color(weight, skew)
+                itemconfig(
+                    box,
+                    fill=color if theme.filled else "white",
+                    outline=color if not theme.filled else "",
+                )
+                itemconfig(text, fill=theme.textColor(weight, skew))
+            else:
+                weight = graph.edgeRatio(key)
+                itemconfig(
+                    items,
+                    fill=theme.color(weight, skew),
+                    width=theme.penWidth(weight),
+                )
+
+    def onClick(self, event):
+        tag = next(
+            (
+                t
+                for t in self.canvas.gettags("current")
+                if t.startswith("n") and t != "node"
+            ),
+            None,
+        )
+        if tag is None:  # not on a node
+            return
+        node = int(tag[1:])
+        graph = self.graph
+        filename, lineno, name = graph.funcs[node]
+        self.status.set(
+            "{:} in {:}:{:d}, {:d} calls, {:.6f} s self, {:.6f} s total".format(
+                name,
+                filename,
+                lineno,
+                graph.calls[node],
+                graph.selfTime[node],
+                graph.totalTime[node],
+            )
+        )
+
+    def saveDot(self):
+        filePath = tkfiledialog.asksaveasfilename(
+            title="Save Call Graph",
+            filetypes=(("Graphviz", "*.dot"),),
+            defaultextension=".dot",
+            initialfile=os.path.splitext(os.path.basename(self.graph.path))[0]
+            + ".dot",
+            initialdir=os.path.dirname(self.graph.path),
+        )
+        if filePath == "":
+            tkmessagebox.showinfo("Exception:", "No File Selected")
+            return
+        with open(filePath, "wt", encoding="utf-8") as file:
+            file.write(
+                self.graph.toDot(
+                    self.view,
+                    self.colormap.get(),
+                    max(self.skew.get(), 0.01),
+                    bool(self.selfTime.get()),
+                )
+            )
@@ -2,23 +2,34 @@ import tkinter as tk
 import tkinter.ttk as ttk
 import tkinter.filedialog as tkfiledialog
 import tkinter.messagebox as tkmessagebox
-import subprocess as sp
 from time import strftime, localtime
 
 import sys
 import os
-import queue
+import shlex
 import traceback
-from threading import Thread
 from platform import system
 
-import psutil
-
-
-BUNDLED_TEE_DIR = "tee-win32/tee-x64.exe"
-
-
-class ProfileToDot(tk.Frame):
+from console import Console
+from supervisor import Supervisor
+from cache import ArtifactCache, treeDigest
+from jobs import Job, python, DONE
+from explorer import CallGraphExplorer
+from profilehistory import DATABASE
+from repeatprofile import RUNS_SUFFIX, REPORT_SUFFIX
+
+REPEAT_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "repeatprofile.py"
+)
+DIFF_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "profdiff.py"
+)
+HISTORY_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "profilehistory.py"
+)
+
+
+class ProfileToDot(tk.Frame, Console):
     def __init__(self, parent):
         # use this instead of super() due to multiple inheritance
         ttk.Frame.__init__(self, parent)
@@ -31,6 +42,7 @@ class ProfileToDot(tk.Frame):
         self.addProfilerWidgets()
         self.add2DotWidgets()
         self.addFlameprofWidgets()
+        self.addArtifactWidgets()
 
         self.addConsoleWidgets()
         self.addControlWidgets()
@@ -38,17 +50,14 @@ class ProfileToDot(tk.Frame):
         self.columnconfigure(1, weight=1)
         self.rowconfigure(0, weight=1)
 
-        # make queues for keeping stdout and stderr whilst it is transferred between threads
-        self.outQueue = queue.Queue()
-        self.errQueue = queue.Queue()
+        # owns the shell behind the console, its readers and their queues
+        self.supervisor = Supervisor(self, self.wakeWriteLoop, self.writeInfo)
 
-        # keep track of where any line that is submitted starts
-        self.line_start = 0
+        # make sure the user does not edit past the starting point.
+        self.protectConsole()
 
         # make the enter key call the self.enter function
         self.ttyText.bind("<Return>", self.enter)
-        # and make sure the user does not delete past the starting point.
-        self.ttyText.bind("<KeyRelease>", self.postKey)
 
         self.startSubprocess()
         self.writeLoop()  # start the write loop in the main thread
@@ -158,6 +167,15 @@ class ProfileToDot(tk.Frame):
         p_s_1_Combobox.current(0)
         p_s_1_Combobox.grid(row=0, column=3, sticky="nsew", padx=2, pady=2)
 
+        # more than one run is merged and reported on, see repeatprofile.py
+        self.p_arg_n = tk.StringVar(value="1")
+        ttk.Label(profileOptionFrame, text="Repeat (runs)").grid(
+            row=4, column=0, sticky="nsew", padx=2, pady=2
+        )
+        ttk.Entry(profileOptionFrame, textvariable=self.p_arg_n).grid(
+            row=4, column=1, columnspan=3, sticky="nsew", padx=2, pady=2
+        )
+
     def add2DotWidgets(self):
         prof2dotOptionFrame = ttk.LabelFrame(self, text="prof2dot Options")
         prof2dotOptionFrame.grid(row=1, column=0, stick="nsew", padx=10, pady=5)
@@ -390,6 +408,64 @@ class ProfileToDot(tk.Frame):
             command=lambda: self.f_arg_o.set(self.selectFile()),
         ).grid(row=5, column=3, sticky="nsew", padx=2, pady=2)
 
+    def addArtifactWidgets(self):
+        artifactFrame = ttk.LabelFrame(self, text="Artifacts")
+        artifactFrame.grid(row=3, column=0, stick="nsew", padx=10, pady=5)
+        artifactFrame.columnconfigure(1, weight=1)
+
+        # each artifact is shown as soon as the stage producing it finishes,
+        # while the others are still being rendered.
+        self.artifacts = {}
+        for i, (name, pathVar) in enumerate(
+            (
+                ("pstats", None),
+                ("call graph", self.d_arg_o),
+                ("flame graph", self.f_arg_o),
+            )
+        ):
+            status = tk.StringVar(value="-")
+            ttk.Label(artifactFrame, text=name).grid(
+                row=i, column=0, sticky="nsew", padx=2, pady=2
+            )
+            ttk.Label(artifactFrame, textvariable=status).grid(
+                row=i, column=1, sticky="nsew", padx=2, pady=2
+            )
+            if pathVar is None:
+                button = None
+            else:
+                button = ttk.Button(
+                    artifactFrame,
+                    text="Open",
+                    state="disabled",
+                    command=lambda pathVar=pathVar: self.openArtifact(
+                        pathVar.get()
+                    ),
+                )
+                button.grid(row=i, column=2, sticky="nsew", padx=2, pady=2)
+
+            self.artifacts[name] = (status, button)
+
+    def updateArtifact(self, name, job):
+        status, button = self.artifacts[name]
+        if job.finished and job.wallTime is not None:
+            status.set("{:} in {:.1f} s".format(job.status, job.wallTime))
+        else:
+            status.set(job.status)
+
+        if button is not None:
+            button.config(state="normal" if job.status == DONE else "disabled")
+
+    def openArtifact(self, path):
+        if system() == "Windows":
+            os.startfile(path)
+        else:
+            self.supervisor.jobs.submit(
+                Job(
+                    "open",
+                    ["open" if sys.platform == "darwin" else "xdg-open", path],
+                )
+            )
+
     def addConsoleWidgets(self):
         consoleFrame = ttk.LabelFrame(self, text="Console")
         consoleFrame.grid(
@@ -447,7 +523,10 @@ class ProfileToDot(tk.Frame):
 
         ttk.Button(
             operationFrame, text="Reset Console", command=self.restart
-        ).grid(row=0, column=0, columnspan=2, sticky="nsew", padx=2, pady=2)
+        ).grid(row=0, column=0, sticky="nsew", padx=2, pady=2)
+        ttk.Button(
+            operationFrame, text="Load Older Output", command=self.loadOlder
+        ).grid(row=0, column=1, sticky="nsew", padx=2, pady=2)
 
         ttk.Button(
             operationFrame, text="Run Trace", command=self.profile2dot
@@ -458,6 +537,19 @@ class ProfileToDot(tk.Frame):
             command=lambda: self.profile2dot(tee=True),
         ).grid(row=1, column=1, sticky="nsew", padx=2, pady=2)
 
+        self.useCache = tk.IntVar(value=1)
+        ttk.Checkbutton(
+            operationFrame,
+            text="Reuse Cached Artifacts",
+            variable=self.useCache,
+        ).grid(row=2, column=0, sticky="nsew", padx=2, pady=2)
+        ttk.Button(
+            operationFrame, text="Explore Call Graph", command=self.explore
+        ).grid(row=2, column=1, sticky="nsew", padx=2, pady=2)
+        ttk.Button(
+            operationFrame, text="Compare with Baseline", command=self.compare
+        ).grid(row=3, column=0, columnspan=2, sticky="nsew", padx=2, pady=2)
+
     def loadProgramme(self):
         filePath = tkfiledialog.askopenfilename(
             title="Load Programme to be Analyzed",
@@ -503,6 +595,92 @@ class ProfileToDot(tk.Frame):
                 )
                 tkmessagebox.showinfo("Exception", exceptionDesc)
 
+    def explore(self):
+        """tune the call graph of the last profile in process, see
+        explorer.py"""
+        path = self.p_arg_o.get()
+        if not os.path.isfile(path):
+            tkmessagebox.showinfo(
+                "Exception:", "No .pstats file, run a trace first"
+            )
+            return
+        try:
+            CallGraphExplorer(
+                self,
+                path,
+                {
+                    "node": self.d_arg_n,
+                    "edge": self.d_arg_e,
+                    "skew": self.d_arg__skew,
+                    "colormap": self.d_arg_c,
+                    "paths": self.d_arg_p,
+                    "selfTime": self.d_arg__CNBSelftime,
+                },
+            )
+        except Exception:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            exceptionDesc = "".join(
+                traceback.format_exception(exc_type, exc_value, exc_traceback)
+            )
+            tkmessagebox.showinfo("Exception", exceptionDesc)
+
+    def compare(self):
+        """diff the last profile against a baseline .pstats file, see
+        profdiff.py, and render the differential call graph"""
+        path = self.p_arg_o.get()
+        if not os.path.isfile(path):
+            tkmessagebox.showinfo(
+                "Exception:", "No .pstats file, run a trace first"
+            )
+            return
+        thresholds = []
+        for option, var in (("-n", self.d_arg_n), ("-e", self.d_arg_e)):
+            if var.get() == "":
+                continue
+            try:
+                float(var.get())
+            except ValueError:
+                tkmessagebox.showinfo(
+                    "Exception:",
+                    "{:} threshold {!r} is not a number".format(
+                        option, var.get()
+                    ),
+                )
+                return
+            thresholds += [option, var.get()]
+        baseline = tkfiledialog.askopenfilename(
+            title="Select Baseline Profile",
+            filetypes=(("Profile", "*.pstats"), ("File", "*.*")),
+            initialdir=os.path.dirname(path),
+        )
+        if baseline == "":
+            tkmessagebox.showinfo("Exception:", "No File Selected")
+            return
+
+        stem = os.path.splitext(path)[0]
+        diffJob = Job(
+            "diff",
+            python(
+                DIFF_SCRIPT,
+                os.path.normpath(baseline),
+                path,
+                *thresholds,
+            ),
+            outputs=(stem + "_diff.txt", stem + "_diff.dot"),
+        )
+        dotJob = Job(
+            "dot",
+            ["dot", "-Tpng", "-o", stem + "_diff.png", stem + "_diff.dot"],
+            after=(diffJob,),
+            onUpdate=lambda job: (
+                self.openArtifact(stem + "_diff.png")
+                if job.status == DONE
+                else None
+            ),
+            outputs=(stem + "_diff.png",),
+        )
+        self.supervisor.jobs.submit(diffJob, dotJob)
+
     def selectFile(self):
         filePath = tkfiledialog.askopenfilename(
             title="Select File",
@@ -524,128 +702,23 @@ class ProfileToDot(tk.Frame):
 
         self.endSubprocess()
 
-        # self.p.terminate()  # this, if the above didn't work, sends a Termination signal
-        # self.p.kill()  # and a kill signal. On windows this is the same.
-        # these methods are a lot more effective than sending "exit" and flushing
-
         # call the destroy methods to properly destroy widgets
+        self.releaseConsole()
         self.ttyText.destroy()
         tk.Frame.destroy(self)
 
-    def enter(self, e):
-        """The <Return> key press handler"""
-        self.postKey(None)
-        # ensure the Enter key, if pressed simultaneousely, effectively
-        # "interrupts" other entries by forcing the postKey to be called.
-        string = self.ttyText.get(1.0, tk.END)[self.line_start :]
-        self.line_start += len(string)
-        self.p.stdin.write(string.encode())
-        self.p.stdin.flush()
-
-    def postKey(self, e):
-        ttyNow, ttyNowTagDict = self.ttyNow
-        ttyNew = self.ttyText.get(1.0, tk.END)[: len(ttyNow)]
-        if ttyNew != ttyNow:
-            self.ttyText.edit_undo()
-            self.ttyText.edit_reset()
-
-            for tag, ranges in ttyNowTagDict.items():
-                for startIndex, endIndex in zip(ranges[::2], ranges[1::2]):
-                    self.ttyText.tag_add(tag, startIndex, endIndex)
-
-    def readFromProccessOut(self):
-        """To be executed in a separate thread to make read non-blocking"""
-        while self.alive:
-            data = self.p.stdout.raw.read(1024).decode()
-            self.outQueue.put(data)
-
-    def readFromProccessErr(self):
-        """To be executed in a separate thread to make read non-blocking"""
-        while self.alive:
-            data = self.p.stderr.raw.read(1024).decode()
-            self.errQueue.put(data)
-
-    def writeLoop(self):
-        """Used to write data from stdout and stderr to the Text widget"""
-        # if there is anything to write from stdout or stderr, then write it
-
-        if not self.errQueue.empty():
-            self.write(self.errQueue.get(), tag="stderr")
-        if not self.outQueue.empty():
-            out = self.outQueue.get()
-            self.write(out, tag="stdout")
-
-        # run this method again after 10ms
-        if self.alive:
-            self.after(10, self.writeLoop)
-
-    def clear(self):
-        self.line_start = 0
-        self.ttyText.delete(1.0, tk.END)
-
     def navigateToFolder(self):
         folderPath = os.path.dirname(self.pathVar.get())
 
-        self.p.stdin.write(
-            "cd {:}\n".format(folderPath).encode()
+        self.supervisor.write(
+            "cd {:}\n".format(folderPath)
         )  # This is also platform independent.
-        self.p.stdin.flush()
 
         self.p_arg_o.set(".")
         self.d_arg_o.set(".")
         self.d_arg_p.set(".")
         self.f_arg_o.set(".")
 
-    def write(self, string, tag=None):
-        self.ttyText.insert(tk.END, string, tag)
-        self.ttyText.see(tk.END)
-        self.ttyText.mark_set(tk.INSERT, tk.END)
-
-        self.line_start += len(string)
-
-        self.ttyText.edit_reset()
-
-        self.ttyNow = (
-            self.ttyText.get(1.0, tk.END)[: self.line_start],
-            {tag: self.ttyText.tag_ranges(tag) for tag in ("stdout", "stderr")},
-        )
-
-    def startSubprocess(self):
-        # open a subprocess to this script.
-        self.p = sp.Popen(
-            [
-                "cmd" if system() == "Windows" else "bash"
-            ],  # simple identification of the running system,
-            stdout=sp.PIPE,
-            stdin=sp.PIPE,
-            stderr=sp.PIPE,
-        )
-
-        # a daemon to keep track of the threads so they can stop running
-        self.alive = True
-        # start the functions that get stdout and stderr in separate threads
-        Thread(target=self.readFromProccessOut).start()
-        Thread(target=self.readFromProccessErr).start()
-
-    def endSubprocess(self):
-        self.alive = False
-
-        # use psutil (a cross platform tool) to recursively kill the children
-        # to ensure a clean exit.
-        process = psutil.Process(self.p.pid)
-        for childProcess in process.children(recursive=True):
-            childProcess.kill()
-        process.kill()
-
-        while not self.errQueue.empty():
-            self.errQueue.get()
-        while not self.outQueue.empty():
-            self.outQueue.get()
-
-        # the original way of ending subprocesses.
-        self.p.terminate()
-        self.p.kill()
-
     def restart(self):
         self.endSubprocess()
         self.clear()
@@ -708,152 +781,231 @@ class ProfileToDot(tk.Frame):
             )
             self.d_arg_p.set(paths)
 
-        cProfileCmd = " ".join(
-            arg
-            for arg in (
-                "python -m",
-                "cProfile",
-                "-o " + self.p_arg_o.get(),
-                "-s " + self.p_arg_s.get().split(" ")[0],
-                (
-                    "-s " + self.p_arg_s_1.get().split(" ")[0]
-                    if self.p_arg_s_1.get().split(" ")[0] != ""
-                    else None
+        try:
+            runs = int(self.p_arg_n.get() or 1)
+        except ValueError:
+            tkmessagebox.showinfo("Exception:", "Repeat must be a number")
+            return
+
+        cProfileArgs = python(
+            *(
+                arg
+                for arg in (
+                    "-m",
+                    "cProfile",
+                    *("-o", self.p_arg_o.get()),
+                    *("-s", self.p_arg_s.get().split(" ")[0]),
+                    *(
+                        ("-s", self.p_arg_s_1.get().split(" ")[0])
+                        if self.p_arg_s_1.get().split(" ")[0] != ""
+                        else ()
+                    ),
+                    ("-m" if self.p_arg_m.get() else None),
+                    self.pathVar.get(),
+                    *shlex.split(self.otherArgs.get()),
+                )
+                if arg is not None
+            )
+        )
+
+        if runs > 1:
+            cProfileArgs = python(
+                REPEAT_SCRIPT,
+                *("-n", str(runs)),
+                *("-o", self.p_arg_o.get()),
+                *(
+                    ("-s", "tottime")
+                    if self.p_arg_s.get().startswith("time")
+                    else ()
                 ),
-                ("-m" if self.p_arg_m.get() else None),
+                *(("-m",) if self.p_arg_m.get() else ()),
                 self.pathVar.get(),
-                self.otherArgs.get(),
-                "\n",
+                *shlex.split(self.otherArgs.get()),
             )
-            if arg is not None
-        )
 
         if tee:
-            teePath = (
-                os.path.splitext(self.pathVar.get())[0]
-                + strftime("_%Y_%m_%d_%H_%M_%S", localtime())
-                + ".dot"
+            # keep the intermediate dot file and the output of the profiled
+            # run under a timestamped name
+            stem = os.path.splitext(self.pathVar.get())[0] + strftime(
+                "_%Y_%m_%d_%H_%M_%S", localtime()
             )
-            teeCommand = " ".join(
-                (
+            dotPath = stem + ".dot"
+            teePath = stem + ".txt"
+        else:
+            dotPath = os.path.splitext(self.d_arg_o.get())[0] + ".dot"
+            teePath = None
+
+        prof2dotArgs = python(
+            *(
+                arg
+                for arg in (
+                    "-m",
+                    "gprof2dot",
+                    *("-f", "pstats"),
+                    *(
+                        ("-n", self.d_arg_n.get())
+                        if self.d_arg_n.get() != ""
+                        else ()
+                    ),
+                    *(
+                        ("-e", self.d_arg_e.get())
+                        if self.d_arg_e.get() != ""
+                        else ()
+                    ),
+                    "--total=" + self.d_arg__total.get(),
+                    *("-c", self.d_arg_c.get()),
+                    *(
+                        ("-s", self.d_arg_s.get())
+                        if self.d_arg_s.get() != ""
+                        else ()
+                    ),
+                    (
+                        "--color-nodes-by-selftime"
+                        if self.d_arg__CNBSelftime.get()
+                        else None
+                    ),
+                    ("-w" if self.d_arg_w.get() else None),
+                    ("--show-samples" if self.d_arg__SSamples.get() else None),
+                    (
+                        "--node-label=self-time"
+                        if self.d_arg__self_time.get()
+                        else None
+                    ),
+                    (
+                        "--node-label=self-time-percentage"
+                        if self.d_arg__self_time_percentage.get()
+                        else None
+                    ),
                     (
-                        os.path.normpath(
-                            os.path.join(
-                                os.path.dirname(os.path.abspath(__file__)),
-                                BUNDLED_TEE_DIR,
-                            )
-                        )
-                        if system() == "Windows"
-                        else "tee"
-                    ),  # on Linux tee is a built in utility
-                    '"' + teePath + '"',
+                        "--node-label=total-time"
+                        if self.d_arg__total_time.get()
+                        else None
+                    ),
+                    (
+                        "--node-label=total-time-percentage"
+                        if self.d_arg__total_time_percentage.get()
+                        else None
+                    ),
+                    "--skew=" + self.d_arg__skew.get(),
+                    *(
+                        "--path=" + p
+                        for p in self.d_arg_p.get().split(os.pathsep)
+                        if p != ""
+                    ),  # filter path
+                    *("-o", dotPath),
+                    self.p_arg_o.get(),  # .pstats source file
                 )
+                if arg is not None
             )
-        else:
-            teeCommand = None
-
-        prof2dotCmd = " ".join(
-            arg
-            for arg in (
-                "python -m gprof2dot",
-                "-f pstats",
-                (
-                    "-n " + self.d_arg_n.get()
-                    if self.d_arg_n.get() != ""
-                    else None
-                ),
-                (
-                    "-e " + self.d_arg_e.get()
-                    if self.d_arg_e.get() != ""
-                    else None
-                ),
-                "--total=" + self.d_arg__total.get(),
-                "-c " + self.d_arg_c.get(),
-                (
-                    "-s " + self.d_arg_s.get()
-                    if self.d_arg_s.get() != ""
-                    else None
-                ),
-                (
-                    "--color-nodes-by-selftime"
-                    if self.d_arg__CNBSelftime.get()
-                    else None
-                ),
-                ("-w" if self.d_arg_w.get() else None),
-                ("--show-samples" if self.d_arg__SSamples.get() else None),
-                (
-                    "--node-label=self-time"
-                    if self.d_arg__self_time.get()
-                    else None
-                ),
-                (
-                    "--node-label=self-time-percentage"
-                    if self.d_arg__self_time_percentage.get()
-                    else None
-                ),
-                (
-                    "--node-label=total-time"
-                    if self.d_arg__total_time.get()
-                    else None
-                ),
-                (
-                    "--node-label=total-time-percentage"
-                    if self.d_arg__total_time_percentage.get()
-                    else None
-                ),
-                "--skew=" + self.d_arg__skew.get(),
-                (
-                    " ".join(
-                        "-p " + p for p in self.d_arg_p.get().split(os.pathsep)
-                    )
-                    if self.d_arg_p.get() != ""
-                    else None
-                ),  # filter path
-                self.p_arg_o.get(),  # .pstats source file
-                ("| " + teeCommand if teeCommand else None),
-                "|",
-                "dot",
-                "-Tpng",  # to png? this is undocumented
-                "-o " + self.d_arg_o.get(),  # output to png
-                "\n",
-            )
-            if arg is not None
         )
 
-        flameCmd = " ".join(
-            arg
-            for arg in (
-                "python",
-                "-m",
-                "flameprof",
-                self.p_arg_o.get(),
-                "-o " + self.f_arg_o.get(),
-                "--width " + self.f_arg__width.get()
-                if self.f_arg__width.get() != ""
-                else None,
-                "--row-height " + self.f_arg__row_height.get()
-                if self.f_arg__row_height.get() != ""
-                else None,
-                "--font-size " + self.f_arg__font_size.get()
-                if self.f_arg__font_size.get() != ""
-                else None,
-                "--threshold " + self.f_arg__threshold.get()
-                if self.f_arg__threshold.get() != ""
-                else None,
-                "--cpu" if self.f_arg__cpu.get() else None,
-                "\n",
+        dotArgs = [
+            "dot",
+            "-Tpng",  # to png? this is undocumented
+            *("-o", self.d_arg_o.get()),  # output to png
+            dotPath,
+        ]
+
+        flameArgs = python(
+            *(
+                arg
+                for arg in (
+                    "-m",
+                    "flameprof",
+                    self.p_arg_o.get(),
+                    *("-o", self.f_arg_o.get()),
+                    *(
+                        ("--width", self.f_arg__width.get())
+                        if self.f_arg__width.get() != ""
+                        else ()
+                    ),
+                    *(
+                        ("--row-height", self.f_arg__row_height.get())
+                        if self.f_arg__row_height.get() != ""
+                        else ()
+                    ),
+                    *(
+                        ("--font-size", self.f_arg__font_size.get())
+                        if self.f_arg__font_size.get() != ""
+                        else ()
+                    ),
+                    *(
+                        ("--threshold", self.f_arg__threshold.get())
+                        if self.f_arg__threshold.get() != ""
+                        else ()
+                    ),
+                    "--cpu" if self.f_arg__cpu.get() else None,
+                )
+                if arg is not None
             )
-            if arg is not None
         )
 
-        self.p.stdin.write(cProfileCmd.encode())
-        self.p.stdin.flush()
-
-        self.p.stdin.write(prof2dotCmd.encode())
-        self.p.stdin.flush()
+        # stages whose arguments and inputs are unchanged are taken from the
+        # cache, e.g. only gprof2dot and dot rerun when a threshold changes.
+        cache = ArtifactCache(profilePath) if self.useCache.get() else None
+
+        # the dot graph and the flame graph both only read the .pstats file,
+        # so they are rendered in parallel once cProfile is done.
+        cProfileJob = Job(
+            "cProfile" if runs == 1 else "cProfile x{:d}".format(runs),
+            cProfileArgs,
+            cwd=parentDir,
+            tee=teePath,
+            onUpdate=lambda job: self.updateArtifact("pstats", job),
+            # a merged profile is only read right together with its runs
+            outputs=(self.p_arg_o.get(),)
+            + (
+                tuple(
+                    os.path.splitext(self.p_arg_o.get())[0] + suffix
+                    for suffix in (RUNS_SUFFIX, REPORT_SUFFIX)
+                )
+                if runs > 1
+                else ()
+            ),
+            inputs=(lambda: treeDigest(parentDir or "."),),
+            cache=None if tee else cache,  # the run is wanted for its output
+        )
+        prof2dotJob = Job(
+            "gprof2dot",
+            prof2dotArgs,
+            after=(cProfileJob,),
+            outputs=(dotPath,),
+            cache=cache,
+        )
+        dotJob = Job(
+            "dot",
+            dotArgs,
+            after=(prof2dotJob,),
+            onUpdate=lambda job: self.updateArtifact("call graph", job),
+            outputs=(self.d_arg_o.get(),),
+            cache=cache,
+        )
+        flameJob = Job(
+            "flameprof",
+            flameArgs,
+            after=(cProfileJob,),
+            onUpdate=lambda job: self.updateArtifact("flame graph", job),
+            outputs=(self.f_arg_o.get(),),
+            cache=cache,
+        )
+        # the .pstats file is overwritten by the next run, its times are kept
+        # in the history. A profile taken from the cache is already there.
+        historyJob = Job(
+            "history",
+            python(
+                HISTORY_SCRIPT,
+                os.path.join(profilePath, DATABASE),
+                "ingest",
+                self.p_arg_o.get(),
+                self.pathVar.get(),
+                *shlex.split(self.otherArgs.get()),
+            ),
+            after=(cProfileJob,),
+        )
 
-        self.p.stdin.write(flameCmd.encode())
-        self.p.stdin.flush()
+        self.supervisor.jobs.submit(
+            cProfileJob, prof2dotJob, dotJob, flameJob, historyJob
+        )
 
 
 def main():
@@ -0,0 +1,285 @@
+import os
+import sys
+import heapq
+import pickle
+import trace
+import argparse
+import linecache
+import tokenize
+from html import escape
+
+from countstore import loadCounts
+from manifest import Manifest, countsDigest, groupByFile
+
+"""
+Jinpeng Zhai
+Renders the counts file written by trace (or monitor.py) as static HTML: one
+page per module with every line shaded by how often it ran, and an index
+page ranking the hottest lines of the whole program, followed by the modules
+by total hits.
+
+Shades are on a log scale shared by all pages, so the same colour means the
+same count everywhere. Pages are written one module at a time, reading each
+source file line by line as it is rendered, so only one source file is ever
+open and no page is held in memory.
+
+Lines are classed by the power of two of their count, which does not depend
+on the other modules; the shade of each class is set by a shared stylesheet,
+written anew each time to fit the hottest line. So a module page only needs
+writing again when its counts or source change, which a manifest in the
+output directory keeps track of. The index and stylesheet are always written.
+"""
+
+LEVELS = 10  # number of shades between a single hit and the hottest line
+TOP_LINES = 100  # lines listed on the index page
+INDEX = "index.html"
+STYLESHEET = "heatmap.css"
+MANIFEST = "heatmap_manifest.json"
+
+STYLE = "\n".join(
+    [
+        "body { font-family: sans-serif; }",
+        "table { border-collapse: collapse; }",
+        "td, th { padding: 0 0.5em; text-align: left; }",
+        "td.n { text-align: right; font-family: monospace; }",
+        "pre { margin: 0; }",
+        ".src td { font-family: monospace; white-space: pre; }",
+        ".miss { background: #ddd; }",
+    ]
+)
+
+
+def pageName(filename):
+    return trace._fullmodname(filename) + ".html"
+
+
+def bucket(count):
+    """floor(log2(count)) of a count of at least one"""
+    return count.bit_length() - 1
+
+
+def shade(count):
+    """css class of a line that ran count times"""
+    if count <= 0:
+        return "miss"
+    return "b{:d}".format(bucket(count))
+
+
+def writeStyle(path, maxCount):
+    """stylesheet shading every class up to that of maxCount"""
+    top = bucket(maxCount) if maxCount > 0 else 0
+    rules = [STYLE]
+    for b in range(top + 1):
+        level = 1 + (LEVELS - 1) * b // top if top else LEVELS
+        # from pale yellow to deep red, with white text on the darker half
+        rules.append(
+            ".b{:d} {{ background: hsl({:d}, 100%, {:d}%);{:} }}".format(
+                b,
+                60 - 60 * level // LEVELS,
+                95 - 50 * level // LEVELS,
+                " color: white;" if level > LEVELS // 2 else "",
+            )
+        )
+    with open(path, "wt", encoding="utf-8") as file:
+        file.write("\n".join(rules) + "\n")
+
+
+def writeHead(file, title):
+    file.write(
+        "<!DOCTYPE html>\n<html><head><meta charset='utf-8'>"
+        "<title>{:}</title><link rel='stylesheet' href='{:}'></head><body>\n"
+        "<h1>{:}</h1>\n".format(escape(title), STYLESHEET, escape(title))
+    )
+
+
+def writeModulePage(path, filename, lineCounts, wanted=()):
+    """render filename with the counts of its lines. Returns the number of
+    executable lines, and the text of the lines in wanted by number."""
+    executable = {}
+    wantedText = {}
+
+    with open(path, "wt", encoding="utf-8") as page:
+        writeHead(page, filename)
+        page.write("<p><a href='{:}'>index</a></p>\n".format(INDEX))
+        page.write("<table class='src'>\n")
+        try:
+            source = tokenize.open(filename)
+        except (OSError, SyntaxError):
+            page.write("</table><p>source not available</p>\n")
+        else:
+            try:
+                executable = trace._find_executable_linenos(filename)
+            except (SyntaxError, UnicodeDecodeError):
+                pass
+            with source:
+                for lineno, line in enumerate(source, 1):
+                    line = line.rstrip("\r\n")
+                    count = lineCounts.get(lineno, 0)
+                    if lineno in wanted:
+                        wantedText[lineno] = line.strip()
+                    if count:
+                        css, label = shade(count), "{:d}".format(count)
+                    elif lineno in executable:
+                        css, label = "miss", "&gt;" * 6
+                    else:
+                        css, label = "", ""
+                    page.write(
+                        "<tr id='L{0:d}' class='{1:}'><td class='n'>{0:d}</td>"
+                        "<td class='n'>{2:}</td><td>{3:}</td></tr>\n".format(
+                            lineno, css, label, escape(line)
+                        )
+                    )
+            page.write("</table>\n")
+        page.write("</body></html>\n")
+
+    return len(executable), wantedText
+
+
+def writeIndex(path, title, hottest, modules, lineText):
+    """hottest: [((filename, lineno), count)], modules: [(filename, hit
+    lines, executable lines, total count, max count)]"""
+    with open(path, "wt", encoding="utf-8") as page:
+        writeHead(page, title)
+
+        page.write(
+            "<h2>Hottest lines</h2>\n<table>\n"
+            "<tr><th>count</th><th>module</th><th>line</th><th></th></tr>\n"
+        )
+        for (filename, lineno), count in hottest:
+            page.write(
+                "<tr><td class='n {:}'>{:d}</td><td>{:}</td>"
+                "<td class='n'><a href='{:}#L{:d}'>{:d}</a></td>"
+                "<td><pre>{:}</pre></td></tr>\n".format(
+                    shade(count),
+                    count,
+                    escape(trace._fullmodname(filename)),
+                    pageName(filename),
+                    lineno,
+                    lineno,
+                    escape(lineText.get((filename, lineno), "")),
+                )
+            )
+        page.write("</table>\n")
+
+        page.write(
+            "<h2>Modules</h2>\n<table>\n"
+            "<tr><th>total</th><th>hottest</th><th>lines</th><th>cov%</th>"
+            "<th>module</th><th>path</th></tr>\n"
+        )
+        for filename, hit, executable, total, peak in modules:
+            page.write(
+                "<tr><td class='n'>{:d}</td><td class='n {:}'>{:d}</td>"
+                "<td class='n'>{:d}</td><td class='n'>{:}</td>"
+                "<td><a href='{:}'>{:}</a></td><td>{:}</td></tr>\n".format(
+                    total,
+                    shade(peak),
+                    peak,
+                    hit,
+                    (
+                        "{:d}".format(100 * hit // executable)
+                        if executable
+                        else "-"
+                    ),
+                    pageName(filename),
+                    escape(trace._fullmodname(filename)),
+                    escape(filename),
+                )
+            )
+        page.write("</table>\n</body></html>\n")
+
+
+def render(countFile, outDir, top=TOP_LINES):
+    """render the counts in countFile to outDir, skipping the module pages
+    that are up to date. Returns the path of the index page."""
+    counts = loadCounts(countFile)
+    os.makedirs(outDir, exist_ok=True)
+
+    # <string>, <frozen ...> and the like have no source to show
+    hottest = heapq.nlargest(
+        top,
+        (item for item in counts.items() if not item[0][0].startswith("<")),
+        key=lambda item: item[1],
+    )
+
+    wantedByFile = {}
+    for (filename, lineno), _ in hottest:
+        wantedByFile.setdefault(filename, set()).add(lineno)
+
+    manifest = Manifest(os.path.join(outDir, MANIFEST))
+    lineText = {}
+    modules = []
+    for filename, lineCounts in groupByFile(counts).items():
+        if filename.startswith("<"):
+            continue
+        wanted = wantedByFile.get(filename, ())
+        path = os.path.join(outDir, pageName(filename))
+        digest = countsDigest(lineCounts)
+        if manifest.stale(filename, digest, path):
+            executable, text = writeModulePage(
+                path, filename, lineCounts, wanted
+            )
+            manifest.update(filename, digest, executable=executable)
+        else:
+            executable = manifest.entries[filename]["executable"]
+            text = {
+                lineno: linecache.getline(filename, lineno).strip()
+                for lineno in wanted
+            }
+        lineText.update(((filename, lineno), t) for lineno, t in text.items())
+        modules.append(
+            (
+                filename,
+                len(lineCounts),
+                executable,
+                sum(lineCounts.values()),
+                max(lineCounts.values()),
+            )
+        )
+
+    manifest.save()
+    modules.sort(key=lambda module: module[3], reverse=True)
+
+    writeStyle(
+        os.path.join(outDir, STYLESHEET), hottest[0][1] if hottest else 0
+    )
+
+    index = os.path.join(outDir, INDEX)
+    writeIndex(
+        index,
+        "Heatmap of {:}".format(os.path.basename(countFile)),
+        hottest,
+        modules,
+        lineText,
+    )
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="render a trace counts file as HTML heatmaps"
+    )
+    parser.add_argument("-f", "--file", required=True, help="counts file")
+    parser.add_argument(
+        "-C", "--coverdir", help="output directory, by default next to --file"
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=TOP_LINES,
+        help="number of lines ranked on the index page",
+    )
+    opts = parser.parse_args(argv)
+
+    outDir = opts.coverdir or os.path.join(
+        os.path.dirname(opts.file), "heatmap"
+    )
+    try:
+        index = render(opts.file, outDir, opts.top)
+    except (OSError, EOFError, pickle.UnpicklingError) as err:
+        sys.exit("Cannot read counts file {!r}: {:}".format(opts.file, err))
+    print("heatmap written to {:}".format(index))
+
+
+if __name__ == "__main__":
+    main()
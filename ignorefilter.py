@@ -0,0 +1,101 @@
+import os
+import trace
+
+"""
+Jinpeng Zhai
+Decides which code is traced, given the --ignore-module and --ignore-dir lists
+that traceGUI passes: ignore.txt holds well over a hundred modules, and the
+directories default to all of sys.path. trace checks every new frame against
+these, scanning the module list for package prefixes and the directory list
+for path prefixes, and only caches by module name.
+
+Here the modules are a set and the directories a trie of path components, so
+judging a new file costs one lookup per dotted part of its module name and
+one per component of its path. The verdict is then cached per file and per
+code object, so every later call into the same code costs one dict lookup.
+The rules are those of trace._Ignore.
+"""
+
+LEAF = None  # key marking the end of an ignored directory in the trie
+
+
+class IgnoreFilter:
+    def __init__(self, modules=(), dirs=()):
+        self.modules = frozenset(modules)
+        self.trie = {}
+        for d in dirs:
+            node = self.trie
+            for part in os.path.normpath(d).split(os.sep):
+                node = node.setdefault(part, {})
+            node[LEAF] = True
+
+        self.files = {"<string>": True}  # filename -> ignored
+        self.verdicts = {}  # code -> traced
+        self.hits = 0
+        self.misses = 0
+        self.fileMisses = 0
+
+    def ignoredModule(self, modulename):
+        # "Spam" must also ignore "Spam.Eggs", but not "Spammer"
+        parts = modulename.split(".")
+        return any(
+            ".".join(parts[:i]) in self.modules
+            for i in range(1, len(parts) + 1)
+        )
+
+    def ignoredDir(self, filename):
+        # only a proper parent directory counts, not the file itself
+        node = self.trie
+        for part in filename.split(os.sep)[:-1]:
+            node = node.get(part)
+            if node is None:
+                return False
+            if LEAF in node:
+                return True
+        return False
+
+    def ignored(self, filename):
+        """whether code from filename, a module's __file__, is ignored"""
+        verdict = self.files.get(filename)
+        if verdict is None:
+            self.fileMisses += 1
+            modulename = trace._modname(filename)
+            verdict = self.ignoredModule(modulename) or self.ignoredDir(
+                filename
+            )
+            self.files[filename] = verdict
+        return verdict
+
+    def traced(self, code, filename):
+        """whether code, from the module whose __file__ is filename, is
+        traced. Code without a file is not."""
+        verdict = self.verdicts.get(code)
+        if verdict is None:
+            self.misses += 1
+            verdict = bool(filename) and not self.ignored(filename)
+            self.verdicts[code] = verdict
+        else:
+            self.hits += 1
+        return verdict
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return (
+            "ignore filter: {:d} lookups, {:d} hits ({:.1f}%), {:d} code "
+            "objects, {:d} files judged, {:d} modules and {:d} directories "
+            "ignored".format(
+                lookups,
+                self.hits,
+                100 * self.hits / lookups if lookups else 0,
+                self.misses,
+                self.fileMisses,
+                len(self.modules),
+                countLeaves(self.trie),
+            )
+        )
+
+
+def countLeaves(node):
+    return sum(
+        1 if key is LEAF else countLeaves(child) for key, child in node.items()
+    )
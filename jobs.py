@@ -0,0 +1,363 @@
+import os
+import sys
+import threading
+import subprocess as sp
+from time import perf_counter, sleep
+from platform import system
+
+import psutil
+
+from readers import ThreadReader, FileHandlerReader, canHandleFiles
+from cache import stageKey
+from tee import TeeWriter
+
+"""
+Jinpeng Zhai
+Runs each tool invocation of a GUI as its own process, instead of typing
+command lines into the interactive shell. Jobs may depend on earlier jobs,
+and are started as soon as these have exited successfully. For every job,
+the exit status, wall time, CPU time and peak resident memory are recorded
+and reported once it ends; its output goes to the console queues as usual.
+
+Jobs given an ArtifactCache are skipped when the cache holds their outputs
+for the same key, see cache.py. Inputs that take long to digest, like the
+source tree, are given as functions and digested on a thread of their own
+once the job is due, so that the event loop carries on meanwhile.
+"""
+
+POLL_INTERVAL = 50  # ms between checks on running jobs
+DRAIN_TIMEOUT = 2.0  # seconds to wait for the output of an exited job
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+KILLED = "killed"
+
+
+def python(*args):
+    """argument list running the Python interpreter the GUI runs under"""
+    return [sys.executable] + list(args)
+
+
+class Job:
+    def __init__(
+        self,
+        name,
+        args,
+        after=(),
+        cwd=None,
+        tee=None,
+        onUpdate=None,
+        outputs=(),
+        inputs=(),
+        cache=None,
+    ):
+        """
+        name    : label for the job in reports
+        args    : argument list, as for subprocess.Popen
+        after   : jobs that must have finished successfully before this starts
+        cwd     : working directory
+        tee     : path of a file that also receives the job's output, see
+                  tee.py
+        onUpdate: called with the job whenever its status changes
+        outputs : paths of the files the job produces
+        inputs  : digests of whatever else the outputs depend on, or
+                  functions returning them, e.g. of the source tree. The
+                  keys of the jobs in after are added to them.
+        cache   : ArtifactCache to take the outputs from, and put them in
+        """
+        self.name = name
+        self.args = [str(arg) for arg in args]
+        self.after = tuple(after)
+        self.cwd = cwd
+        self.tee = tee
+        self.onUpdate = onUpdate
+        self.outputs = tuple(outputs)
+        self.cache = cache
+        self.inputs = tuple(inputs)
+
+        self.key = None  # made once the jobs in after are done
+        self.keyThread = None  # digesting the inputs given as functions
+        self.cached = False
+
+        self.status = PENDING
+        self.p = None
+        self.readers = ()
+        self.teeFile = None
+
+        self.returncode = None
+        self.startTime = None
+        self.endTime = None
+        self.cpuTime = None  # seconds, user + system
+        self.peakRSS = None  # bytes
+
+    def makeKey(self):
+        depKeys = tuple(dep.key for dep in self.after)
+        if None in depKeys or not (self.inputs or depKeys):
+            self.key = None  # what this job reads is not known
+            return
+        try:
+            inputs = tuple(
+                digest() if callable(digest) else digest
+                for digest in self.inputs
+            )
+        except OSError:
+            self.key = None
+            return
+        self.key = stageKey(
+            self.args,
+            self.outputs + tuple(o for dep in self.after for o in dep.outputs),
+            inputs + depKeys,
+        )
+
+    @property
+    def wallTime(self):
+        if self.startTime is None or self.endTime is None:
+            return None
+        return self.endTime - self.startTime
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, SKIPPED, KILLED)
+
+    def summary(self):
+        if self.status in (SKIPPED, PENDING):
+            return "{:}: {:}".format(self.name, self.status)
+        if self.cached:
+            return "{:}: {:}, from cache".format(self.name, self.status)
+
+        return (
+            "{:}: {:}, exit {:}, wall {:.3f} s, cpu {:}, peak rss {:}".format(
+                self.name,
+                self.status,
+                self.returncode,
+                self.wallTime,
+                (
+                    "-"
+                    if self.cpuTime is None
+                    else "{:.3f} s".format(self.cpuTime)
+                ),
+                (
+                    "-"
+                    if self.peakRSS is None
+                    else "{:.1f} MiB".format(self.peakRSS / 1024**2)
+                ),
+            )
+        )
+
+
+class Scheduler:
+    def __init__(
+        self, outQueue, errQueue, widget=None, notify=None, report=None
+    ):
+        """
+        outQueue, errQueue  : queues receiving the output of every job
+        widget, notify      : as for Supervisor. If a widget is given, the
+                              scheduler also polls itself from its event loop.
+        report              : called with Job.summary() as each job finishes
+        """
+        self.outQueue = outQueue
+        self.errQueue = errQueue
+        self.widget = widget
+        self.notify = notify
+        self.report = report
+
+        self.jobs = []  # jobs not yet finished, in order of submission
+        self.pollJob = None
+
+    def submit(self, *jobs):
+        self.jobs.extend(jobs)
+        for job in jobs:
+            if job.onUpdate is not None:
+                job.onUpdate(job)
+        self.poll()
+        return jobs
+
+    def launch(self, job):
+        if (
+            job.cache is not None
+            and job.key is not None
+            and job.cache.restore(job.key, job.outputs)
+        ):
+            job.startTime = job.endTime = perf_counter()
+            job.cached = True
+            job.status = DONE
+            self.finish(job)
+            return
+
+        if job.tee is not None:
+            job.teeFile = TeeWriter(job.tee, job.name)
+
+        job.startTime = perf_counter()
+        try:
+            job.p = sp.Popen(
+                job.args,
+                cwd=job.cwd,
+                stdin=sp.DEVNULL,
+                stdout=sp.PIPE,
+                stderr=sp.PIPE,
+            )
+        except OSError as e:  # e.g. the executable is not installed
+            job.endTime = perf_counter()
+            job.status = FAILED
+            message = "{:}: {:}\n".format(job.name, e)
+            self.errQueue.put(message)
+            if job.teeFile is not None:
+                job.teeFile.write("stderr", message.encode())
+            self.finish(job)
+            return
+
+        job.status = RUNNING
+        if job.onUpdate is not None:
+            job.onUpdate(job)
+        if self.report is not None:
+            self.report("{:} started: {:}".format(job.name, " ".join(job.args)))
+
+        pipes = (
+            (job.p.stdout, self.outQueue, "stdout"),
+            (job.p.stderr, self.errQueue, "stderr"),
+        )
+        if self.widget is not None and canHandleFiles(self.widget):
+            job.readers = tuple(
+                FileHandlerReader(
+                    pipe, q, self.notify, self.widget, self.teeChannel(job, s)
+                )
+                for pipe, q, s in pipes
+            )
+        else:
+            job.readers = tuple(
+                ThreadReader(pipe, q, self.teeChannel(job, s))
+                for pipe, q, s in pipes
+            )
+
+    @staticmethod
+    def teeChannel(job, stream):
+        return None if job.teeFile is None else job.teeFile.channel(stream)
+
+    def reap(self, job):
+        """check whether a running job has exited, and if so collect its exit
+        status and resource usage. Returns whether it has exited."""
+        if system() == "Windows":
+            # there is no wait4(), so sample the process while it is alive.
+            try:
+                process = psutil.Process(job.p.pid)
+                times = process.cpu_times()
+                job.cpuTime = times.user + times.system
+                job.peakRSS = process.memory_info().peak_wset
+            except psutil.Error:
+                pass
+            if job.p.poll() is None:
+                return False
+        else:
+            try:
+                pid, status, usage = os.wait4(job.p.pid, os.WNOHANG)
+            except ChildProcessError:  # reaped elsewhere, usage is lost
+                job.p.poll()
+            else:
+                if pid == 0:
+                    return False
+                job.p.returncode = os.waitstatus_to_exitcode(status)
+                job.cpuTime = usage.ru_utime + usage.ru_stime
+                # kilobytes on Linux, bytes on macOS
+                job.peakRSS = usage.ru_maxrss * (
+                    1 if sys.platform == "darwin" else 1024
+                )
+
+        job.endTime = perf_counter()
+        job.returncode = job.p.returncode
+        if job.status == RUNNING:
+            job.status = DONE if job.returncode == 0 else FAILED
+        return True
+
+    def finish(self, job):
+        # the job has exited, so its readers are at or near EOF. Should it
+        # have left a child holding the pipes open, these are left to it.
+        if all([reader.stop(DRAIN_TIMEOUT) for reader in job.readers]):
+            if job.p is not None:
+                for pipe in (job.p.stdout, job.p.stderr):
+                    pipe.close()
+        if job.teeFile is not None:
+            job.teeFile.close()
+            job.teeFile = None
+
+        if (
+            job.status == DONE
+            and not job.cached
+            and job.cache is not None
+            and job.key is not None
+        ):
+            job.cache.store(job.key, job.outputs)
+
+        if job.onUpdate is not None:
+            job.onUpdate(job)
+        if self.report is not None:
+            self.report(job.summary())
+
+    def poll(self):
+        """reap finished jobs and start those whose dependencies are met.
+        Returns whether any job is still pending or running."""
+        if self.pollJob is not None:
+            self.widget.after_cancel(self.pollJob)
+            self.pollJob = None
+
+        for job in self.jobs:
+            if job.status == RUNNING and self.reap(job):
+                self.finish(job)
+
+        for job in self.jobs:
+            if job.status != PENDING:
+                continue
+            if any(
+                dep.status in (FAILED, SKIPPED, KILLED) for dep in job.after
+            ):
+                job.status = SKIPPED
+                self.finish(job)
+            elif all(dep.status == DONE for dep in job.after):
+                if job.key is None and job.keyThread is None:
+                    if any(callable(digest) for digest in job.inputs):
+                        job.keyThread = threading.Thread(
+                            target=job.makeKey, daemon=True
+                        )
+                        job.keyThread.start()
+                    else:
+                        job.makeKey()
+                if job.keyThread is None or not job.keyThread.is_alive():
+                    self.launch(job)
+
+        self.jobs = [job for job in self.jobs if not job.finished]
+
+        if self.jobs and self.widget is not None and self.pollJob is None:
+            self.pollJob = self.widget.after(POLL_INTERVAL, self.poll)
+
+        return bool(self.jobs)
+
+    def wait(self):
+        """block until every job has finished, for use without an event loop"""
+        while self.poll():
+            sleep(POLL_INTERVAL / 1000)
+
+    def stop(self):
+        """kill every running job and skip the pending ones"""
+        if self.pollJob is not None:
+            self.widget.after_cancel(self.pollJob)
+            self.pollJob = None
+
+        for job in self.jobs:
+            if job.status == RUNNING:
+                job.status = KILLED
+                try:
+                    process = psutil.Process(job.p.pid)
+                    for childProcess in process.children(recursive=True):
+                        childProcess.kill()
+                    process.kill()
+                except psutil.NoSuchProcess:
+                    pass
+                job.p.wait()
+                self.reap(job)
+            elif job.status == PENDING:
+                job.status = SKIPPED
+            self.finish(job)
+
+        self.jobs = []
@@ -0,0 +1,65 @@
+import os
+import json
+import hashlib
+
+"""
+Jinpeng Zhai
+Record of what each per-module report (.cover file, heatmap page) was last
+written from: a digest of the module's counts, the mtime and size of its
+source, and whatever options shaped the output. Reports whose record still
+matches, and whose output is still there, need not be written again.
+"""
+
+
+def groupByFile(counts):
+    """{(filename, lineno): count} -> {filename: {lineno: count}}"""
+    files = {}
+    for (filename, lineno), count in counts.items():
+        files.setdefault(filename, {})[lineno] = count
+    return files
+
+
+def countsDigest(lineCounts):
+    return hashlib.sha1(repr(sorted(lineCounts.items())).encode()).hexdigest()
+
+
+def sourceState(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "rt") as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def key(self, filename, digest, options):
+        # a list, as that is what the key is read back from JSON as
+        return [digest, sourceState(filename), list(options)]
+
+    def stale(self, filename, digest, output, options=()):
+        """whether output, the report on filename, must be written again"""
+        entry = self.entries.get(filename)
+        return (
+            entry is None
+            or entry["key"] != self.key(filename, digest, options)
+            or not os.path.exists(output)
+        )
+
+    def update(self, filename, digest, options=(), **data):
+        """record that the report on filename is up to date, along with any
+        data that is needed later without writing the report again"""
+        self.entries[filename] = dict(
+            data, key=self.key(filename, digest, options)
+        )
+
+    def save(self):
+        with open(self.path, "wt") as file:
+            json.dump(self.entries, file)
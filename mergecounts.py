@@ -0,0 +1,162 @@
+import os
+import sys
+import pickle
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from countstore import CountStore, isStore, loadCounts
+
+"""
+Jinpeng Zhai
+Merges the count files of many runs, e.g. of the same target over a test
+matrix, into one. The files are reduced as a tree on a process pool: each
+worker first loads one run, then pairs of partial results are merged level
+by level, so N runs take about log2(N) rounds instead of N serial merges.
+Partial results are passed between workers as files in a scratch directory.
+
+Alongside the merged totals, the contribution of each run is reported: the
+lines and hits it recorded, its share of all hits, and the lines no other run
+reached. The inputs and the output may be count stores or trace pickles.
+"""
+
+SHARED = -1  # owner of a line that more than one run reached
+
+
+def dump(path, counts):
+    with open(path, "wb") as file:
+        pickle.dump(counts, file, pickle.HIGHEST_PROTOCOL)
+
+
+def load(path):
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def leaf(run, path, outPath):
+    """load one run as {(filename, lineno): (count, run)}. Returns the
+    lines and hits of the run."""
+    counts = loadCounts(path)
+    dump(outPath, {key: (count, run) for key, count in counts.items()})
+    return len(counts), sum(counts.values())
+
+
+def node(pathA, pathB, outPath):
+    """merge two partial results into one"""
+    merged = load(pathA)
+    for key, (count, owner) in load(pathB).items():
+        if key in merged:
+            merged[key] = (merged[key][0] + count, SHARED)
+        else:
+            merged[key] = (count, owner)
+    dump(outPath, merged)
+    os.remove(pathA)
+    os.remove(pathB)
+
+
+def merge(paths, outPath, workers=None):
+    """merge the count files at paths into outPath. Returns the merged
+    counts and, per run, (path, lines, hits, lines only it reached)."""
+    scratch = tempfile.mkdtemp(prefix="merge_")
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            partials = [
+                os.path.join(scratch, "{:d}_0".format(run))
+                for run in range(len(paths))
+            ]
+            stats = list(pool.map(leaf, range(len(paths)), paths, partials))
+
+            level = 0
+            while len(partials) > 1:
+                level += 1
+                pairs = list(zip(partials[0::2], partials[1::2]))
+                merged = [
+                    os.path.join(scratch, "{:d}_{:d}".format(i, level))
+                    for i in range(len(pairs))
+                ]
+                # an odd one out goes up a level as it is
+                odd = partials[-1:] if len(partials) % 2 else []
+                list(
+                    pool.map(
+                        node,
+                        [a for a, _ in pairs],
+                        [b for _, b in pairs],
+                        merged,
+                    )
+                )
+                partials = merged + odd
+
+        result = load(partials[0]) if partials else {}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    counts = {key: count for key, (count, _) in result.items()}
+    unique = [0] * len(paths)
+    for _, owner in result.values():
+        if owner != SHARED:
+            unique[owner] += 1
+
+    if isStore(outPath):
+        if os.path.exists(outPath):
+            os.remove(outPath)
+        with CountStore(outPath) as store:
+            store.add(counts)
+    else:
+        with open(outPath, "wb") as file:
+            pickle.dump((counts, {}, {}), file, 1)  # as trace does
+
+    return counts, [
+        (path, lines, hits, only)
+        for path, (lines, hits), only in zip(paths, stats, unique)
+    ]
+
+
+def report(counts, runs):
+    total = sum(counts.values())
+    lines = [
+        "{:>10} {:>14} {:>7} {:>10}  run".format(
+            "lines", "hits", "share", "only"
+        )
+    ]
+    for path, runLines, hits, only in runs:
+        lines.append(
+            "{:>10d} {:>14d} {:>6.1f}% {:>10d}  {:}".format(
+                runLines, hits, 100 * hits / total if total else 0, only, path
+            )
+        )
+    lines.append(
+        "{:>10d} {:>14d} {:>6.1f}% {:>10}  merged, {:d} files".format(
+            len(counts),
+            total,
+            100.0,
+            "",
+            len({filename for filename, _ in counts}),
+        )
+    )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="merge the count files of many runs into one"
+    )
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="worker processes, by default one per cpu",
+    )
+    parser.add_argument("inputs", nargs="+")
+    opts = parser.parse_args(argv)
+
+    try:
+        counts, runs = merge(opts.inputs, opts.output, opts.jobs)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError) as err:
+        sys.exit("Cannot merge count files: {:}".format(err))
+    print(report(counts, runs))
+
+
+if __name__ == "__main__":
+    main()
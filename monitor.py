@@ -0,0 +1,718 @@
+import io
+import os
+import sys
+import trace
+import linecache
+import argparse
+import pickle
+import sysconfig
+import threading
+import types
+from time import perf_counter_ns
+from functools import partial
+
+from countstore import CountStore, isStore, loadCounts
+from ignorefilter import IgnoreFilter
+from sampler import CLOCKS, INTERVAL, Sampler, isSamples, samplesPath
+from eventlog import EVENT_EXTENSION, EventWriter
+from childtrace import collect, inherit
+from manifest import Manifest, countsDigest, groupByFile
+
+"""
+Jinpeng Zhai
+Line counting backend for traceGUI on top of sys.monitoring (PEP 669), for
+Python 3.12 and later. Stands in for `python -m trace --count`, taking the
+same --file, --coverdir, --missing, --summary, --no-report and --ignore-*
+options, and writing its results through trace.CoverageResults, so that the
+count file and the .cover reports are interchangeable with those of trace.
+
+Instead of a trace function being called for every line of every frame, each
+code object is looked at once when it first starts. Code in ignored modules
+or directories is left alone from then on, and only the rest has its LINE
+events enabled. With --coverage-only each line is switched off again after
+its first hit, so covered code runs at close to full speed; otherwise every
+hit is counted to produce a heatmap.
+
+On interpreters without sys.monitoring, trace's own counter is used instead.
+Either way, what to ignore is decided by ignorefilter.IgnoreFilter, once per
+code object, and --filter-stats shows how that went.
+
+A --file with the count store extension is added to in place, see
+countstore.py, and only the modules this run touched are reported on. With
+--report, the counts in --file are reported on without running anything.
+
+With --sample, the target is not traced at all but sampled every so often,
+see sampler.py, and the counts are of samples rather than executions. They
+go to the samples file that goes with --file, never into --file itself, and
+counting executions into a samples file is refused.
+
+With --line-time, the time between one line event and the next is also put
+down to the first line, less the time the counter itself takes, which is
+measured before the run. The result goes next to the .cover files as a table
+of the lines by time, and as a count file of microseconds that heatmap.py can
+render. Time spent in ignored code goes to the line that called it.
+
+With --trace, every line event is also written to a binary event log, see
+eventlog.py, instead of being printed. --timing is accepted for the sake of
+trace's options, as the log always has the time of each event.
+
+With --children, the child processes of the target count as well, e.g. the
+workers of a multiprocessing pool, and their counts are added to the run's
+when it is done, see childtrace.py.
+
+In a --coverdir, .cover files are only rewritten when the counts or source of
+their module have changed since they were last written, see CoverReport.
+"""
+
+TOOL_ID = 3  # sys.monitoring.COVERAGE_ID
+COVER_MANIFEST = "cover_manifest.json"
+TIME_TABLE = "line_times.txt"
+TIME_COUNTS = "line_times.file"  # microseconds per line, as trace's pickle
+CALIBRATION_RUNS = 100
+FAR_LINES = 127  # on 3.12, lines further below the start of their code
+# object are looked up by scanning its line table on every LINE event.
+# Stand-ins for lines that take no time, to calibrate LineTimer with.
+IDLE = compile("x = 0\n" * 50, "<calibration>", "exec")
+IDLE_LOOP = compile("for _ in range(25):\n    x = 0\n", "<calibration>", "exec")
+IDLE_FAR = compile("x = 0\n" * 500, "<calibration>", "exec")
+
+
+class LineCounter:
+    def __init__(self, ignoreModules=(), ignoreDirs=(), coverageOnly=False):
+        self.ignore = IgnoreFilter(ignoreModules, ignoreDirs)
+        self.coverageOnly = coverageOnly
+        self.counts = {}  # (filename, lineno) -> hits, as in trace
+        self.lineTables = {}  # code -> {offset: lineno}
+
+    def start(self):
+        monitoring = sys.monitoring
+        monitoring.use_tool_id(TOOL_ID, "pyHeatTrace")
+        monitoring.register_callback(
+            TOOL_ID, monitoring.events.PY_START, self.onStart
+        )
+        monitoring.register_callback(
+            TOOL_ID,
+            monitoring.events.LINE,
+            self.onLineCoverage if self.coverageOnly else self.onLine,
+        )
+        if not self.coverageOnly:
+            monitoring.register_callback(
+                TOOL_ID, monitoring.events.JUMP, self.onJump
+            )
+        monitoring.set_events(TOOL_ID, monitoring.events.PY_START)
+
+    def stop(self):
+        monitoring = sys.monitoring
+        monitoring.set_events(TOOL_ID, 0)
+        monitoring.register_callback(TOOL_ID, monitoring.events.PY_START, None)
+        for event in (monitoring.events.LINE, monitoring.events.JUMP):
+            monitoring.register_callback(TOOL_ID, event, None)
+        monitoring.free_tool_id(TOOL_ID)
+
+    def onStart(self, code, offset):
+        # like trace, judge code by the __file__ of its module, which frozen
+        # modules do not have. The frame that is starting is our caller.
+        filename = sys._getframe(1).f_globals.get("__file__")
+        # this module's own code, e.g. stop(), is not part of the run.
+        if filename != __file__ and self.ignore.traced(code, filename):
+            events = sys.monitoring.events
+            sys.monitoring.set_local_events(
+                TOOL_ID,
+                code,
+                (
+                    events.LINE
+                    if self.coverageOnly
+                    else events.LINE | events.JUMP
+                ),
+            )
+        # either way this code object has been dealt with for good.
+        return sys.monitoring.DISABLE
+
+    def onLine(self, code, lineno):
+        key = (code.co_filename, lineno)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def lineOf(self, code, offset):
+        if code not in self.lineTables:
+            self.lineTables[code] = {
+                i: lineno
+                for start, end, lineno in code.co_lines()
+                for i in range(start, end, 2)
+            }
+        return self.lineTables[code].get(offset)
+
+    def onJump(self, code, source, destination):
+        # LINE only fires when the line changes, whereas trace also counts a
+        # line each time a loop jumps back into it, e.g. in comprehensions.
+        if destination < source:
+            lineno = self.lineOf(code, destination)
+            if lineno is not None and lineno == self.lineOf(code, source):
+                self.onLine(code, lineno)
+
+    def onLineCoverage(self, code, lineno):
+        self.counts[(code.co_filename, lineno)] = 1
+        return sys.monitoring.DISABLE
+
+
+class FilteredTrace(trace.Trace):
+    """trace.Trace that asks an IgnoreFilter whether to trace a call"""
+
+    def __init__(self, ignore, **kwargs):
+        super().__init__(**kwargs)
+        self.ignore = ignore
+
+    def globaltrace_lt(self, frame, why, arg):
+        if why == "call" and self.ignore.traced(
+            frame.f_code, frame.f_globals.get("__file__")
+        ):
+            return self.localtrace
+        return None
+
+
+class LineTimer(LineCounter):
+    """LineCounter that also times each line, by the perf_counter_ns between
+    its LINE event and the next one, which is then the line's time plus the
+    overhead of the callbacks in between. That overhead is measured before
+    the run on the IDLE code objects and taken off every interval:
+
+    - a constant per LINE event;
+    - per jump that does not count as a line, its callback's own time plus
+      the cost of calling it;
+    - per LINE event on a line past FAR_LINES, the cost of looking up its
+      line number, which grows with its offset in the code object.
+    """
+
+    def __init__(self, ignoreModules=(), ignoreDirs=(), coverageOnly=False):
+        super().__init__(ignoreModules, ignoreDirs, False)
+        self.times = {}  # (filename, lineno) -> ns
+        self.last = None
+        self.then = 0
+        self.overhead = 0
+        self.jumpOverhead = 0
+        self.lookupSlope = 0.0  # ns per code unit of offset
+        self.lookups = {}  # code -> {lineno: ns}
+
+    def start(self):
+        super().start()
+        events = sys.monitoring.events
+        self.overhead = self.calibrate(IDLE, events.LINE)
+        # two lines and a jump back per loop
+        self.jumpOverhead = max(
+            0, 2 * self.calibrate(IDLE_LOOP, events.LINE | events.JUMP)
+        )
+        farLines = {
+            lineno: offset
+            for lineno, offset in firstOffsets(IDLE_FAR).items()
+            if lineno - IDLE_FAR.co_firstlineno > FAR_LINES
+        }
+        self.lookupSlope = max(
+            0.0,
+            self.calibrate(IDLE_FAR, events.LINE, farLines)
+            * len(farLines)
+            / sum(farLines.values()),
+        )
+        self.lookups.clear()
+
+    def stop(self):
+        self.onTime(perf_counter_ns())
+        super().stop()
+
+    def calibrate(self, code, events, lines=None):
+        """least mean time per LINE event on code, or on the given lines of
+        it, over a few runs. Overhead already known is not included."""
+        monitoring = sys.monitoring
+        monitoring.set_local_events(TOOL_ID, code, events)
+        best = None
+        for _ in range(CALIBRATION_RUNS):
+            self.last = None
+            exec(code, {})
+            self.onTime(perf_counter_ns())
+            hits = spent = 0
+            for key in [
+                key for key in self.counts if key[0] == code.co_filename
+            ]:
+                if lines is None or key[1] in lines:
+                    hits += self.counts[key]
+                    spent += self.times.get(key, 0)
+                del self.counts[key]
+                self.times.pop(key, None)
+            if hits and (best is None or spent / hits < best):
+                best = spent / hits
+        monitoring.set_local_events(TOOL_ID, code, 0)
+        return int(best or 0)
+
+    def lookup(self, code, lineno):
+        """cost of looking up lineno, a line past FAR_LINES in code"""
+        costs = self.lookups.get(code)
+        if costs is None:
+            costs = self.lookups[code] = {
+                line: int(self.lookupSlope * offset)
+                for line, offset in firstOffsets(code).items()
+            }
+        return costs.get(lineno, 0)
+
+    def onTime(self, now, lookup=0):
+        if self.last is not None:
+            self.times[self.last] = (
+                self.times.get(self.last, 0)
+                + now
+                - self.then
+                - self.overhead
+                - lookup
+            )
+        self.last = None
+
+    def onLine(self, code, lineno):
+        now = perf_counter_ns()
+        key = (code.co_filename, lineno)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        # the lookup for this event came before it, in the last interval
+        if lineno - code.co_firstlineno > FAR_LINES:
+            self.onTime(now, self.lookup(code, lineno))
+        else:
+            self.onTime(now)
+        self.last = key
+        self.then = perf_counter_ns()
+
+    def onJump(self, code, source, destination):
+        start, then = perf_counter_ns(), self.then
+        super().onJump(code, source, destination)
+        if self.then == then:  # not a line, so no new interval was started
+            self.then += perf_counter_ns() - start + self.jumpOverhead
+
+
+def firstOffsets(code):
+    """{lineno: offset of its first instruction} in code"""
+    offsets = {}
+    for start, _, lineno in code.co_lines():
+        if lineno is not None and lineno not in offsets:
+            offsets[lineno] = start
+    return offsets
+
+
+class EventRecorder(LineCounter):
+    """LineCounter that writes every line event to an EventWriter, and only
+    counts them as well if asked to"""
+
+    def __init__(self, log, ignoreModules=(), ignoreDirs=(), count=False):
+        super().__init__(ignoreModules, ignoreDirs, False)
+        self.log = log
+        self.write = log.write
+        self.count = count
+        # by filename rather than code, as code objects are hashed by value
+        self.fileIds = {}  # filename -> file id, shifted
+        self.threadIds = {}  # thread ident -> thread id, shifted
+        self.unnamed = {}  # the same, for threads still starting up
+
+    def stop(self):
+        super().stop()
+        self.log.close()
+
+    def onLine(self, code, lineno):
+        if self.count:
+            key = (code.co_filename, lineno)
+            self.counts[key] = self.counts.get(key, 0) + 1
+        filename = code.co_filename
+        fileId = self.fileIds.get(filename)
+        if fileId is None:
+            fileId = self.fileIds[filename] = self.log.intern(filename)
+        ident = threading.get_ident()
+        threadId = self.threadIds.get(ident)
+        if threadId is None:
+            threadId = self.threadId(ident, filename)
+        self.write(threadId | fileId | lineno)
+
+    def threadId(self, ident, filename):
+        # a new thread runs a few lines of threading.py before it is listed
+        # under its name, and current_thread() would list it as a dummy
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        threadId = self.unnamed.get(ident)
+        if threadId is None:
+            threadId = self.unnamed[ident] = self.log.thread(
+                names.get(ident, "thread {:d}".format(ident))
+            )
+        if ident in names or filename != threading.__file__:
+            self.log.rename(threadId, names.get(ident))
+            self.threadIds[ident] = self.unnamed.pop(ident)
+        return threadId
+
+
+def writeTimes(times, counts, outDir, overhead, jumpOverhead):
+    """write the lines by time as a table, and as microsecond counts"""
+    times = {key: ns for key, ns in times.items() if ns > 0}
+    with open(os.path.join(outDir, TIME_TABLE), "wt", encoding="utf-8") as file:
+        file.write(
+            "{:d} ns overhead taken off each line, {:d} ns off each jump\n".format(
+                overhead, jumpOverhead
+            )
+        )
+        file.write(
+            "{:>12} {:>6} {:>12} {:>12}  line\n".format(
+                "ms", "%", "hits", "ns/hit"
+            )
+        )
+        total = sum(times.values())
+        for (filename, lineno), ns in sorted(
+            times.items(), key=lambda item: item[1], reverse=True
+        ):
+            hits = counts.get((filename, lineno), 0)
+            file.write(
+                "{:>12.3f} {:>6.2f} {:>12d} {:>12.0f}  {:}:{:d}  {:}\n".format(
+                    ns / 1e6,
+                    100 * ns / total,
+                    hits,
+                    ns / hits if hits else 0,
+                    filename,
+                    lineno,
+                    linecache.getline(filename, lineno).strip(),
+                )
+            )
+    with open(os.path.join(outDir, TIME_COUNTS), "wb") as file:
+        micros = {key: ns // 1000 for key, ns in times.items() if ns >= 1000}
+        pickle.dump((micros, {}, {}), file, 1)
+
+
+class TraceCounter:
+    """the same on top of trace, for interpreters without sys.monitoring.
+    Every hit is counted, which is a superset of coverage."""
+
+    def __init__(self, ignoreModules=(), ignoreDirs=(), coverageOnly=False):
+        self.ignore = IgnoreFilter(ignoreModules, ignoreDirs)
+        self.tracer = FilteredTrace(self.ignore, count=1, trace=0)
+        self.counts = self.tracer.counts
+        # a builtin, so that stopping does not start a frame to be traced
+        self.stop = partial(sys.settrace, None)
+
+    def start(self):
+        sys.settrace(self.tracer.globaltrace)
+
+
+class CoverReport(trace.CoverageResults):
+    """CoverageResults that keeps a manifest in the coverdir, and only writes
+    the .cover files of modules whose counts, source or --missing setting
+    have changed. The summary covers the modules in summaryFiles, by default
+    all of those in counts."""
+
+    summaryFiles = None
+    written = None  # .cover path -> (hits, lines), while writing to coverdir
+
+    def write_results(self, show_missing=True, summary=False, coverdir=None):
+        if coverdir is None:  # .cover files next to the sources, as trace
+            return super().write_results(show_missing, summary, coverdir)
+
+        os.makedirs(coverdir, exist_ok=True)
+        manifest = Manifest(os.path.join(coverdir, COVER_MANIFEST))
+        options = (bool(show_missing),)
+
+        byFile = groupByFile(self.counts)
+        stale = {}
+        for filename, lineCounts in byFile.items():
+            digest = countsDigest(lineCounts)
+            if manifest.stale(
+                filename, digest, self.coverPath(filename, coverdir), options
+            ):
+                stale[filename] = digest
+
+        everything, outfile = self.counts, self.outfile
+        self.counts = {k: c for k, c in everything.items() if k[0] in stale}
+        self.outfile = None
+        self.written = {}
+        try:
+            super().write_results(show_missing, False, coverdir)
+        finally:
+            self.counts, self.outfile = everything, outfile
+
+        for filename, digest in stale.items():
+            written = self.written.get(self.coverPath(filename, coverdir))
+            if written is not None:
+                hits, lines = written
+                manifest.update(
+                    filename, digest, options, hits=hits, lines=lines
+                )
+        manifest.save()
+
+        if summary:
+            self.writeSummary(
+                manifest,
+                byFile if self.summaryFiles is None else self.summaryFiles,
+            )
+
+        if self.outfile:
+            try:
+                with open(self.outfile, "wb") as file:
+                    pickle.dump(
+                        (self.counts, self.calledfuncs, self.callers), file, 1
+                    )
+            except OSError as err:
+                print(
+                    "Can't save counts files because {:}".format(err),
+                    file=sys.stderr,
+                )
+
+    def write_results_file(self, path, lines, lnotab, lines_hit, encoding=None):
+        hits, n = super().write_results_file(
+            path, lines, lnotab, lines_hit, encoding
+        )
+        if self.written is not None:
+            self.written[path] = (hits, n)
+        return hits, n
+
+    @staticmethod
+    def coverPath(filename, coverdir):
+        return os.path.join(coverdir, trace._fullmodname(filename) + ".cover")
+
+    @staticmethod
+    def writeSummary(manifest, filenames):
+        sums = {}
+        for filename in filenames:
+            entry = manifest.entries.get(filename)
+            if entry and entry["lines"]:
+                modulename = trace._fullmodname(filename)
+                sums[modulename] = (
+                    entry["lines"],
+                    int(100 * entry["hits"] / entry["lines"]),
+                    modulename,
+                    filename,
+                )
+        if sums:
+            print("lines   cov%   module   (path)")
+            for modulename in sorted(sums):
+                print("%5d   %3d%%   %s   (%s)" % sums[modulename])
+
+
+def parseIgnoreDirs(values):
+    """--ignore-dir values, expanded the way trace does it"""
+    dirs = []
+    for value in values:
+        for s in value.split(os.pathsep):
+            s = os.path.expanduser(os.path.expandvars(s))
+            s = s.replace("$prefix", sysconfig.get_path("stdlib")).replace(
+                "$exec_prefix", sysconfig.get_path("platstdlib")
+            )
+            dirs.append(os.path.normpath(s))
+    return dirs
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(
+        description="count line executions with sys.monitoring"
+    )
+    parser.add_argument("-c", "--count", action="store_true")
+    parser.add_argument("-r", "--report", action="store_true")
+    parser.add_argument("-t", "--trace", action="store_true")
+    parser.add_argument("-g", "--timing", action="store_true")
+    parser.add_argument(
+        "--events",
+        help="event log for --trace, by default named after progname in "
+        "--coverdir",
+    )
+    parser.add_argument(
+        "--coverage-only",
+        action="store_true",
+        help="record whether each line ran, instead of how often",
+    )
+    parser.add_argument("-f", "--file")
+    parser.add_argument("-C", "--coverdir")
+    parser.add_argument("-m", "--missing", action="store_true")
+    parser.add_argument("-s", "--summary", action="store_true")
+    parser.add_argument("-R", "--no-report", action="store_true")
+    parser.add_argument("--ignore-module", action="append", default=[])
+    parser.add_argument("--ignore-dir", action="append", default=[])
+    parser.add_argument(
+        "--line-time",
+        action="store_true",
+        help="also time each line, see " + TIME_TABLE,
+    )
+    parser.add_argument(
+        "--sample",
+        nargs="?",
+        type=float,
+        const=1000 * INTERVAL,
+        metavar="MS",
+        help="sample the running line every MS milliseconds instead",
+    )
+    parser.add_argument(
+        "--sample-stack",
+        action="store_true",
+        help="also count the calling lines of each sample",
+    )
+    parser.add_argument(
+        "--sample-clock", choices=("cpu", "wall"), default="cpu"
+    )
+    parser.add_argument(
+        "--children",
+        action="store_true",
+        help="also count in the processes the target starts",
+    )
+    parser.add_argument(
+        "--filter-stats",
+        action="store_true",
+        help="print how often the ignore filter was consulted",
+    )
+    parser.add_argument("progname", nargs="?")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    return parser.parse_args(argv)
+
+
+def run(counter, progname, arguments):
+    """run the script at progname as __main__, as trace does, but in a
+    module of its own, so that a process spawned by multiprocessing finds
+    the script rather than this one as its parent's __main__"""
+    sys.argv = [progname, *arguments]
+    sys.path[0] = os.path.dirname(progname)
+
+    with io.open_code(progname) as file:
+        code = compile(file.read(), progname, "exec")
+    main = types.ModuleType("__main__")
+    main.__dict__.update(__file__=progname, __package__=None, __cached__=None)
+    globs = main.__dict__
+    own = sys.modules["__main__"]
+    sys.modules["__main__"] = main
+
+    counter.start()
+    try:
+        exec(code, globs, globs)
+    except SystemExit:
+        pass
+    finally:
+        counter.stop()
+        sys.modules["__main__"] = own
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    opts = parseArgs(argv)
+
+    if opts.report:
+        if not opts.file:
+            sys.exit("--report needs a count --file")
+        results = CoverReport(loadCounts(opts.file))
+        results.write_results(opts.missing, opts.summary, opts.coverdir)
+        return
+    if opts.progname is None:
+        sys.exit("progname is missing")
+
+    ignoreModules = [
+        mod.strip() for value in opts.ignore_module for mod in value.split(",")
+    ]
+    ignoreDirs = parseIgnoreDirs(opts.ignore_dir)
+    if opts.children and (
+        opts.sample is not None or opts.trace or opts.line_time
+    ):
+        sys.exit("--children only goes with counting")
+    if opts.file and opts.sample is not None and not isSamples(opts.file):
+        opts.file = samplesPath(opts.file)
+        print("samples are added to " + opts.file, file=sys.stderr)
+    elif opts.file and opts.sample is None and isSamples(opts.file):
+        sys.exit(
+            "{:} holds samples, count into another --file".format(opts.file)
+        )
+    if opts.sample is not None:
+        if opts.sample_clock not in CLOCKS:
+            sys.exit("--sample needs signal.setitimer, not available here")
+        counter = Sampler(
+            ignoreModules,
+            ignoreDirs,
+            opts.sample / 1000,
+            opts.sample_stack,
+            opts.sample_clock,
+            exclude=(__file__,),
+        )
+    elif opts.trace:
+        if not hasattr(sys, "monitoring"):
+            sys.exit("--trace needs sys.monitoring, Python 3.12 or later")
+        eventPath = opts.events or os.path.join(
+            opts.coverdir or os.getcwd(),
+            os.path.splitext(os.path.basename(opts.progname))[0]
+            + EVENT_EXTENSION,
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(eventPath)), exist_ok=True)
+        counter = EventRecorder(
+            EventWriter(eventPath), ignoreModules, ignoreDirs, opts.count
+        )
+    elif opts.line_time:
+        if not hasattr(sys, "monitoring"):
+            sys.exit("--line-time needs sys.monitoring, Python 3.12 or later")
+        counter = LineTimer(ignoreModules, ignoreDirs)
+    else:
+        counter = (LineCounter if hasattr(sys, "monitoring") else TraceCounter)(
+            ignoreModules, ignoreDirs, opts.coverage_only
+        )
+
+    shardDir = None
+    if opts.children:
+        shardDir = inherit(
+            counter, ignoreModules, ignoreDirs, opts.coverage_only
+        )
+    try:
+        run(counter, opts.progname, opts.arguments)
+    except OSError as err:
+        sys.exit("Cannot run file {!r} because: {:}".format(sys.argv[0], err))
+    if shardDir is not None:
+        childCounts, shards, missing = collect(shardDir)
+        for key, count in childCounts.items():
+            if opts.coverage_only:
+                counter.counts[key] = 1
+            else:
+                counter.counts[key] = counter.counts.get(key, 0) + count
+        print(
+            "{:d} lines counted in {:d} child processes".format(
+                len(childCounts), shards
+            ),
+            file=sys.stderr,
+        )
+        if missing:
+            print(
+                "no counts from child processes {:}, killed or still "
+                "running".format(", ".join(str(pid) for pid in missing)),
+                file=sys.stderr,
+            )
+    if opts.filter_stats:
+        print(counter.ignore.stats(), file=sys.stderr)
+    if opts.sample is not None:
+        print(counter.stats(), file=sys.stderr)
+    if opts.line_time and opts.sample is None:
+        outDir = opts.coverdir or os.getcwd()
+        os.makedirs(outDir, exist_ok=True)
+        writeTimes(
+            counter.times,
+            counter.counts,
+            outDir,
+            counter.overhead,
+            counter.jumpOverhead,
+        )
+
+    if opts.file and isStore(opts.file):
+        try:
+            store = CountStore(opts.file)
+        except OSError as err:  # as trace does when it cannot save its own
+            print(
+                "Can't save counts files because {:}".format(err),
+                file=sys.stderr,
+            )
+            results = CoverReport(counter.counts)
+        else:
+            with store:
+                store.add(counter.counts)
+                counts = store.toDict(
+                    {filename for filename, _ in counter.counts}
+                )
+                summaryFiles = store.filenames()
+            results = CoverReport(counts)
+            results.summaryFiles = summaryFiles
+    else:
+        results = CoverReport(
+            counter.counts, infile=opts.file, outfile=opts.file
+        )
+    if opts.trace:
+        print(
+            "{:d} events written to {:}".format(counter.log.count, eventPath),
+            file=sys.stderr,
+        )
+    if not opts.no_report and (opts.count or not opts.trace):
+        results.write_results(opts.missing, opts.summary, opts.coverdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import os
+import sys
+import pstats
+import shutil
+import argparse
+import tempfile
+from math import sqrt
+
+from profdiff import ProfileDiff, loadRuns
+from profilehistory import ProfileHistory
+from repeatprofile import RUNS_SUFFIX, repeat, summarize, tCritical
+
+"""
+Jinpeng Zhai
+Performance regression gate, for continuous integration: profiles a target
+as gprof2dotGUI does, without a display, compares the profile with a stored
+baseline and exits with PASS, FAIL or ERROR:
+
+    python perfgate.py --baseline base.pstats -n 5 main.py args...
+
+The target is run --runs times by repeatprofile.py and the profiles are
+matched to the baseline's by profdiff.py. A function is a regression when
+its time, --by tottime or cumtime, grew by more than --threshold percent of
+its baseline and by more than --min-time ms, so that fast functions do not
+fail the gate over nothing, and by more than the noise: when both profiles
+were taken over several runs, the half width of the 95% interval of the
+difference of their means, from the spread of either side's runs. The time
+of the whole run is held to --total-threshold the same way. A function that
+is new in the target is measured against no time at all.
+
+Without a baseline, the profile taken becomes the baseline and the gate
+passes. --update-baseline replaces the baseline with a profile that passed,
+and --history adds every profile to the database of profilehistory.py.
+"""
+
+PASS, FAIL, ERROR = 0, 1, 2  # exit codes
+
+THRESHOLD = 10.0  # percent
+TOTAL_THRESHOLD = 5.0
+MIN_TIME = 1.0  # ms
+LIMIT = 20  # regressions reported
+
+
+def samples(path):
+    """{func_std_string: {"tottime": [...], "cumtime": [...]}} over the runs
+    of the profile at path, and the number of runs, or ({}, 1) for a
+    single run"""
+    runs = loadRuns(path)
+    if runs is None:
+        return {}, 1
+    return runs["functions"], runs["runs"]
+
+
+def noise(valuesA, valuesB):
+    """half width of the 95% interval of the difference of the means of
+    two sets of runs, 0 where either has too few runs to tell"""
+    if len(valuesA) < 2 or len(valuesB) < 2:
+        return 0.0
+    _, sA, _ = summarize(valuesA)
+    _, sB, _ = summarize(valuesB)
+    error = sqrt(sA**2 / len(valuesA) + sB**2 / len(valuesB))
+    return tCritical(len(valuesA) + len(valuesB) - 2) * error
+
+
+class Verdict:
+    def __init__(self, name, before, after, noise, threshold, minTime):
+        self.name = name
+        self.before = before
+        self.after = after
+        self.noise = noise
+        self.delta = after - before
+        # the smallest growth that is a regression
+        self.limit = max(threshold / 100 * before, minTime, noise)
+        self.regressed = self.delta > self.limit
+
+    def row(self):
+        return (
+            "{:>10.3f} {:>10.3f} {:>+10.3f} {:>8} {:>10.3f} {:>10.3f}  "
+            "{:}".format(
+                1000 * self.before,
+                1000 * self.after,
+                1000 * self.delta,
+                (
+                    "{:+.1f}".format(100 * self.delta / self.before)
+                    if self.before
+                    else "new"
+                ),
+                1000 * self.noise,
+                1000 * self.limit,
+                self.name,
+            )
+        )
+
+
+HEADER = "{:>10} {:>10} {:>10} {:>8} {:>10} {:>10}  function".format(
+    "baseline", "now", "delta", "%", "+-noise", "allowed"
+)
+
+
+def judge(
+    baselinePath,
+    profilePath,
+    by="tottime",
+    threshold=THRESHOLD,
+    totalThreshold=TOTAL_THRESHOLD,
+    minTime=MIN_TIME,
+):
+    """(verdict on the whole run, verdicts on the functions that regressed,
+    largest excess over their limit first)"""
+    diff = ProfileDiff(baselinePath, profilePath)
+    samplesA, runsA = samples(baselinePath)
+    samplesB, runsB = samples(profilePath)
+    times = diff.selfTime if by == "tottime" else diff.cumTime
+    minTime /= 1000
+
+    verdicts = []
+    for i, func in enumerate(diff.funcs):
+        if not diff.inB[i]:
+            continue  # gone, which is no slower
+        nameA = pstats.func_std_string(func)
+        nameB = pstats.func_std_string(diff.keysB[i])
+        verdict = Verdict(
+            diff.name(i),
+            times[0][i],
+            times[1][i],
+            noise(
+                (
+                    samplesA[nameA][by]
+                    if diff.inA[i] and nameA in samplesA
+                    else [0.0] * runsA
+                ),
+                samplesB[nameB][by] if nameB in samplesB else [],
+            ),
+            threshold,
+            minTime,
+        )
+        if verdict.regressed:
+            verdicts.append(verdict)
+    verdicts.sort(key=lambda v: v.limit - v.delta)
+
+    # a run's own time is the sum of the self times of its functions
+    totals = []
+    for sampled, runs in ((samplesA, runsA), (samplesB, runsB)):
+        totals.append(
+            [
+                sum(funcTimes["tottime"][run] for funcTimes in sampled.values())
+                for run in range(runs)
+            ]
+            if sampled
+            else []
+        )
+    total = Verdict(
+        "the whole run",
+        diff.total[0],
+        diff.total[1],
+        noise(*totals),
+        totalThreshold,
+        minTime,
+    )
+    return total, verdicts
+
+
+def report(total, verdicts, limit=LIMIT):
+    lines = [
+        "{:} of the whole run, {:} function{:} regressed, times in "
+        "ms".format(
+            "regression" if total.regressed else "no regression",
+            len(verdicts) or "no",
+            "" if len(verdicts) == 1 else "s",
+        ),
+        HEADER,
+        total.row(),
+    ]
+    if verdicts:
+        lines += ["", "regressions, by how far past what is allowed", HEADER]
+        lines += [verdict.row() for verdict in verdicts[:limit]]
+        if len(verdicts) > limit:
+            lines.append("and {:d} more".format(len(verdicts) - limit))
+    return "\n".join(lines)
+
+
+def saveBaseline(profilePath, baselinePath):
+    if os.path.dirname(baselinePath):
+        os.makedirs(os.path.dirname(baselinePath), exist_ok=True)
+    shutil.copy2(profilePath, baselinePath)
+    runsPath = os.path.splitext(profilePath)[0] + RUNS_SUFFIX
+    baselineRuns = os.path.splitext(baselinePath)[0] + RUNS_SUFFIX
+    if loadRuns(profilePath) is not None:
+        shutil.copy2(runsPath, baselineRuns)
+    elif os.path.exists(baselineRuns):
+        os.remove(baselineRuns)  # of an earlier baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="fail when a target got slower than its baseline profile"
+    )
+    parser.add_argument(
+        "-b", "--baseline", required=True, help=".pstats file, made if missing"
+    )
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="runs at a time"
+    )
+    parser.add_argument(
+        "-o", "--output", help=".pstats file to keep the profile taken in"
+    )
+    parser.add_argument(
+        "--by", choices=("tottime", "cumtime"), default="tottime"
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="percent a function may grow by",
+    )
+    parser.add_argument(
+        "--total-threshold",
+        type=float,
+        default=TOTAL_THRESHOLD,
+        help="percent the whole run may grow by",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=MIN_TIME,
+        help="ms a function may grow by in any case",
+    )
+    parser.add_argument("--limit", type=int, default=LIMIT)
+    parser.add_argument("--report", help="file to write the report to")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--history", help="database of profilehistory.py")
+    parser.add_argument("-m", "--module", action="store_true")
+    parser.add_argument("target")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    opts = parser.parse_args(argv)
+    if opts.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    scratch = tempfile.mkdtemp(prefix="perfgate_")
+    try:
+        profilePath = opts.output or os.path.join(scratch, "profile.pstats")
+        try:
+            repeat(
+                opts.target,
+                opts.arguments,
+                profilePath,
+                opts.runs,
+                opts.jobs,
+                opts.module,
+                opts.by,
+            )
+        except RuntimeError as err:
+            print("ERROR: {:}".format(err))
+            return ERROR
+
+        if opts.history:
+            with ProfileHistory(opts.history) as history:
+                history.ingest(profilePath, opts.target, opts.arguments)
+
+        if not os.path.exists(opts.baseline):
+            saveBaseline(profilePath, opts.baseline)
+            print("PASS: no baseline, saved this profile as " + opts.baseline)
+            return PASS
+
+        try:
+            total, verdicts = judge(
+                opts.baseline,
+                profilePath,
+                opts.by,
+                opts.threshold,
+                opts.total_threshold,
+                opts.min_time,
+            )
+        except (OSError, ValueError, TypeError, EOFError) as err:
+            print("ERROR: cannot read the baseline: {:}".format(err))
+            return ERROR
+
+        text = report(total, verdicts, opts.limit)
+        failed = total.regressed or bool(verdicts)
+        text = ("FAIL: " if failed else "PASS: ") + text
+        print(text)
+        if opts.report:
+            with open(opts.report, "wt", encoding="utf-8") as file:
+                file.write(text + "\n")
+        if not failed and opts.update_baseline:
+            saveBaseline(profilePath, opts.baseline)
+        return FAIL if failed else PASS
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+import os
+import sys
+import json
+import pstats
+import argparse
+from html import escape
+
+from callgraph import functionLabel
+from cache import fileDigest
+from repeatprofile import RUNS_SUFFIX
+
+"""
+Jinpeng Zhai
+Compares two .pstats files, A (before) and B (after), function by function.
+
+Functions are matched by file, line and name first. What is left is matched
+by file and name, which finds a function whose line moved, and then by the
+file's base name and name, which finds it in a checkout elsewhere; where a
+name occurs more than once in a file, the nearest lines are paired. The
+functions are named as in A, with the line in B if it moved.
+
+For every function, the self (tottime) and cumulative (cumtime) times of
+either side and their difference are worked out, and written as
+
+    _diff.txt        the largest regressions and wins, ranked
+    _diff.dot        the call graph of both, each function coloured red
+                     for slower and blue for faster, by how much, with
+                     functions only in A dashed
+    _diff_flame.svg  the flame graph of B, each frame coloured the same way
+                     by the change in the time spent in it from its caller
+
+Profiles written by repeatprofile.py hold the average of several runs. The
+number of runs is read from the RUNS_SUFFIX file written with them, when it
+is next to them and holds their digest.
+"""
+
+LIMIT = 25  # rows in each half of the table
+NODE_THRES = 0.5  # percent of the longer run, as gprof2dot's defaults
+EDGE_THRES = 0.1
+WIDTH = 1200  # of the flame graph, in pixels
+ROW_HEIGHT = 18
+FLAME_THRES = 0.1  # percent of the width below which frames are left out
+MAX_DEPTH = 200
+
+DIFF_SUFFIX = "_diff"
+
+
+def loadRuns(path):
+    """what repeatprofile.py kept of the runs of the profile at path, or
+    None for a profile of a single run"""
+    runsPath = os.path.splitext(path)[0] + RUNS_SUFFIX
+    if not os.path.exists(runsPath):
+        return None
+    with open(runsPath, "rt") as file:
+        runs = json.load(file)
+    # one of another profile, e.g. left over from an earlier repeated run
+    # that a single run has since overwritten, is not this one's
+    if runs.get("digest") != fileDigest(path):
+        return None
+    return runs
+
+
+def loadProfile(path):
+    """pstats stats of the profile at path, of one average run, and the
+    number of runs it is the average of"""
+    runs = loadRuns(path)
+    return pstats.Stats(path).stats, 1 if runs is None else runs["runs"]
+
+
+def align(funcsA, funcsB):
+    """{function of B: function of A} for the functions found in both"""
+    matched = {}
+    restA = set(funcsA) - set(funcsB)
+    restB = []
+    for func in funcsB:
+        if func in funcsA:
+            matched[func] = func
+        else:
+            restB.append(func)
+
+    for place in (
+        lambda func: (func[0], func[2]),
+        lambda func: (os.path.basename(func[0]), func[2]),
+    ):
+        candidates = {}
+        for func in restA:
+            candidates.setdefault(place(func), []).append(func)
+        unmatched = []
+        for func in restB:
+            options = candidates.get(place(func))
+            if not options:
+                unmatched.append(func)
+                continue
+            # the nearest line, as a function moves less than its neighbours
+            nearest = min(options, key=lambda a: abs(a[1] - func[1]))
+            options.remove(nearest)
+            restA.discard(nearest)
+            matched[func] = nearest
+        restB = unmatched
+    return matched
+
+
+def shade(delta, scale):
+    """white for no change, to red for slower or blue for faster"""
+    weight = min(abs(delta) / scale, 1.0) if scale else 0.0
+    fade = int(255 * (1 - weight) + 0.5)
+    if delta > 0:
+        return "#ff{:02x}{:02x}".format(fade, fade)
+    return "#{:02x}{:02x}ff".format(fade, fade)
+
+
+class ProfileDiff:
+    def __init__(self, pathA, pathB):
+        statsA, runsA = loadProfile(pathA)
+        statsB, runsB = loadProfile(pathB)
+        self.pathA, self.pathB = pathA, pathB
+        self.runsA, self.runsB = runsA, runsB
+
+        matched = align(statsA, statsB)
+        # functions are known by their key in A if they are in A
+        self.funcs = list(statsA) + [f for f in statsB if f not in matched]
+        ids = {func: i for i, func in enumerate(self.funcs)}
+        idsB = {func: ids[matched.get(func, func)] for func in statsB}
+        self.keysB = {i: func for func, i in idsB.items()}
+        self.inA = [False] * len(self.funcs)
+        self.inB = [False] * len(self.funcs)
+        self.moved = {ids[a]: b for b, a in matched.items() if a[1] != b[1]}
+
+        n = len(self.funcs)
+        self.selfTime = ([0.0] * n, [0.0] * n)
+        self.cumTime = ([0.0] * n, [0.0] * n)
+        self.calls = ([0] * n, [0] * n)
+        self.edges = ({}, {})  # (caller id, callee id) -> cumtime
+        for side, (stats, sideIds, present) in enumerate(
+            ((statsA, ids, self.inA), (statsB, idsB, self.inB))
+        ):
+            for func, (cc, nc, tt, ct, callers) in stats.items():
+                i = sideIds[func]
+                present[i] = True
+                self.selfTime[side][i] = tt
+                self.cumTime[side][i] = ct
+                self.calls[side][i] = nc
+                for caller, edge in callers.items():
+                    time = edge[3] if isinstance(edge, tuple) else 0.0
+                    key = (sideIds[caller], i)
+                    self.edges[side][key] = time
+        self.total = tuple(sum(times) or 1.0 for times in self.selfTime)
+
+    def label(self, i):
+        return functionLabel(self.funcs[i])
+
+    def name(self, i):
+        func = self.funcs[i]
+        if i in self.moved:
+            return "{:} (now line {:d})".format(
+                pstats.func_std_string(func), self.moved[i][1]
+            )
+        return pstats.func_std_string(func)
+
+    def table(self, by="tottime", limit=LIMIT):
+        times = self.selfTime if by == "tottime" else self.cumTime
+        deltas = sorted(
+            range(len(self.funcs)), key=lambda i: times[1][i] - times[0][i]
+        )
+        lines = [
+            "A: {:} ({:d} runs), {:.3f} s".format(
+                self.pathA, self.runsA, self.total[0]
+            ),
+            "B: {:} ({:d} runs), {:.3f} s".format(
+                self.pathB, self.runsB, self.total[1]
+            ),
+            "total {:+.3f} s ({:+.1f}%), {:d} functions moved, {:d} new, "
+            "{:d} gone".format(
+                self.total[1] - self.total[0],
+                100 * (self.total[1] / self.total[0] - 1),
+                len(self.moved),
+                sum(b and not a for a, b in zip(self.inA, self.inB)),
+                sum(a and not b for a, b in zip(self.inA, self.inB)),
+            ),
+        ]
+        header = "{:>10} {:>10} {:>10} {:>8} {:>10} {:>10}  function".format(
+            by + " A", by + " B", "delta", "%", "calls A", "calls B"
+        )
+
+        def row(i):
+            a, b = times[0][i], times[1][i]
+            return (
+                "{:>10.3f} {:>10.3f} {:>+10.3f} {:>8} {:>10g} {:>10g}  "
+                "{:}".format(
+                    1000 * a,
+                    1000 * b,
+                    1000 * (b - a),
+                    "{:+.1f}".format(100 * (b - a) / a) if a else "new",
+                    self.calls[0][i],
+                    self.calls[1][i],
+                    self.name(i),
+                )
+            )
+
+        for title, order, sign in (
+            ("regressions", reversed(deltas), 1),
+            ("wins", deltas, -1),
+        ):
+            lines += ["", "largest {:}, in ms".format(title), header]
+            shown = 0
+            for i in order:
+                if shown == limit or sign * (times[1][i] - times[0][i]) <= 0:
+                    break
+                lines.append(row(i))
+                shown += 1
+        return "\n".join(lines)
+
+    def toDot(self, nodeThres=NODE_THRES, edgeThres=EDGE_THRES):
+        """differential call graph, of the functions that took at least
+        nodeThres percent of either run"""
+        total = max(self.total)
+        cumA, cumB = self.cumTime
+        nodes = [
+            i
+            for i in range(len(self.funcs))
+            if max(cumA[i], cumB[i]) >= nodeThres / 100 * total
+        ]
+        kept = set(nodes)
+        scale = max(
+            (abs(self.selfTime[1][i] - self.selfTime[0][i]) for i in nodes),
+            default=0.0,
+        )
+        lines = [
+            "digraph {",
+            "  node [fontname=Arial, shape=box, style=filled];",
+            "  edge [fontname=Arial];",
+        ]
+        for i in nodes:
+            delta = self.selfTime[1][i] - self.selfTime[0][i]
+            lines.append(
+                '  {:d} [label="{:}\\n{:.2%} \u2192 {:.2%}\\n'
+                'self {:+.1f} ms", fillcolor="{:}"{:}];'.format(
+                    i,
+                    self.label(i).replace('"', '\\"'),
+                    cumA[i] / self.total[0],
+                    cumB[i] / self.total[1],
+                    1000 * delta,
+                    shade(delta, scale),
+                    "" if self.inB[i] else ', style="filled,dashed"',
+                )
+            )
+        edgesA, edgesB = self.edges
+        edgeScale = 0.0
+        shown = []
+        for key in set(edgesA) | set(edgesB):
+            caller, callee = key
+            a, b = edgesA.get(key, 0.0), edgesB.get(key, 0.0)
+            if (
+                caller in kept
+                and callee in kept
+                and max(a, b) >= edgeThres / 100 * total
+            ):
+                shown.append((key, a, b))
+                edgeScale = max(edgeScale, abs(b - a))
+        for (caller, callee), a, b in sorted(shown):
+            lines.append(
+                '  {:d} -> {:d} [label="{:+.1f} ms", color="{:}", '
+                'penwidth="{:.2f}"{:}];'.format(
+                    caller,
+                    callee,
+                    1000 * (b - a),
+                    "black" if a == b else shade(b - a, edgeScale),
+                    0.5 + 3.5 * max(a, b) / total,
+                    "" if b else ", style=dashed",
+                )
+            )
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def flameSvg(self, width=WIDTH, rowHeight=ROW_HEIGHT, thres=FLAME_THRES):
+        """flame graph of B, coloured by the change from A"""
+        cumA, cumB = self.cumTime
+        edgesA, edgesB = self.edges
+        callees = {}
+        # the time of a function that its callers do not account for, as
+        # that of the script, or of code run by exec, starts a stack
+        unclaimed = (list(cumA), list(cumB))
+        for side, edges in enumerate(self.edges):
+            for (caller, callee), time in edges.items():
+                if caller == callee:
+                    continue
+                unclaimed[side][callee] -= time
+                if side == 1:
+                    callees.setdefault(caller, []).append((callee, time))
+        roots = [i for i in range(len(self.funcs)) if unclaimed[1][i] > 0]
+        total = sum(unclaimed[1][i] for i in roots) or 1.0
+        minWidth = thres / 100 * width
+
+        frames = []  # (function id, x, width, depth, time B, time A)
+        stack = []
+        x = 0.0
+        for i in roots:
+            timeA, timeB = (max(times[i], 0.0) for times in unclaimed)
+            w = timeB / total * width
+            stack.append((i, x, w, 0, timeB, timeA, ()))
+            x += w
+        while stack:
+            i, x, w, depth, timeB, timeA, path = stack.pop()
+            if w < minWidth:
+                continue
+            frames.append((i, x, w, depth, timeB, timeA))
+            if depth == MAX_DEPTH or not cumB[i]:
+                continue
+            path += (i,)
+            childX = x
+            for callee, time in sorted(callees.get(i, ())):
+                if callee in path:
+                    continue  # recursion is drawn once
+                # the share of this caller's time that went to the callee
+                share = timeB / cumB[i]
+                childW = w * time / cumB[i]
+                stack.append(
+                    (
+                        callee,
+                        childX,
+                        childW,
+                        depth + 1,
+                        time * share,
+                        edgesA.get((i, callee), 0.0) * share,
+                        path,
+                    )
+                )
+                childX += childW
+
+        depth = max((frame[3] for frame in frames), default=0) + 1
+        height = depth * rowHeight
+        parts = [
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{:d}" '
+            'height="{:d}" font-family="monospace" font-size="{:d}">'.format(
+                width, height, rowHeight - 6
+            )
+        ]
+        for i, x, w, level, timeB, timeA in frames:
+            y = height - (level + 1) * rowHeight  # roots at the bottom
+            delta = timeB - timeA
+            label = self.label(i)
+            chars = int(w / (0.6 * (rowHeight - 6)))
+            parts.append(
+                "<g><title>{:} {:.3f} ms, {:+.3f} ms</title>"
+                '<rect x="{:.1f}" y="{:d}" width="{:.1f}" height="{:d}" '
+                'fill="{:}" stroke="white"/>{:}</g>'.format(
+                    escape(label),
+                    1000 * timeB,
+                    1000 * delta,
+                    x,
+                    y,
+                    w,
+                    rowHeight,
+                    shade(delta, max(timeA, timeB)),
+                    (
+                        '<text x="{:.1f}" y="{:d}">{:}</text>'.format(
+                            x + 2,
+                            y + rowHeight - 5,
+                            escape(
+                                label
+                                if len(label) <= chars
+                                else label[: max(chars - 2, 0)] + ".."
+                            ),
+                        )
+                        if chars > 3
+                        else ""
+                    ),
+                )
+            )
+        parts.append("</svg>")
+        return "\n".join(parts) + "\n"
+
+    def write(self, stem, by="tottime", limit=LIMIT, **thresholds):
+        """write the table, call graph and flame graph as stem_diff*.
+        Returns the table."""
+        table = self.table(by, limit)
+        outputs = (
+            (DIFF_SUFFIX + ".txt", table + "\n"),
+            (DIFF_SUFFIX + ".dot", self.toDot(**thresholds)),
+            (DIFF_SUFFIX + "_flame.svg", self.flameSvg()),
+        )
+        for suffix, text in outputs:
+            with open(stem + suffix, "wt", encoding="utf-8") as file:
+                file.write(text)
+        return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="compare two profiles, A before and B after a change"
+    )
+    parser.add_argument("before", help=".pstats file A")
+    parser.add_argument("after", help=".pstats file B")
+    parser.add_argument(
+        "-o", "--output", help="stem of the outputs, by default that of B"
+    )
+    parser.add_argument(
+        "--by", choices=("tottime", "cumtime"), default="tottime"
+    )
+    parser.add_argument("--limit", type=int, default=LIMIT)
+    parser.add_argument("-n", "--node-thres", type=float, default=NODE_THRES)
+    parser.add_argument("-e", "--edge-thres", type=float, default=EDGE_THRES)
+    opts = parser.parse_args(argv)
+
+    try:
+        diff = ProfileDiff(opts.before, opts.after)
+    except (OSError, ValueError, TypeError, EOFError) as err:
+        sys.exit("Cannot read the profiles: {:}".format(err))
+    print(
+        diff.write(
+            opts.output or os.path.splitext(opts.after)[0],
+            opts.by,
+            opts.limit,
+            nodeThres=opts.node_thres,
+            edgeThres=opts.edge_thres,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import argparse
+import subprocess as sp
+
+from profdiff import loadProfile
+
+"""
+Jinpeng Zhai
+History of the profiles of a programme, kept in a SQLite database so that a
+function's times can be followed from run to run without reading the .pstats
+files again, which are overwritten by the next run anyway.
+
+    runs        one row per ingested profile: the programme and its
+                arguments, the git commit it was run at and whether the
+                tree had changes, the host, the time it was written, the
+                number of runs merged into it (see repeatprofile.py) and its
+                total time
+    functions   every (filename, line, name) seen in any run, with the
+                module, the file's name without extension, to look them up
+                by
+    stats       calls and times of a function in a run
+    edges       calls and times of a caller calling a callee in a run
+
+Times are those of one average run. A profile is ingested once: the digest
+of the .pstats file is kept, so a profile reused from the cache is not
+counted twice.
+
+A function is named in queries as in pstats, "file:line(name)", as
+"module.name", e.g. "corner.balance", or by its name alone. The latter two
+match every line the function has been at, so the history carries on across
+edits that move it.
+"""
+
+DATABASE = "history.sqlite"
+LAST = 50  # runs returned by default
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL,
+    args TEXT NOT NULL,
+    commit_hash TEXT,
+    dirty INTEGER,
+    host TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    repetitions INTEGER NOT NULL,
+    total REAL NOT NULL,
+    digest TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS runs_commit ON runs (commit_hash);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+CREATE TABLE IF NOT EXISTS functions (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    lineno INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    module TEXT NOT NULL,
+    UNIQUE (filename, lineno, name)
+);
+CREATE INDEX IF NOT EXISTS functions_name ON functions (name, module);
+CREATE TABLE IF NOT EXISTS stats (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    function_id INTEGER NOT NULL REFERENCES functions (id),
+    primitive_calls REAL NOT NULL,
+    calls REAL NOT NULL,
+    tottime REAL NOT NULL,
+    cumtime REAL NOT NULL,
+    PRIMARY KEY (run_id, function_id)
+);
+CREATE INDEX IF NOT EXISTS stats_function ON stats (function_id, run_id);
+CREATE TABLE IF NOT EXISTS edges (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    caller_id INTEGER NOT NULL REFERENCES functions (id),
+    callee_id INTEGER NOT NULL REFERENCES functions (id),
+    calls REAL NOT NULL,
+    tottime REAL NOT NULL,
+    cumtime REAL NOT NULL,
+    PRIMARY KEY (run_id, caller_id, callee_id)
+);
+"""
+
+METRICS = ("tottime", "cumtime", "calls")
+
+
+def gitCommit(directory):
+    """(commit, whether tracked files changed) of the checkout directory is
+    in, or (None, None) outside of one"""
+    try:
+        commit = sp.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=directory or ".",
+            stdout=sp.PIPE,
+            stderr=sp.DEVNULL,
+            text=True,
+        )
+        if commit.returncode != 0:
+            return None, None
+        status = sp.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=directory or ".",
+            stdout=sp.PIPE,
+            stderr=sp.DEVNULL,
+            text=True,
+        )
+    except OSError:  # no git
+        return None, None
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def fileDigest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def edgeTimes(edge):
+    """(calls, tottime, cumtime) of an edge of a pstats profile"""
+    if isinstance(edge, tuple):
+        return edge[0], edge[2], edge[3]
+    return edge, 0.0, 0.0  # the profile module only counts the calls
+
+
+def functionClause(spec):
+    """WHERE clause on functions, and its parameters, for a function named
+    as described above"""
+    if spec.endswith(")") and "(" in spec:
+        place, name = spec[:-1].split("(", 1)
+        filename, _, lineno = place.rpartition(":")
+        if filename and lineno.isdigit():
+            return (
+                "filename = ? AND lineno = ? AND name = ?",
+                (filename, int(lineno), name),
+            )
+        return "filename = ? AND name = ?", (place, name)  # built-ins, "~"
+    if "." in spec:
+        module, name = spec.rsplit(".", 1)
+        return "module = ? AND name = ?", (module, name)
+    return "name = ?", (spec,)
+
+
+class ProfileHistory:
+    def __init__(self, path=DATABASE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def functionIds(self, funcs):
+        """{(filename, line, name): id}, adding those not seen before"""
+        db = self.db
+        db.executemany(
+            "INSERT OR IGNORE INTO functions (filename, lineno, name, module)"
+            " VALUES (?, ?, ?, ?)",
+            (
+                (f, l, n, os.path.splitext(os.path.basename(f))[0])
+                for f, l, n in funcs
+            ),
+        )
+        # looked up all at once, through a table of the functions asked for
+        db.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS wanted"
+            " (filename TEXT, lineno INTEGER, name TEXT)"
+        )
+        db.execute("DELETE FROM wanted")
+        db.executemany("INSERT INTO wanted VALUES (?, ?, ?)", funcs)
+        return {
+            (f, l, n): i
+            for i, f, l, n in db.execute(
+                "SELECT id, filename, lineno, name"
+                " FROM wanted JOIN functions USING (filename, lineno, name)"
+            )
+        }
+
+    def ingest(
+        self,
+        pstatsPath,
+        target,
+        args=(),
+        commit=None,
+        dirty=None,
+        host=None,
+        timestamp=None,
+    ):
+        """add the profile at pstatsPath, of target run with args. The
+        commit is looked up in the target's directory unless given, and the
+        time is that the profile was written at. Returns the id of the run,
+        and whether it is new."""
+        digest = fileDigest(pstatsPath)
+        row = self.db.execute(
+            "SELECT id FROM runs WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is not None:
+            return row[0], False
+
+        stats, runs = loadProfile(pstatsPath)
+        if commit is None:
+            commit, dirty = gitCommit(os.path.dirname(os.path.abspath(target)))
+        with self.db:  # one transaction, so a failed ingest leaves nothing
+            # a caller need not have stats of its own
+            ids = self.functionIds(
+                set(stats).union(*(stat[4] for stat in stats.values()))
+            )
+            runId = self.db.execute(
+                "INSERT INTO runs (target, args, commit_hash, dirty, host,"
+                " timestamp, repetitions, total, digest)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    os.path.abspath(target),
+                    json.dumps(list(args)),
+                    commit,
+                    None if dirty is None else int(dirty),
+                    host or socket.gethostname(),
+                    timestamp or os.path.getmtime(pstatsPath),
+                    runs,
+                    sum(stat[2] for stat in stats.values()),
+                    digest,
+                ),
+            ).lastrowid
+            self.db.executemany(
+                "INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (runId, ids[func], cc, nc, tt, ct)
+                    for func, (cc, nc, tt, ct, callers) in stats.items()
+                ),
+            )
+            self.db.executemany(
+                "INSERT INTO edges VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (runId, ids[caller], ids[func], *edgeTimes(edge))
+                    for func, (cc, nc, tt, ct, callers) in stats.items()
+                    for caller, edge in callers.items()
+                ),
+            )
+        return runId, True
+
+    def runs(self, last=LAST, target=None, commit=None):
+        """the last runs, newest first, as dicts of the columns of runs"""
+        clauses, params = self.runFilter(target, commit)
+        cursor = self.db.execute(
+            "SELECT * FROM runs {:} ORDER BY timestamp DESC LIMIT ?".format(
+                clauses
+            ),
+            (*params, last),
+        )
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def runFilter(self, target, commit):
+        clauses, params = [], []
+        if target is not None:
+            clauses.append("target = ?")
+            params.append(os.path.abspath(target))
+        if commit is not None:
+            # an abbreviated commit, as git shows it, is enough
+            clauses.append("commit_hash LIKE ?")
+            params.append(commit + "%")
+        return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def series(self, spec, metric="cumtime", last=LAST, target=None):
+        """[(run id, timestamp, commit, value)] of the function over the last
+        runs, oldest first. The value is None for runs it did not run in."""
+        if metric not in METRICS:
+            raise ValueError("metric must be one of " + ", ".join(METRICS))
+        where, params = functionClause(spec)
+        runFilter, runParams = self.runFilter(target, None)
+        rows = self.db.execute(
+            "SELECT r.id, r.timestamp, r.commit_hash, s.value FROM"
+            " (SELECT * FROM runs {runFilter}"
+            "  ORDER BY timestamp DESC LIMIT ?) AS r"
+            " LEFT JOIN"
+            " (SELECT run_id, SUM({metric}) AS value FROM stats"
+            "  WHERE function_id IN (SELECT id FROM functions WHERE {where})"
+            "  GROUP BY run_id) AS s"
+            " ON s.run_id = r.id"
+            " ORDER BY r.timestamp".format(
+                runFilter=runFilter, metric=metric, where=where
+            ),
+            (*runParams, last, *params),
+        )
+        return rows.fetchall()
+
+    def top(self, runId, metric="tottime", limit=20):
+        """[(filename, line, name, calls, tottime, cumtime)] of the most
+        expensive functions of a run"""
+        if metric not in METRICS:
+            raise ValueError("metric must be one of " + ", ".join(METRICS))
+        return self.db.execute(
+            "SELECT f.filename, f.lineno, f.name, s.calls, s.tottime,"
+            " s.cumtime FROM stats AS s JOIN functions AS f"
+            " ON f.id = s.function_id WHERE s.run_id = ?"
+            " ORDER BY s.{:} DESC LIMIT ?".format(metric),
+            (runId, limit),
+        ).fetchall()
+
+    def callers(self, runId, spec):
+        """[(filename, line, name, calls, cumtime)] of the callers of the
+        function in a run, by the time spent in it on their behalf"""
+        where, params = functionClause(spec)
+        return self.db.execute(
+            "SELECT f.filename, f.lineno, f.name, SUM(e.calls),"
+            " SUM(e.cumtime) FROM edges AS e JOIN functions AS f"
+            " ON f.id = e.caller_id WHERE e.run_id = ? AND e.callee_id IN"
+            " (SELECT id FROM functions WHERE {:})"
+            " GROUP BY f.id ORDER BY SUM(e.cumtime) DESC".format(where),
+            (runId, *params),
+        ).fetchall()
+
+
+def formatTime(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="keep and query the history of a programme's profiles"
+    )
+    parser.add_argument("database", help="SQLite file, created if missing")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # everything after the target is its own, so options come before it
+    ingest = commands.add_parser(
+        "ingest",
+        help="add a .pstats file",
+        usage="%(prog)s [-h] [--commit COMMIT] pstats target ...",
+    )
+    ingest.add_argument("--commit", help="instead of asking git")
+    ingest.add_argument("pstats")
+    ingest.add_argument("target", help="the programme that was profiled")
+    ingest.add_argument(
+        "arguments",
+        nargs=argparse.REMAINDER,
+        help="the target's, taken as they are: options go before pstats",
+    )
+
+    runs = commands.add_parser("runs", help="list the last runs")
+    runs.add_argument("--last", type=int, default=LAST)
+    runs.add_argument("--target")
+    runs.add_argument("--commit")
+
+    series = commands.add_parser("series", help="a function over the runs")
+    series.add_argument("function", help='e.g. "corner.balance"')
+    series.add_argument("--metric", choices=METRICS, default="cumtime")
+    series.add_argument("--last", type=int, default=LAST)
+    series.add_argument("--target")
+
+    top = commands.add_parser("top", help="the functions of a run")
+    top.add_argument("run", type=int)
+    top.add_argument("--metric", choices=METRICS, default="tottime")
+    top.add_argument("--limit", type=int, default=20)
+    opts = parser.parse_args(argv)
+
+    with ProfileHistory(opts.database) as history:
+        if opts.command == "ingest":
+            try:
+                runId, new = history.ingest(
+                    opts.pstats, opts.target, opts.arguments, opts.commit
+                )
+            except (OSError, ValueError, TypeError, EOFError) as err:
+                sys.exit("Cannot ingest {:}: {:}".format(opts.pstats, err))
+            print(
+                "{:} run {:d} in {:}".format(
+                    "added" if new else "already had", runId, opts.database
+                )
+            )
+        elif opts.command == "runs":
+            for run in history.runs(opts.last, opts.target, opts.commit):
+                print(
+                    "{:>5d} {:} {:<12} {:>9.3f} s x{:d}  {:} {:}".format(
+                        run["id"],
+                        formatTime(run["timestamp"]),
+                        (run["commit_hash"] or "-")[:10]
+                        + ("+" if run["dirty"] else ""),
+                        run["total"],
+                        run["repetitions"],
+                        run["target"],
+                        " ".join(json.loads(run["args"])),
+                    )
+                )
+        elif opts.command == "series":
+            for runId, timestamp, commit, value in history.series(
+                opts.function, opts.metric, opts.last, opts.target
+            ):
+                print(
+                    "{:>5d} {:} {:<10} {:>12}".format(
+                        runId,
+                        formatTime(timestamp),
+                        (commit or "-")[:10],
+                        "-" if value is None else "{:.6f}".format(value),
+                    )
+                )
+        else:
+            for filename, lineno, name, calls, tt, ct in history.top(
+                opts.run, opts.metric, opts.limit
+            ):
+                print(
+                    "{:>10g} {:>10.6f} {:>10.6f}  {:}:{:d}({:})".format(
+                        calls, tt, ct, filename, lineno, name
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,21 @@ import tkinter as tk
 import tkinter.ttk as ttk
 import tkinter.filedialog as tkfiledialog
 import tkinter.messagebox as tkmessagebox
-import subprocess as sp
 
 import sys
 import os
-import queue
+import shlex
 import traceback
-from threading import Thread
-from platform import system
 
-import psutil
+from console import Console
+from supervisor import Supervisor
+from cache import ArtifactCache, treeDigest
+from jobs import Job
 
 EXCLUDE_DEFAULT = "pycallgraph_excluded.txt"
 
 
-class Callgraph(tk.Frame):
+class Callgraph(tk.Frame, Console):
     def __init__(self, parent):
         # use this instead of super() due to multiple inheritance
         ttk.Frame.__init__(self, parent)
@@ -34,17 +34,14 @@ class Callgraph(tk.Frame):
         self.columnconfigure(0, weight=1)
         self.rowconfigure(1, weight=1)
 
-        # make queues for keeping stdout and stderr whilst it is transferred between threads
-        self.outQueue = queue.Queue()
-        self.errQueue = queue.Queue()
+        # owns the shell behind the console, its readers and their queues
+        self.supervisor = Supervisor(self, self.wakeWriteLoop, self.writeInfo)
 
-        # keep track of where any line that is submitted starts
-        self.line_start = 0
+        # make sure the user does not edit past the starting point.
+        self.protectConsole()
 
         # make the enter key call the self.enter function
         self.ttyText.bind("<Return>", self.enter)
-        # and make sure the user does not delete past the starting point.
-        self.ttyText.bind("<KeyRelease>", self.postKey)
 
         self.startSubprocess()
         self.writeLoop()  # start the write loop in the main thread
@@ -259,6 +256,17 @@ class Callgraph(tk.Frame):
             operationFrame, text="Run Trace", command=self.callgraph
         ).grid(row=0, column=1, sticky="nsew", padx=2, pady=2)
 
+        ttk.Button(
+            operationFrame, text="Load Older Output", command=self.loadOlder
+        ).grid(row=1, column=0, columnspan=2, sticky="nsew", padx=2, pady=2)
+
+        self.useCache = tk.IntVar(value=1)
+        ttk.Checkbutton(
+            operationFrame,
+            text="Reuse Cached Artifacts",
+            variable=self.useCache,
+        ).grid(row=2, column=0, columnspan=2, sticky="nsew", padx=2, pady=2)
+
     def loadProgramme(self):
         filePath = tkfiledialog.askopenfilename(
             title="Load Programme to be Analyzed",
@@ -320,125 +328,22 @@ class Callgraph(tk.Frame):
         self.alive = False
         # write exit() to the console in order to stop it running
 
-        self.p.terminate()  # this, if the above didn't work, sends a Termination signal
-        self.p.kill()  # and a kill signal. On windows this is the same.
-        # these methods are a lot more effective than sending "exit" and flushing
+        self.endSubprocess()
 
         # call the destroy methods to properly destroy widgets
+        self.releaseConsole()
         self.ttyText.destroy()
         tk.Frame.destroy(self)
 
-    def enter(self, e):
-        """The <Return> key press handler"""
-        self.postKey(None)
-        # ensure the Enter key, if pressed simultaneousely, effectively
-        # "interrupts" other entries by forcing the postKey to be called.
-        string = self.ttyText.get(1.0, tk.END)[self.line_start :]
-        self.line_start += len(string)
-        self.p.stdin.write(string.encode())
-        self.p.stdin.flush()
-
-    def postKey(self, e):
-        ttyNow, ttyNowTagDict = self.ttyNow
-        ttyNew = self.ttyText.get(1.0, tk.END)[: len(ttyNow)]
-        if ttyNew != ttyNow:
-            self.ttyText.edit_undo()
-            self.ttyText.edit_reset()
-
-            for tag, ranges in ttyNowTagDict.items():
-                for startIndex, endIndex in zip(ranges[::2], ranges[1::2]):
-                    self.ttyText.tag_add(tag, startIndex, endIndex)
-
-    def readFromProccessOut(self):
-        """To be executed in a separate thread to make read non-blocking"""
-        while self.alive:
-            data = self.p.stdout.raw.read(1024).decode()
-            self.outQueue.put(data)
-
-    def readFromProccessErr(self):
-        """To be executed in a separate thread to make read non-blocking"""
-        while self.alive:
-            data = self.p.stderr.raw.read(1024).decode()
-            self.errQueue.put(data)
-
-    def writeLoop(self):
-        """Used to write data from stdout and stderr to the Text widget"""
-        # if there is anything to write from stdout or stderr, then write it
-
-        if not self.errQueue.empty():
-            self.write(self.errQueue.get(), tag="stderr")
-        if not self.outQueue.empty():
-            out = self.outQueue.get()
-            self.write(out, tag="stdout")
-
-        # run this method again after 10ms
-        if self.alive:
-            self.after(10, self.writeLoop)
-
-    def clear(self):
-        self.line_start = 0
-        self.ttyText.delete(1.0, tk.END)
-
     def navigateToFolder(self):
         folderPath = os.path.dirname(self.pathVar.get())
 
-        self.p.stdin.write(
-            "cd {:}\n".format(folderPath).encode()
+        self.supervisor.write(
+            "cd {:}\n".format(folderPath)
         )  # This is also platform independent.
-        self.p.stdin.flush()
 
         self.output.set(".")
 
-    def write(self, string, tag=None):
-        self.ttyText.insert(tk.END, string, tag)
-        self.ttyText.see(tk.END)
-        self.ttyText.mark_set(tk.INSERT, tk.END)
-
-        self.line_start += len(string)
-
-        self.ttyText.edit_reset()
-
-        self.ttyNow = (
-            self.ttyText.get(1.0, tk.END)[: self.line_start],
-            {tag: self.ttyText.tag_ranges(tag) for tag in ("stdout", "stderr")},
-        )
-
-    def startSubprocess(self):
-        # open a subprocess to this script.
-        self.p = sp.Popen(
-            [
-                "cmd" if system() == "Windows" else "bash"
-            ],  # simple identification of the running system,
-            stdout=sp.PIPE,
-            stdin=sp.PIPE,
-            stderr=sp.PIPE,
-        )
-
-        # a daemon to keep track of the threads so they can stop running
-        self.alive = True
-        # start the functions that get stdout and stderr in separate threads
-        Thread(target=self.readFromProccessOut).start()
-        Thread(target=self.readFromProccessErr).start()
-
-    def endSubprocess(self):
-        self.alive = False
-
-        # use psutil (a cross platform tool) to recursively kill the children
-        # to ensure a clean exit.
-        process = psutil.Process(self.p.pid)
-        for childProcess in process.children(recursive=True):
-            childProcess.kill()
-        process.kill()
-
-        while not self.errQueue.empty():
-            self.errQueue.get()
-        while not self.outQueue.empty():
-            self.outQueue.get()
-
-        # the original way of ending subprocesses.
-        self.p.terminate()
-        self.p.kill()
-
     def restart(self):
         self.endSubprocess()
         self.clear()
@@ -471,7 +376,7 @@ class Callgraph(tk.Frame):
                 + self.outputFormat.get()
             )
 
-        cmd = " ".join(
+        args = [
             arg
             for arg in (
                 "pycallgraph.py",
@@ -484,34 +389,41 @@ class Callgraph(tk.Frame):
                 "--include-pycallgraph"
                 if self.includePyCallgraph.get()
                 else None,
-                "--max-depth " + self.maxDepth.get()
-                if self.maxDepth.get() != ""
-                else None,
-                (
-                    " ".join(
-                        [
-                            f'{self.inexmode.get()} "' + i.strip() + '"'
-                            for i in self.inexcludes.get().split(",")
-                        ]
-                    )
-                )
-                if self.inexcludes.get() != ""
-                else None,
+                *(
+                    ("--max-depth", self.maxDepth.get())
+                    if self.maxDepth.get() != ""
+                    else ()
+                ),
+                *(
+                    arg
+                    for i in self.inexcludes.get().split(",")
+                    if i.strip() != ""
+                    for arg in (self.inexmode.get(), i.strip())
+                ),
                 "graphviz",
                 "--output-file=" + self.output.get()
                 if self.output.get != ""
                 else "--",
                 "--output-format=" + self.outputFormat.get(),
                 self.pathVar.get(),
-                self.programArgs.get(),
-                "\n",
+                *shlex.split(self.programArgs.get()),
             )
             if arg is not None
+        ]
+
+        self.supervisor.jobs.submit(
+            Job(
+                "pycallgraph",
+                args,
+                cwd=parentDir,
+                outputs=(self.output.get(),),
+                inputs=(lambda: treeDigest(parentDir),),
+                cache=(
+                    ArtifactCache(profilePath) if self.useCache.get() else None
+                ),
+            )
         )
 
-        self.p.stdin.write(cmd.encode())
-        self.p.stdin.flush()
-
 
 def main():
     root = tk.Tk()
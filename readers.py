@@ -0,0 +1,149 @@
+import os
+import codecs
+import tkinter as tk
+from threading import Thread
+
+"""
+Jinpeng Zhai
+Backends that move the output of a subprocess pipe into a queue, from where
+Console.writeLoop() picks it up.
+
+FileHandlerReader is used wherever Tk supports file handlers (i.e. not on
+Windows): it costs nothing while the pipe is idle, and drains everything that
+is available in a few large reads once it becomes readable. ThreadReader is
+the portable fallback, blocking on the pipe from a worker thread.
+
+Both read into one preallocated buffer per pipe, and decode it with an
+incremental decoder, so a character split between two reads is completed by
+the next one instead of failing to decode. The size of each read follows the
+output rate: it doubles while reads come back full and halves when they come
+back mostly empty, between READ_MIN and READ_MAX.
+"""
+
+READ_MIN = 4 * 1024  # bytes requested per read() call, at least
+READ_SIZE = 64 * 1024  # ... to start with
+READ_MAX = 1024 * 1024  # ... at most, also read per wake-up before yielding
+
+
+def canHandleFiles(widget):
+    return hasattr(widget.tk, "createfilehandler")
+
+
+class PipeReader:
+    def __init__(self, pipe, q, tee=None):
+        """tee, if given, is called with every chunk of output read, e.g. a
+        TeeWriter channel"""
+        self.fd = pipe.fileno()
+        # the unbuffered file underneath, which can read into a buffer
+        self.raw = getattr(pipe, "raw", pipe)
+        self.q = q
+        self.tee = tee
+
+        self.buffer = memoryview(bytearray(READ_MAX))
+        self.readSize = READ_SIZE
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def fill(self, drain):
+        """read into the buffer, once or, if drain is set, for as long as
+        there is something to read and room for it. Returns the number of
+        bytes read and whether EOF has been reached."""
+        filled = 0
+        while filled < READ_MAX:
+            size = min(self.readSize, READ_MAX - filled)
+            try:
+                n = self.raw.readinto(self.buffer[filled : filled + size])
+            except (OSError, ValueError):  # the pipe has been closed under us
+                return filled, True
+            if n is None:  # drained, for a non-blocking pipe
+                break
+            if n == 0:  # EOF, the process has exited
+                return filled, True
+
+            filled += n
+            if n == size:
+                self.readSize = min(self.readSize * 2, READ_MAX)
+            elif n < size // 4:
+                self.readSize = max(self.readSize // 2, READ_MIN)
+
+            if n < size or not drain:  # no need to ask again
+                break
+
+        return filled, False
+
+    def emit(self, size, final=False):
+        """pass on the first size bytes of the buffer. Returns whether any
+        text was queued."""
+        data = self.buffer[:size]
+        if self.tee is not None and size:
+            self.tee(data)
+        string = self.decoder.decode(data, final)
+        if string:
+            self.q.put(string)
+        return bool(string)
+
+
+class ThreadReader(PipeReader):
+    def __init__(self, pipe, q, tee=None):
+        super().__init__(pipe, q, tee)
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """To be executed in a separate thread to make read non-blocking"""
+        while True:
+            # a blocking pipe is read once at a time, so that what has been
+            # read is not held back while waiting on more.
+            size, eof = self.fill(drain=False)
+            self.emit(size, final=eof)
+            if eof:
+                break
+
+    def stop(self, timeout=None):
+        """wait for the reader to see EOF. Returns whether it has stopped."""
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+
+class FileHandlerReader(PipeReader):
+    def __init__(self, pipe, q, notify, widget, tee=None):
+        super().__init__(pipe, q, tee)
+        self.notify = notify
+        self.tk = widget.tk
+
+        os.set_blocking(self.fd, False)
+        self.tk.createfilehandler(self.fd, tk.READABLE, self.onReadable)
+
+    def onReadable(self, fd, mask):
+        if self.read(READ_MAX):
+            self.tk.deletefilehandler(self.fd)
+            self.fd = None
+
+    def read(self, limit):
+        """read up to limit bytes of what is available. Returns whether EOF
+        has been reached."""
+        total = 0
+        queued = False
+        eof = False
+        while total < limit:
+            size, eof = self.fill(drain=True)
+            total += size
+            queued = self.emit(size, final=eof) or queued
+            if eof:
+                break
+            if size < READ_MAX:  # drained before the buffer filled up
+                break
+
+        if queued:
+            self.notify()
+
+        return eof
+
+    def stop(self, timeout=None):
+        """collect whatever output is still waiting in the pipe, then remove
+        the file handler."""
+        if self.fd is not None:
+            self.tk.deletefilehandler(self.fd)
+            self.read(float("inf"))
+            self.fd = None
+        return True
@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import pstats
+import shutil
+import argparse
+import tempfile
+import subprocess as sp
+from math import sqrt
+from statistics import mean, stdev
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import fileDigest
+
+"""
+Jinpeng Zhai
+Profiles a target several times over instead of once, so that a hot spot can
+be told apart from the jitter of a single run. The runs are independent
+`python -m cProfile` processes, run in parallel up to --jobs at a time.
+
+Their profiles are merged with pstats.Stats.add and divided by the number
+of runs into the --output file, which holds the average run, so that the
+times and calls gprof2dot and flameprof show are those of one run. Next to
+it, RUNS_SUFFIX keeps
+every function's time in every run, with the digest of the merged profile
+it belongs to, and REPORT_SUFFIX the table printed at the end: for each
+function, the mean of its tottime and cumtime over the runs with their
+standard deviation and 95% confidence interval, from Student's t
+distribution. A function missing from a run took no time in it.
+
+Runs in parallel compete for the processor, and so for --jobs 1 the times
+are the least disturbed, at the cost of waiting for each run in turn.
+"""
+
+RUNS_SUFFIX = "_runs.json"
+REPORT_SUFFIX = "_repeat.txt"
+LIMIT = 40  # functions in the report
+
+# two sided 95% critical values of Student's t by degrees of freedom, and
+# the normal one beyond the table
+T95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)  # fmt: skip
+Z95 = 1.960
+
+
+def tCritical(df):
+    if df < 1:
+        return float("nan")
+    return T95[df - 1] if df <= len(T95) else Z95
+
+
+def summarize(values):
+    """(mean, standard deviation, half width of the 95% interval)"""
+    m = mean(values)
+    if len(values) < 2:
+        return m, 0.0, float("nan")
+    s = stdev(values, m)
+    return m, s, tCritical(len(values) - 1) * s / sqrt(len(values))
+
+
+def profileOnce(run, target, module, arguments, outPath):
+    """run the target under cProfile, writing its profile to outPath.
+    Returns (run, exit code, wall time, output)."""
+    start = perf_counter()
+    result = sp.run(
+        [
+            sys.executable,
+            "-m",
+            "cProfile",
+            *("-o", outPath),
+            *(("-m",) if module else ()),
+            target,
+            *arguments,
+        ],
+        stdout=sp.PIPE,
+        stderr=sp.STDOUT,
+    )
+    return run, result.returncode, perf_counter() - start, result.stdout
+
+
+def meanStats(stats, runs):
+    """pstats stats divided by the number of runs they are the sum of"""
+    mean = {}
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        mean[func] = (
+            cc / runs,
+            nc / runs,
+            tt / runs,
+            ct / runs,
+            {
+                caller: (
+                    tuple(value / runs for value in edge)
+                    if isinstance(edge, tuple)
+                    else edge / runs  # the profile module only counts calls
+                )
+                for caller, edge in callers.items()
+            },
+        )
+    return mean
+
+
+def perRun(paths):
+    """{function: {"tottime": [...], "cumtime": [...]}} over the profiles
+    at paths, with a function that did not run in one taking no time"""
+    functions = {}
+    none = [0.0] * len(paths)
+    for run, path in enumerate(paths):
+        stats = pstats.Stats(path).stats
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            times = functions.setdefault(
+                pstats.func_std_string(func),
+                {"tottime": list(none), "cumtime": list(none)},
+            )
+            times["tottime"][run] = tt
+            times["cumtime"][run] = ct
+    return functions
+
+
+def report(functions, runs, sortBy="cumtime", limit=LIMIT):
+    rows = []
+    for name, times in functions.items():
+        rows.append(
+            (name, summarize(times["tottime"]), summarize(times["cumtime"]))
+        )
+    rows.sort(key=lambda row: -row[2 if sortBy == "cumtime" else 1][0])
+
+    lines = [
+        "{:d} runs, mean over runs in ms, +- the half width of the 95% "
+        "confidence interval".format(runs),
+        "{:>10} {:>9} {:>9} {:>10} {:>9} {:>9} {:>6}  function".format(
+            "tottime", "+-", "stdev", "cumtime", "+-", "stdev", "+-%"
+        ),
+    ]
+    for name, (tm, ts, th), (cm, cs, ch) in rows[:limit]:
+        lines.append(
+            "{:>10.3f} {:>9.3f} {:>9.3f} {:>10.3f} {:>9.3f} {:>9.3f} "
+            "{:>6.1f}  {:}".format(
+                1000 * tm,
+                1000 * th,
+                1000 * ts,
+                1000 * cm,
+                1000 * ch,
+                1000 * cs,
+                100 * ch / cm if cm else 0.0,
+                name,
+            )
+        )
+    return "\n".join(lines)
+
+
+def repeat(
+    target,
+    arguments,
+    outPath,
+    runs,
+    jobs=None,
+    module=False,
+    sortBy="cumtime",
+    limit=LIMIT,
+):
+    """profile target runs times and merge the profiles into outPath.
+    Returns the report."""
+    scratch = tempfile.mkdtemp(prefix="repeat_")
+    try:
+        paths = [
+            os.path.join(scratch, "{:d}.pstats".format(run))
+            for run in range(runs)
+        ]
+        with ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+            results = pool.map(
+                lambda run: profileOnce(
+                    run, target, module, arguments, paths[run]
+                ),
+                range(runs),
+            )
+            for run, code, wallTime, output in results:
+                print(
+                    "run {:d} exited with {:d} after {:.2f} s".format(
+                        run, code, wallTime
+                    ),
+                    flush=True,
+                )
+                if code != 0:
+                    sys.stdout.write(output.decode(errors="replace"))
+                    raise RuntimeError(
+                        "run {:d} of the target failed".format(run)
+                    )
+
+        if os.path.dirname(outPath):
+            os.makedirs(os.path.dirname(outPath), exist_ok=True)
+        merged = pstats.Stats(paths[0])
+        merged.add(*paths[1:])
+        merged.stats = meanStats(merged.stats, runs)
+        merged.dump_stats(outPath)
+        functions = perRun(paths)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    stem = os.path.splitext(outPath)[0]
+    with open(stem + RUNS_SUFFIX, "wt") as file:
+        json.dump(
+            {
+                "runs": runs,
+                "digest": fileDigest(outPath),
+                "functions": functions,
+            },
+            file,
+        )
+    text = report(functions, runs, sortBy, limit)
+    with open(stem + REPORT_SUFFIX, "wt", encoding="utf-8") as file:
+        file.write(text + "\n")
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="profile a target several times, merge the profiles and "
+        "report the spread of each function's times"
+    )
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="runs at a time, by default one per cpu"
+    )
+    parser.add_argument("-o", "--output", required=True, help=".pstats file")
+    parser.add_argument(
+        "-s", "--sort", choices=("cumtime", "tottime"), default="cumtime"
+    )
+    parser.add_argument("--limit", type=int, default=LIMIT)
+    parser.add_argument("-m", "--module", action="store_true")
+    parser.add_argument("target")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    opts = parser.parse_args(argv)
+    if opts.runs < 1:
+        sys.exit("--runs must be at least 1")
+
+    try:
+        print(
+            repeat(
+                opts.target,
+                opts.arguments,
+                opts.output,
+                opts.runs,
+                opts.jobs,
+                opts.module,
+                opts.sort,
+                opts.limit,
+            )
+        )
+    except RuntimeError as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main()
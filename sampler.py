@@ -0,0 +1,146 @@
+import os
+import signal
+from array import array
+
+from ignorefilter import IgnoreFilter
+
+"""
+Jinpeng Zhai
+Statistical line profiler for runs too long to trace. An interval timer
+interrupts the target every so often, and the signal handler notes the file
+and line being run, optionally along with those of its callers, in a buffer
+allocated up front. Every line is otherwise left to run at full speed.
+
+The counts are samples rather than executions, in the same
+{(filename, lineno): count} form that trace and monitor.py produce, so they
+are written and reported on the same way: see monitor.py --sample. As the
+two do not add up, samples are kept in a count file of their own, marked by
+SAMPLE_SUFFIX before its extension, e.g. main.samples.counts next to
+main.counts.
+
+Time spent in ignored modules, e.g. the standard library, is put down to the
+nearest caller that is not ignored, so that the lines of the target that led
+there are the ones that show up hot.
+
+Needs signal.setitimer, so not on Windows. Only the main thread is sampled.
+"""
+
+INTERVAL = 0.001  # seconds between samples
+CAPACITY = 1 << 16  # entries held before they are added to the counts
+SAMPLE_SUFFIX = ".samples"
+CLOCKS = (
+    {
+        # cpu time of the process, or time on the wall, which includes waiting
+        "cpu": (signal.ITIMER_PROF, signal.SIGPROF),
+        "wall": (signal.ITIMER_REAL, signal.SIGALRM),
+    }
+    if hasattr(signal, "setitimer")
+    else {}
+)
+
+
+def isSamples(path):
+    return os.path.splitext(path)[0].endswith(SAMPLE_SUFFIX)
+
+
+def samplesPath(path):
+    """the count file for the samples of a run counted into path"""
+    if isSamples(path):
+        return path
+    stem, ext = os.path.splitext(path)
+    return stem + SAMPLE_SUFFIX + ext
+
+
+def countsPath(path):
+    """the count file for the executions of a run sampled into path"""
+    if not isSamples(path):
+        return path
+    stem, ext = os.path.splitext(path)
+    return stem[: -len(SAMPLE_SUFFIX)] + ext
+
+
+class Sampler:
+    def __init__(
+        self,
+        ignoreModules=(),
+        ignoreDirs=(),
+        interval=INTERVAL,
+        stack=False,
+        clock="cpu",
+        exclude=(),
+    ):
+        if clock not in CLOCKS:
+            raise ValueError(
+                "sampling on the {:} clock is not supported here".format(clock)
+            )
+        self.ignore = IgnoreFilter(ignoreModules, ignoreDirs)
+        # files of the tool itself, e.g. the one running the target
+        self.exclude = {__file__, *exclude}
+        self.interval = interval
+        self.stack = stack
+        self.timer, self.signal = CLOCKS[clock]
+
+        self.counts = {}  # (filename, lineno) -> samples
+        self.samples = 0
+        self.filenames = []  # file id -> filename
+        self.fileIds = {}  # code -> file id
+        self.files = array("I", bytes(4 * CAPACITY))
+        self.lines = array("I", bytes(4 * CAPACITY))
+        self.used = 0
+        self.previous = None
+
+    def start(self):
+        self.previous = signal.signal(self.signal, self.onSample)
+        signal.setitimer(self.timer, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(self.timer, 0)
+        signal.signal(self.signal, self.previous or signal.SIG_DFL)
+        self.flush()
+
+    def fileId(self, code):
+        fileId = self.fileIds.get(code)
+        if fileId is None:
+            fileId = self.fileIds[code] = len(self.filenames)
+            self.filenames.append(code.co_filename)
+        return fileId
+
+    def onSample(self, signum, frame):
+        self.samples += 1
+        # the handler's own frame is not passed in, so frame is the target's
+        seen = set() if self.stack else None
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename not in self.exclude and self.ignore.traced(
+                code, frame.f_globals.get("__file__")
+            ):
+                entry = (self.fileId(code), frame.f_lineno or 0)
+                if seen is None:
+                    self.record(*entry)
+                    return
+                if entry not in seen:  # recursion counts once per sample
+                    seen.add(entry)
+                    self.record(*entry)
+            frame = frame.f_back
+
+    def record(self, fileId, lineno):
+        if self.used == CAPACITY:
+            self.flush()
+        self.files[self.used] = fileId
+        self.lines[self.used] = lineno
+        self.used += 1
+
+    def flush(self):
+        """add the buffered samples to the counts"""
+        counts, filenames = self.counts, self.filenames
+        for fileId, lineno in zip(
+            self.files[: self.used], self.lines[: self.used]
+        ):
+            key = (filenames[fileId], lineno)
+            counts[key] = counts.get(key, 0) + 1
+        self.used = 0
+
+    def stats(self):
+        return "sampler: {:d} samples at {:g} ms, {:d} lines hit".format(
+            self.samples, 1000 * self.interval, len(self.counts)
+        )
@@ -0,0 +1,129 @@
+import queue
+import subprocess as sp
+import threading
+from platform import system
+
+import psutil
+
+from readers import ThreadReader, FileHandlerReader, canHandleFiles
+from jobs import Scheduler
+
+"""
+Jinpeng Zhai
+Owner of the interactive shell behind a GUI console: the shell process, the
+readers that move its output into outQueue/errQueue, and the pipes between
+them, as well as the Scheduler running the GUI's jobs. stop() tears all of
+these down and waits for them, so that resetting the console any number of
+times does not leave threads or pipes behind.
+"""
+
+STOP_TIMEOUT = 2.0  # seconds to wait for the shell and each reader to exit
+
+
+class Supervisor:
+    def __init__(self, widget=None, notify=None, report=None):
+        """widget, if given and capable, is used to read the pipes from the Tk
+        event loop, in which case notify() is called whenever output arrives.
+        report() is called with a summary line whenever a job starts or ends.
+        """
+        self.widget = widget
+        self.notify = notify
+
+        # make queues for keeping stdout and stderr whilst it is transferred between threads
+        self.outQueue = queue.Queue()
+        self.errQueue = queue.Queue()
+
+        self.p = None
+        self.readers = ()
+        self.polling = True  # whether the queues need to be polled
+
+        self.jobs = Scheduler(
+            self.outQueue, self.errQueue, widget, notify, report
+        )
+
+    def start(self):
+        self.p = sp.Popen(
+            [
+                "cmd" if system() == "Windows" else "bash"
+            ],  # simple identification of the running system,
+            stdout=sp.PIPE,
+            stdin=sp.PIPE,
+            stderr=sp.PIPE,
+        )
+
+        pipes = ((self.p.stdout, self.outQueue), (self.p.stderr, self.errQueue))
+        if self.widget is not None and canHandleFiles(self.widget):
+            self.polling = False
+            self.readers = tuple(
+                FileHandlerReader(pipe, q, self.notify, self.widget)
+                for pipe, q in pipes
+            )
+        else:
+            self.polling = True
+            self.readers = tuple(ThreadReader(pipe, q) for pipe, q in pipes)
+
+    def write(self, string):
+        self.p.stdin.write(string.encode())
+        self.p.stdin.flush()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """kill the shell and everything it started, then reap it, join the
+        readers and close the pipes. Returns whether everything stopped within
+        the timeout."""
+        self.jobs.stop()
+
+        if self.p is None:
+            return True
+
+        # file handlers are dropped first, as the descriptors they watch are
+        # about to be closed and may be reused by the next shell.
+        for reader in self.readers:
+            if isinstance(reader, FileHandlerReader):
+                reader.stop()
+
+        # use psutil (a cross platform tool) to recursively kill the children
+        # to ensure a clean exit.
+        try:
+            process = psutil.Process(self.p.pid)
+            for childProcess in process.children(recursive=True):
+                childProcess.kill()
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+        stopped = True
+        try:
+            self.p.wait(
+                timeout
+            )  # reap the shell, so it does not linger as a zombie
+        except sp.TimeoutExpired:
+            stopped = False
+
+        # with the shell gone the thread readers see EOF and return.
+        for reader in self.readers:
+            stopped = reader.stop(timeout) and stopped
+
+        for pipe in (self.p.stdin, self.p.stdout, self.p.stderr):
+            try:
+                pipe.close()
+            except OSError:  # e.g. flushing stdin into a dead shell
+                pass
+
+        for q in (self.outQueue, self.errQueue):
+            while not q.empty():
+                q.get()
+
+        self.p = None
+        self.readers = ()
+
+        return stopped
+
+    def stats(self):
+        """resources held by this (GUI) process, to make leaks measurable"""
+        me = psutil.Process()
+        return {
+            "threads": threading.active_count(),
+            "fds": me.num_handles() if system() == "Windows" else me.num_fds(),
+            "children": len(me.children(recursive=True)),
+            "jobs": len(self.jobs.jobs),
+        }
@@ -0,0 +1,77 @@
+import threading
+from time import perf_counter, strftime, localtime
+
+"""
+Jinpeng Zhai
+In-process replacement for piping a job through tee. The readers hand every
+chunk they move to the console to a TeeWriter as well, which appends it to the
+save file behind a header naming its stream and the time it was read:
+
+    @stdout 0.001234 65536
+    <65536 bytes of output>
+
+The time is in seconds since the file was opened, and the header line starts
+at the beginning of a line, so that the file still reads as a log. readTee()
+walks the chunks back out, and untee() recovers the output of one stream.
+"""
+
+TEE_BUFFER = 1024 * 1024  # bytes buffered before the save file is written to
+
+
+class TeeWriter:
+    def __init__(self, path, name=None, bufferSize=TEE_BUFFER):
+        self.path = path
+        self.file = open(path, "wb", buffering=bufferSize)
+        # both readers of a job write here, possibly from their own threads
+        self.lock = threading.Lock()
+        self.startTime = perf_counter()
+        self.atLineStart = True
+
+        self.file.write(
+            "# tee of {:} started {:}\n".format(
+                name or path, strftime("%Y-%m-%d %H:%M:%S", localtime())
+            ).encode()
+        )
+
+    def write(self, stream, data):
+        header = "@{:} {:.6f} {:d}\n".format(
+            stream, perf_counter() - self.startTime, len(data)
+        ).encode()
+        with self.lock:
+            if not self.atLineStart:
+                header = b"\n" + header
+            self.file.write(header)
+            self.file.write(data)
+            self.atLineStart = data[-1:] == b"\n"
+
+    def channel(self, stream):
+        """callable writing the chunks it is given as coming from stream"""
+        return lambda data: self.write(stream, data)
+
+    def close(self):
+        with self.lock:
+            if not self.atLineStart:
+                self.file.write(b"\n")
+            self.file.close()
+
+
+def readTee(path):
+    """yield (stream, seconds, data) for every chunk in a file written by
+    TeeWriter"""
+    with open(path, "rb") as file:
+        file.readline()  # the banner
+        while True:
+            header = file.readline()
+            if not header:
+                break
+            if header == b"\n":  # separator before a header, see write()
+                continue
+            stream, seconds, size = header[1:].decode().split()
+            yield stream, float(seconds), file.read(int(size))
+
+
+def untee(path, stream="stdout"):
+    """the output of stream as it would have been saved by an external tee"""
+    return b"".join(
+        data for chunkStream, _, data in readTee(path) if chunkStream == stream
+    )
@@ -2,7 +2,6 @@ import tkinter as tk
 import tkinter.ttk as ttk
 import tkinter.filedialog as tkfiledialog
 import tkinter.messagebox as tkmessagebox
-import subprocess as sp
 from time import strftime, localtime
 
 """
@@ -12,18 +11,35 @@ Main script to analyze a Python file, using a tk-GUI for interactivity.
 """
 import sys
 import os
-import queue
+import signal
 import traceback
-from threading import Thread
 from platform import system
 
-import psutil
-
-
-BUNDLED_TEE_DIR = "tee-win32/tee-x64.exe"
-
-
-class Trace(tk.Frame):
+from console import Console
+from supervisor import Supervisor
+from jobs import Job, python, DONE
+from countstore import STORE_EXTENSION, isStore
+from sampler import countsPath, samplesPath
+from eventlog import EVENT_EXTENSION
+
+MONITOR_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "monitor.py"
+)
+HEATMAP_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "heatmap.py"
+)
+COUNTSTORE_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "countstore.py"
+)
+MERGE_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "mergecounts.py"
+)
+EVENTLOG_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "eventlog.py"
+)
+
+
+class Trace(tk.Frame, Console):
     def __init__(self, parent):
         # use this instead of super() due to multiple inheritance
         ttk.Frame.__init__(self, parent)
@@ -112,9 +128,38 @@ class Trace(tk.Frame):
             modifierFrame, text="--timing", variable=self.arg_g
         ).grid(row=0, column=3, sticky="nsew", padx=2, pady=2)
 
+        # counting through sys.monitoring, see monitor.py
+        self.arg_monitor = tk.IntVar(value=int(hasattr(sys, "monitoring")))
+        ttk.Checkbutton(
+            modifierFrame, text="sys.monitoring", variable=self.arg_monitor
+        ).grid(row=1, column=0, sticky="nsew", padx=2, pady=2)
+
+        self.arg_coverage = tk.IntVar()
+        ttk.Checkbutton(
+            modifierFrame, text="--coverage-only", variable=self.arg_coverage
+        ).grid(row=1, column=1, sticky="nsew", padx=2, pady=2)
+
+        # sampling instead of tracing, for long runs, see sampler.py
+        self.arg_sample = tk.IntVar()
+        ttk.Checkbutton(
+            modifierFrame, text="--sample", variable=self.arg_sample
+        ).grid(row=1, column=2, sticky="nsew", padx=2, pady=2)
+
+        # time per line next to the counts, see monitor.py
+        self.arg_linetime = tk.IntVar()
+        ttk.Checkbutton(
+            modifierFrame, text="--line-time", variable=self.arg_linetime
+        ).grid(row=1, column=3, sticky="nsew", padx=2, pady=2)
+
+        # counting in the processes the target starts, see childtrace.py
+        self.arg_children = tk.IntVar()
+        ttk.Checkbutton(
+            modifierFrame, text="--children", variable=self.arg_children
+        ).grid(row=2, column=0, sticky="nsew", padx=2, pady=2)
+
         strargsFrm = ttk.Frame(modifierFrame)
         strargsFrm.grid(
-            row=1, column=0, columnspan=4, sticky="nsew", padx=2, pady=2
+            row=3, column=0, columnspan=4, sticky="nsew", padx=2, pady=2
         )
 
         strargsFrm.columnconfigure(1, weight=1)
@@ -236,6 +281,16 @@ class Trace(tk.Frame):
             command=lambda: self.trace(tee=True),
         ).grid(row=1, column=1, sticky="nsew", padx=2, pady=2)
 
+        ttk.Button(
+            operationFrame, text="Load Older Output", command=self.loadOlder
+        ).grid(row=2, column=0, sticky="nsew", padx=2, pady=2)
+        ttk.Button(
+            operationFrame, text="Render Heatmap", command=self.renderHeatmap
+        ).grid(row=2, column=1, sticky="nsew", padx=2, pady=2)
+        ttk.Button(
+            operationFrame, text="Merge Count Files", command=self.mergeCounts
+        ).grid(row=3, column=0, columnspan=2, sticky="nsew", padx=2, pady=2)
+
         for var in (
             self.arg_c,
             self.arg_t,
@@ -248,20 +303,22 @@ class Trace(tk.Frame):
             self.arg_s,
             self.arg_R,
             self.arg_g,
+            self.arg_monitor,
+            self.arg_coverage,
+            self.arg_sample,
+            self.arg_linetime,
+            self.arg_children,
         ):
             var.trace_add("write", self.consistency)
 
-        # make queues for keeping stdout and stderr whilst it is transferred between threads
-        self.outQueue = queue.Queue()
-        self.errQueue = queue.Queue()
+        # owns the shell behind the console, its readers and their queues
+        self.supervisor = Supervisor(self, self.wakeWriteLoop, self.writeInfo)
 
-        # keep track of where any line that is submitted starts
-        self.line_start = 0
+        # make sure the user does not edit past the starting point.
+        self.protectConsole()
 
         # make the enter key call the self.enter function
         self.ttyText.bind("<Return>", self.enter)
-        # and make sure the user does not delete past the starting point.
-        self.ttyText.bind("<KeyRelease>", self.postKey)
 
         self.startSubprocess()
         self.writeLoop()  # start the write loop in the main thread
@@ -291,7 +348,9 @@ class Trace(tk.Frame):
             )
 
             self.fargs.set(
-                os.path.normpath(os.path.join(self.Cargs.get(), name + ".file"))
+                os.path.normpath(
+                    os.path.join(self.Cargs.get(), name + STORE_EXTENSION)
+                )
             )
             self.navigateToFolder()
 
@@ -357,6 +416,30 @@ class Trace(tk.Frame):
         if not self.arg_t.get():  # --timing is only used for --trace
             self.arg_g.set(0)
 
+        # --coverage-only is a variant of --count for the monitoring backend
+        if not (self.arg_c.get() and self.arg_monitor.get()):
+            self.arg_coverage.set(0)
+
+        # --sample stands in for --count, and needs an interval timer
+        if self.arg_t.get() or not (
+            self.arg_c.get() and hasattr(signal, "setitimer")
+        ):
+            self.arg_sample.set(0)
+        if self.arg_sample.get():
+            self.arg_coverage.set(0)
+
+        # --line-time times every line of a --count through sys.monitoring
+        if not (self.arg_c.get() and self.arg_monitor.get()) or any(
+            v.get() for v in (self.arg_sample, self.arg_coverage, self.arg_t)
+        ):
+            self.arg_linetime.set(0)
+
+        # --children goes with plain counting through monitor.py
+        if not (self.arg_c.get() and self.arg_monitor.get()) or any(
+            v.get() for v in (self.arg_sample, self.arg_linetime, self.arg_t)
+        ):
+            self.arg_children.set(0)
+
         if self.arg_r.get():  # --report displays result from previous runs
             self.arg_c.set(0)
             self.arg_t.set(0)
@@ -380,124 +463,18 @@ class Trace(tk.Frame):
 
         self.endSubprocess()
 
-        # self.p.terminate()  # this, if the above didn't work, sends a Termination signal
-        # self.p.kill()  # and a kill signal. On windows this is the same.
-        # these methods are a lot more effective than sending "exit" and flushing
-
         # call the destroy methods to properly destroy widgets
+        self.releaseConsole()
         self.ttyText.destroy()
         tk.Frame.destroy(self)
 
-    def enter(self, e):
-        """The <Return> key press handler"""
-        self.postKey(None)
-        # ensure the Enter key, if pressed simultaneousely, effectively
-        # "interrupts" other entries by forcing the postKey to be called.
-        string = self.ttyText.get(1.0, tk.END)[self.line_start :]
-        self.line_start += len(string)
-        self.p.stdin.write(string.encode())
-        self.p.stdin.flush()
-
-    def postKey(self, e):
-        ttyNow, ttyNowTagDict = self.ttyNow
-        ttyNew = self.ttyText.get(1.0, tk.END)[: len(ttyNow)]
-        if ttyNew != ttyNow:
-            self.ttyText.edit_undo()
-            self.ttyText.edit_reset()
-
-            for tag, ranges in ttyNowTagDict.items():
-                for startIndex, endIndex in zip(ranges[::2], ranges[1::2]):
-                    self.ttyText.tag_add(tag, startIndex, endIndex)
-
-    def readFromProccessOut(self):
-        """To be executed in a separate thread to make read non-blocking"""
-        while self.alive:
-            data = self.p.stdout.raw.read(1024).decode()
-            self.outQueue.put(data)
-
-    def readFromProccessErr(self):
-        """To be executed in a separate thread to make read non-blocking"""
-        while self.alive:
-            data = self.p.stderr.raw.read(1024).decode()
-            self.errQueue.put(data)
-
-    def writeLoop(self):
-        """Used to write data from stdout and stderr to the Text widget"""
-        # if there is anything to write from stdout or stderr, then write it
-
-        if not self.errQueue.empty():
-            self.write(self.errQueue.get(), tag="stderr")
-        if not self.outQueue.empty():
-            out = self.outQueue.get()
-            self.write(out, tag="stdout")
-
-        # run this method again after 10ms
-        if self.alive:
-            self.after(10, self.writeLoop)
-
-    def clear(self):
-        self.line_start = 0
-        self.ttyText.delete(1.0, tk.END)
-
     def navigateToFolder(self):
         folderPath = os.path.dirname(self.pathVar.get())
 
-        self.p.stdin.write(
-            "cd {:}\n".format(folderPath).encode()
+        self.supervisor.write(
+            "cd {:}\n".format(folderPath)
         )  # This is also platform independent.
 
-        self.p.stdin.flush()
-
-    def write(self, string, tag=None):
-        self.ttyText.insert(tk.END, string, tag)
-        self.ttyText.see(tk.END)
-        self.ttyText.mark_set(tk.INSERT, tk.END)
-
-        self.line_start += len(string)
-
-        self.ttyText.edit_reset()
-
-        self.ttyNow = (
-            self.ttyText.get(1.0, tk.END)[: self.line_start],
-            {tag: self.ttyText.tag_ranges(tag) for tag in ("stdout", "stderr")},
-        )
-
-    def startSubprocess(self):
-        # open a subprocess to this script.
-        self.p = sp.Popen(
-            [
-                "cmd" if system() == "Windows" else "bash"
-            ],  # simple identification of the running system,
-            stdout=sp.PIPE,
-            stdin=sp.PIPE,
-            stderr=sp.PIPE,
-        )
-
-        # a daemon to keep track of the threads so they can stop running
-        self.alive = True
-        # start the functions that get stdout and stderr in separate threads
-        Thread(target=self.readFromProccessOut).start()
-        Thread(target=self.readFromProccessErr).start()
-
-    def endSubprocess(self):
-        self.alive = False
-
-        # use psutil (a cross platform tool) to recursively kill the children
-        # to ensure a clean exit.
-        process = psutil.Process(self.p.pid)
-        for childProcess in process.children(recursive=True):
-            childProcess.kill()
-        process.kill()
-
-        while not self.errQueue.empty():
-            self.errQueue.get()
-        while not self.outQueue.empty():
-            self.outQueue.get()
-
-        # the original way of ending subprocesses.
-        self.p.terminate()
-        self.p.kill()
-
     def restart(self):
         self.endSubprocess()
         self.clear()
@@ -517,41 +494,69 @@ class Trace(tk.Frame):
         if needFilearg and self.fargs.get() == ".":
             name = os.path.splitext(os.path.basename(self.pathVar.get()))[0]
             filePath = os.path.normpath(
-                os.path.join(self.Cargs.get(), name + ".file")
+                os.path.join(self.Cargs.get(), name + STORE_EXTENSION)
             )
             self.fargs.set(filePath)
 
-        options = " ".join(
-            (
-                arg
-                for arg in (
-                    ("-c" if self.arg_c.get() else None),
-                    ("-t" if self.arg_t.get() else None),
-                    ("-l" if self.arg_l.get() else None),
-                    ("-r" if self.arg_r.get() else None),
-                    ("-T" if self.arg_T.get() else None),
-                    ('-f "' + self.fargs.get() + '"' if needFilearg else None),
-                    (
-                        '-C "' + self.Cargs.get() + '"'
-                    ),  # coverage report dir is always supplied
-                    ("-m" if self.arg_m.get() else None),
-                    ("-s" if self.arg_s.get() else None),
-                    ("-R" if self.arg_R.get() else None),
-                    ("-g" if self.arg_g.get() else None),
-                    (
-                        '--ignore-module="' + self.ignored_module.get() + '"'
-                        if self.ignored_module.get()
-                        else None
-                    ),
-                    (
-                        '--ignore-dir="' + self.ignored_dir.get() + '"'
-                        if self.ignored_dir.get()
-                        else None
-                    ),
+        # monitor.py counts, reports and traces to an event log, anything
+        # else is left to trace. Its reports only rewrite the .cover files
+        # whose inputs changed.
+        useMonitor = (
+            (self.arg_monitor.get() or self.arg_sample.get())
+            and (self.arg_c.get() or self.arg_r.get() or self.arg_t.get())
+            and not any(var.get() for var in (self.arg_l, self.arg_T))
+        )
+        eventLog = None
+        if useMonitor and self.arg_t.get():
+            eventLog = os.path.join(
+                self.Cargs.get(),
+                os.path.splitext(fileName)[0] + EVENT_EXTENSION,
+            )
+
+        # samples are not executions, and are kept in a file of their own
+        if needFilearg and self.arg_c.get():
+            self.fargs.set(
+                (samplesPath if self.arg_sample.get() else countsPath)(
+                    self.fargs.get()
                 )
-                if arg is not None
             )
-        )
+        countFile = self.fargs.get()
+        # trace only reads and writes its own pickle, so it is handed an
+        # export of a count store, which is imported back after counting.
+        pickled = needFilearg and not useMonitor and isStore(countFile)
+        if pickled:
+            traceFile = os.path.splitext(countFile)[0] + ".file"
+        else:
+            traceFile = countFile
+
+        options = [
+            arg
+            for arg in (
+                ("-c" if self.arg_c.get() else None),
+                ("-t" if self.arg_t.get() else None),
+                ("-l" if self.arg_l.get() else None),
+                ("-r" if self.arg_r.get() else None),
+                ("-T" if self.arg_T.get() else None),
+                *(("-f", traceFile) if needFilearg else ()),
+                # the coverage report dir is always supplied
+                *("-C", self.Cargs.get()),
+                ("-m" if self.arg_m.get() else None),
+                ("-s" if self.arg_s.get() else None),
+                ("-R" if self.arg_R.get() else None),
+                ("-g" if self.arg_g.get() else None),
+                (
+                    "--ignore-module=" + self.ignored_module.get()
+                    if self.ignored_module.get()
+                    else None
+                ),
+                (
+                    "--ignore-dir=" + self.ignored_dir.get()
+                    if self.ignored_dir.get()
+                    else None
+                ),
+            )
+            if arg is not None
+        ]
 
         if tee:
             teePath = (
@@ -559,31 +564,120 @@ class Trace(tk.Frame):
                 + strftime("_%Y_%m_%d_%H_%M_%S", localtime())
                 + ".txt"
             )
-            teeCommand = " ".join(
-                (
-                    "|",
-                    (
-                        os.path.normpath(
-                            os.path.join(
-                                os.path.dirname(os.path.abspath(__file__)),
-                                BUNDLED_TEE_DIR,
-                            )
-                        )
-                        if system() == "Windows"
-                        else "tee"
-                    ),  # on Linux tee is a built in utility
-                    '"' + teePath + '"',
-                )
+        else:
+            teePath = None
+
+        if useMonitor:
+            args = python(
+                MONITOR_SCRIPT,
+                *options,
+                *(("--coverage-only",) if self.arg_coverage.get() else ()),
+                *(("--sample",) if self.arg_sample.get() else ()),
+                *(("--line-time",) if self.arg_linetime.get() else ()),
+                *(("--children",) if self.arg_children.get() else ()),
+                *(("--events", eventLog) if eventLog else ()),
+                fileName,
             )
         else:
-            teeCommand = ""
+            args = python("-m", "trace", *options, fileName)
+
+        jobs = []
+        if pickled:
+            jobs.append(
+                Job(
+                    "export counts",
+                    python(COUNTSTORE_SCRIPT, "export", countFile, traceFile),
+                )
+            )
+        jobs.append(
+            Job(
+                "trace",
+                args,
+                after=jobs[-1:],
+                cwd=os.path.dirname(self.pathVar.get()),
+                tee=teePath,
+            )
+        )
+        if pickled and self.arg_c.get():
+            jobs.append(
+                Job(
+                    "import counts",
+                    python(COUNTSTORE_SCRIPT, "import", traceFile, countFile),
+                    after=jobs[-1:],
+                )
+            )
+        if eventLog:
+            # the first page, see eventlog.py for paging through the rest
+            jobs.append(
+                Job(
+                    "view events",
+                    python(EVENTLOG_SCRIPT, eventLog),
+                    after=jobs[-1:],
+                )
+            )
 
-        traceCommand = " ".join(
-            ["python -m trace", options, fileName, teeCommand, "\n"]
+        self.supervisor.jobs.submit(*jobs)
+
+    def mergeCounts(self):
+        filePaths = tkfiledialog.askopenfilenames(
+            title="Select Count Files to Merge",
+            filetypes=(
+                ("Count File", "*" + STORE_EXTENSION),
+                ("Trace Pickle", "*.file"),
+                ("File", "*.*"),
+            ),
+            initialdir=self.Cargs.get(),
         )
+        if not filePaths:
+            tkmessagebox.showinfo("Exception:", "No File Selected")
+            return
+
+        countFile = self.fargs.get()
+        if countFile == ".":
+            tkmessagebox.showinfo("Exception:", "No --file to merge into")
+            return
+
+        # what is in the count file already is kept, as another run.
+        inputs = [os.path.normpath(p) for p in filePaths]
+        if os.path.isfile(countFile) and countFile not in inputs:
+            inputs.append(countFile)
 
-        self.p.stdin.write(traceCommand.encode())
-        self.p.stdin.flush()
+        self.supervisor.jobs.submit(
+            Job("merge", python(MERGE_SCRIPT, "-o", countFile, *inputs))
+        )
+
+    def renderHeatmap(self):
+        countFile = self.fargs.get()
+        if not os.path.isfile(countFile):
+            tkmessagebox.showinfo(
+                "Exception:",
+                "No count file at {:}, run --count first".format(countFile),
+            )
+            return
+
+        self.supervisor.jobs.submit(
+            Job(
+                "heatmap",
+                python(HEATMAP_SCRIPT, "-f", countFile, "-C", self.Cargs.get()),
+                # the counts of the traced script are relative to its folder
+                cwd=os.path.dirname(self.pathVar.get()),
+                onUpdate=self.openHeatmap,
+            )
+        )
+
+    def openHeatmap(self, job):
+        if job.status != DONE:
+            return
+        path = os.path.join(self.Cargs.get(), "index.html")
+        if system() == "Windows":
+            os.startfile(path)
+        else:
+            self.supervisor.jobs.submit(
+                Job(
+                    "open",
+                    ["open" if sys.platform == "darwin" else "xdg-open", path],
+                )
+            )
 
     def resetFile(self, path):
         if os.path.exists(path):